@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+临时邮箱命令性能基准
+在本地模拟服务器上运行 create --count / list / delete --batch / cleanup，
+按不同 zone 规模与并发数统计耗时、吞吐量与请求延迟 p50/p99，不会访问外网
+
+用法:
+  python benchmark.py
+  python benchmark.py --sizes 50,150 --concurrency 1,4,16 --latency 0.05
+  python benchmark.py --rate 10 --error-429 0.05 --json bench.json
+"""
+
+import os
+import sys
+import json
+import time
+import tempfile
+import argparse
+import threading
+import contextlib
+from typing import Dict, List
+
+# 设置环境变量以通过初始化检查（API 地址在启动模拟服务器后设置）
+os.environ.setdefault('CLOUDFLARE_API_TOKEN', 'bench_token')
+os.environ.setdefault('CLOUDFLARE_ZONE_ID', 'bench_zone')
+os.environ.setdefault('FORWARD_TO_EMAIL', 'bench@example.com')
+os.environ.setdefault('EMAIL_DOMAIN', 'example.com')
+
+import temp_email
+from mock_cloudflare_api import start_mock_server
+
+
+class TimingTransport(temp_email.PooledHTTPTransport):
+    """记录每个请求耗时的连接池"""
+
+    latencies: List[float] = []
+    lock = threading.Lock()
+
+    def request(self, method, url, headers, body=None):
+        started = time.perf_counter()
+        try:
+            return super().request(method, url, headers, body)
+        finally:
+            elapsed = time.perf_counter() - started
+            with TimingTransport.lock:
+                TimingTransport.latencies.append(elapsed)
+
+
+def percentile(values: List[float], p: float) -> float:
+    if not values:
+        return 0.0
+    values = sorted(values)
+    return values[min(len(values) - 1, int(round(p * (len(values) - 1))))]
+
+
+def run_command(argv: List[str]) -> Dict:
+    """在当前进程中执行一条子命令（丢弃输出），返回耗时与请求延迟统计"""
+    with TimingTransport.lock:
+        TimingTransport.latencies = []
+
+    started = time.perf_counter()
+    exit_code = 0
+    with open(os.devnull, 'w', encoding='utf-8') as devnull, contextlib.redirect_stdout(devnull):
+        try:
+            temp_email.main(argv)
+        except SystemExit as e:
+            exit_code = e.code or 0
+    elapsed = time.perf_counter() - started
+
+    latencies = TimingTransport.latencies
+    return {
+        "seconds": elapsed,
+        "requests": len(latencies),
+        "p50_ms": percentile(latencies, 0.50) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+        "exit_code": exit_code,
+    }
+
+
+def run_scenario(server, size: int, concurrency: int) -> List[Dict]:
+    """在 size 条规则的 zone 上依次执行 create / list / delete --batch / cleanup"""
+    server.api.reset()
+    c = str(concurrency)
+    half = size // 2
+    steps = [
+        ("create", size, ["create", "--prefix", "bn", "--start", "1", "--count", str(size), "--concurrency", c]),
+        ("list", size, ["list"]),
+        # 删除编号为偶数的一半
+        ("delete --batch", half, ["delete", "--batch", "bn*[02468]", "-y", "--concurrency", c]),
+        ("cleanup", size - half, ["cleanup", "-y", "--concurrency", c]),
+    ]
+
+    rows = []
+    for name, ops, argv in steps:
+        stats = run_command(argv)
+        stats.update({
+            "command": name,
+            "zone_size": size,
+            "concurrency": concurrency,
+            "ops": ops,
+            "ops_per_sec": ops / stats["seconds"] if stats["seconds"] else 0.0,
+        })
+        rows.append(stats)
+    return rows
+
+
+def print_report(rows: List[Dict]):
+    print(f"{'命令':<16} {'规模':>6} {'并发':>6} {'耗时(s)':>9} {'个/秒':>9} {'请求数':>7} {'p50(ms)':>9} {'p99(ms)':>9} {'退出码':>6}")
+    print("-" * 96)
+    for row in rows:
+        print(
+            f"{row['command']:<16} {row['zone_size']:>6} {row['concurrency']:>6} "
+            f"{row['seconds']:>9.3f} {row['ops_per_sec']:>9.1f} {row['requests']:>7} "
+            f"{row['p50_ms']:>9.1f} {row['p99_ms']:>9.1f} {row['exit_code']:>6}"
+        )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="临时邮箱命令性能基准（基于本地模拟服务器）")
+    parser.add_argument('--sizes', default='50,150', help='zone 规则数量，逗号分隔（不超过配额 200）')
+    parser.add_argument('--concurrency', default='1,4,16', help='并发数，逗号分隔')
+    parser.add_argument('--latency', type=float, default=0.03, help='模拟服务器每个请求的延迟（秒）')
+    parser.add_argument('--jitter', type=float, default=0.01, help='模拟服务器额外随机延迟上限（秒）')
+    parser.add_argument('--error-429', type=float, default=0.0, help='注入 429 的概率')
+    parser.add_argument('--error-5xx', type=float, default=0.0, help='注入 503 的概率')
+    parser.add_argument('--rate', type=float, default=0, help='客户端限速 req/s（默认 0 不限速）')
+    parser.add_argument('--json', help='把结果以 JSON 写入该文件')
+    args = parser.parse_args(argv)
+
+    server = start_mock_server(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_429=args.error_429,
+        error_5xx=args.error_5xx,
+        retry_after=0,
+        # 设置了 CLOUDFLARE_ACCOUNT_ID 时，转发目标预检需要看到已验证的地址
+        verified_addresses=[os.environ['FORWARD_TO_EMAIL']]
+    )
+    # 运行结束后恢复环境变量与传输层，不影响同一进程中的其他代码（如测试）
+    overrides = {
+        'CLOUDFLARE_API_BASE_URL': server.url,
+        'CLOUDFLARE_RATE_LIMIT': str(args.rate),
+        'CLOUDFLARE_MAX_RATE': str(args.rate),
+    }
+    saved_env = {key: os.environ.get(key) for key in overrides}
+    saved_transport = temp_email.PooledHTTPTransport
+    os.environ.update(overrides)
+    temp_email.PooledHTTPTransport = TimingTransport
+
+    rows = []
+    cwd = os.getcwd()
+    try:
+        with tempfile.TemporaryDirectory() as workdir:
+            # 历史记录与规则快照写在临时目录中
+            os.chdir(workdir)
+            for size in [int(x) for x in args.sizes.split(',')]:
+                for concurrency in [int(x) for x in args.concurrency.split(',')]:
+                    rows.extend(run_scenario(server, size, concurrency))
+            os.chdir(cwd)
+    finally:
+        os.chdir(cwd)
+        temp_email.PooledHTTPTransport = saved_transport
+        for key, value in saved_env.items():
+            if value is None:
+                os.environ.pop(key, None)
+            else:
+                os.environ[key] = value
+        server.shutdown()
+        server.server_close()
+
+    print_report(rows)
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(rows, f, indent=2, ensure_ascii=False)
+        print(f"\n🗂 结果已写入: {args.json}")
+    return 1 if any(row["exit_code"] for row in rows) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
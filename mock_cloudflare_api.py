@@ -0,0 +1,299 @@
+#!/usr/bin/env python3
+"""
+Cloudflare Email Routing API 本地模拟服务器
+实现路由规则相关端点，用于离线测试与性能基准，不会访问外网
+
+支持：
+- 规则的创建 / 分页列出（result_info）/ 查询 / 更新 / 删除
+- catch-all 规则、目标地址列表
+- 每个 zone 单独保存规则，各自 200 条规则配额、重复地址校验
+- 可配置的响应延迟，按比例注入 429（带 Retry-After）与 5xx 错误
+- gzip 压缩响应
+
+用法:
+  python mock_cloudflare_api.py --port 8787 --latency 0.05 --error-429 0.02
+  export CLOUDFLARE_API_BASE_URL=http://127.0.0.1:8787/client/v4
+"""
+
+import re
+import sys
+import json
+import gzip
+import time
+import uuid
+import random
+import argparse
+import threading
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+RULES_PATH = re.compile(r"^/client/v4/zones/([^/]+)/email/routing/rules(?:/([^/]+))?$")
+ADDRESSES_PATH = re.compile(r"^/client/v4/accounts/([^/]+)/email/routing/addresses$")
+
+
+class MockCloudflareAPI:
+    """模拟服务器的状态与行为配置（线程安全）"""
+
+    def __init__(
+        self,
+        latency: float = 0.0,
+        jitter: float = 0.0,
+        error_429: float = 0.0,
+        error_5xx: float = 0.0,
+        retry_after: int = 1,
+        quota: int = 200,
+        verified_addresses: Optional[List[str]] = None
+    ):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_429 = error_429
+        self.error_5xx = error_5xx
+        self.retry_after = retry_after
+        self.quota = quota
+        self.verified_addresses = verified_addresses or []
+        self.zones: Dict[str, List[Dict]] = {}
+        self.catch_all: Dict = {
+            "tag": uuid.uuid4().hex,
+            "name": "Catch-all",
+            "enabled": False,
+            "matchers": [{"type": "all"}],
+            "actions": [{"type": "drop"}],
+        }
+        self.request_count = 0
+        self.lock = threading.Lock()
+
+    def reset(self):
+        """清空所有规则与计数"""
+        with self.lock:
+            self.zones = {}
+            self.request_count = 0
+
+    @property
+    def rules(self) -> List[Dict]:
+        """所有 zone 的规则（只读视图）"""
+        return [rule for rules in self.zones.values() for rule in rules]
+
+    @staticmethod
+    def _now() -> str:
+        return datetime.now(timezone.utc).strftime("%Y-%m-%dT%H:%M:%S.%fZ")
+
+    @staticmethod
+    def _rule_email(rule: Dict) -> Optional[str]:
+        for matcher in rule.get("matchers", []):
+            if matcher.get("field") == "to":
+                return matcher.get("value")
+        return None
+
+    @staticmethod
+    def _find(rules: List[Dict], rule_id: str) -> Optional[Dict]:
+        for rule in rules:
+            if rule["tag"] == rule_id:
+                return rule
+        return None
+
+    def handle(self, method: str, path: str, body: Optional[Dict]) -> Tuple[int, Dict, Dict[str, str]]:
+        """处理一个请求，返回 (状态码, 响应体, 额外响应头)"""
+        with self.lock:
+            self.request_count += 1
+
+        if self.latency or self.jitter:
+            time.sleep(self.latency + random.uniform(0, self.jitter))
+
+        roll = random.random()
+        if roll < self.error_429:
+            return 429, _error(971, "Please wait and consider throttling your request speed"), {
+                "Retry-After": str(self.retry_after)
+            }
+        if roll < self.error_429 + self.error_5xx:
+            return 503, _error(10000, "Service temporarily unavailable"), {}
+
+        parts = urlsplit(path)
+        query = parse_qs(parts.query)
+
+        match = ADDRESSES_PATH.match(parts.path)
+        if match and method == "GET":
+            result = [
+                {"id": uuid.uuid5(uuid.NAMESPACE_DNS, email).hex, "email": email, "verified": "2024-01-01T00:00:00Z"}
+                for email in self.verified_addresses
+            ]
+            return 200, _paged(result, 1, max(len(result), 1)), {}
+
+        match = RULES_PATH.match(parts.path)
+        if not match:
+            return 404, _error(7003, "Could not route to path"), {}
+        rule_id = match.group(2)
+
+        with self.lock:
+            rules = self.zones.setdefault(match.group(1), [])
+            if rule_id == "catch_all":
+                if method == "PUT":
+                    self.catch_all.update({k: v for k, v in (body or {}).items() if k in ("name", "enabled", "matchers", "actions")})
+                return 200, _success(self.catch_all), {}
+
+            if rule_id is None and method == "GET":
+                page = max(1, int(query.get("page", ["1"])[0]))
+                per_page = min(50, max(5, int(query.get("per_page", ["20"])[0])))
+                return 200, _paged(rules[(page - 1) * per_page:page * per_page], page, per_page, len(rules)), {}
+
+            if rule_id is None and method == "POST":
+                email = self._rule_email(body or {})
+                if not email or not (body or {}).get("actions"):
+                    return 400, _error(1001, "matchers and actions are required"), {}
+                if len(rules) >= self.quota:
+                    return 400, _error(2020, f"Rule limit reached ({self.quota})"), {}
+                if any(self._rule_email(rule) == email for rule in rules):
+                    return 400, _error(2019, f"Rule for {email} already exists"), {}
+                tag = uuid.uuid4().hex
+                now = self._now()
+                rule = {
+                    "id": tag,
+                    "tag": tag,
+                    "name": body.get("name", ""),
+                    "enabled": body.get("enabled", True),
+                    "priority": body.get("priority", 0),
+                    "matchers": body["matchers"],
+                    "actions": body["actions"],
+                    "created": now,
+                    "modified": now,
+                }
+                rules.append(rule)
+                return 200, _success(rule), {}
+
+            rule = self._find(rules, rule_id) if rule_id else None
+            if rule is None:
+                return 404, _error(2000, "Rule not found"), {}
+
+            if method == "GET":
+                return 200, _success(rule), {}
+            if method == "PUT":
+                for key in ("name", "enabled", "priority", "matchers", "actions"):
+                    if key in (body or {}):
+                        rule[key] = body[key]
+                rule["modified"] = self._now()
+                return 200, _success(rule), {}
+            if method == "DELETE":
+                rules.remove(rule)
+                return 200, _success({"id": rule_id, "tag": rule_id}), {}
+
+        return 405, _error(10405, "Method not allowed"), {}
+
+
+def _success(result) -> Dict:
+    return {"success": True, "errors": [], "messages": [], "result": result}
+
+
+def _error(code: int, message: str) -> Dict:
+    return {"success": False, "errors": [{"code": code, "message": message}], "messages": [], "result": None}
+
+
+def _paged(result: List, page: int, per_page: int, total: Optional[int] = None) -> Dict:
+    total = len(result) if total is None else total
+    response = _success(result)
+    response["result_info"] = {
+        "page": page,
+        "per_page": per_page,
+        "count": len(result),
+        "total_count": total,
+        "total_pages": -(-total // per_page),
+    }
+    return response
+
+
+class MockRequestHandler(BaseHTTPRequestHandler):
+    """把 HTTP 请求转交给 server.api 处理"""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+
+    def _dispatch(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+        try:
+            body = json.loads(raw) if raw else None
+        except ValueError:
+            body = None
+
+        if not (self.headers.get("Authorization") or "").startswith("Bearer "):
+            status, payload, extra = 401, _error(10000, "Authentication error"), {}
+        else:
+            status, payload, extra = self.server.api.handle(self.command, self.path, body)
+
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        if "gzip" in (self.headers.get("Accept-Encoding") or ""):
+            data = gzip.compress(data)
+            self.send_header("Content-Encoding", "gzip")
+        for name, value in extra.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_POST = do_PUT = do_DELETE = _dispatch
+
+    def log_message(self, *args):
+        pass
+
+
+class MockServer(ThreadingHTTPServer):
+    """线程化的模拟服务器，api 属性保存状态"""
+
+    daemon_threads = True
+    # 并发建立大量连接时避免默认 backlog (5) 造成 SYN 重传
+    request_queue_size = 128
+
+    def __init__(self, address: Tuple[str, int], api: MockCloudflareAPI):
+        super().__init__(address, MockRequestHandler)
+        self.api = api
+
+    @property
+    def url(self) -> str:
+        """供 CLOUDFLARE_API_BASE_URL 使用的地址"""
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}/client/v4"
+
+
+def start_mock_server(port: int = 0, **options) -> MockServer:
+    """在后台线程启动模拟服务器（port=0 时随机分配端口）"""
+    server = MockServer(("127.0.0.1", port), MockCloudflareAPI(**options))
+    threading.Thread(target=server.serve_forever, kwargs={"poll_interval": 0.05}, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Cloudflare Email Routing API 本地模拟服务器")
+    parser.add_argument('--port', type=int, default=8787, help='监听端口（默认 8787）')
+    parser.add_argument('--latency', type=float, default=0.0, help='每个请求的固定延迟（秒）')
+    parser.add_argument('--jitter', type=float, default=0.0, help='额外的随机延迟上限（秒）')
+    parser.add_argument('--error-429', type=float, default=0.0, help='返回 429 的概率（0-1）')
+    parser.add_argument('--error-5xx', type=float, default=0.0, help='返回 503 的概率（0-1）')
+    parser.add_argument('--retry-after', type=int, default=1, help='429 响应的 Retry-After 秒数')
+    parser.add_argument('--quota', type=int, default=200, help='规则数量上限（默认 200）')
+    parser.add_argument('--verified', action='append', default=[], help='已验证的目标地址（可重复）')
+    args = parser.parse_args()
+
+    server = MockServer(("127.0.0.1", args.port), MockCloudflareAPI(
+        latency=args.latency,
+        jitter=args.jitter,
+        error_429=args.error_429,
+        error_5xx=args.error_5xx,
+        retry_after=args.retry_after,
+        quota=args.quota,
+        verified_addresses=args.verified
+    ))
+    print(f"🧪 模拟服务器已启动: {server.url}")
+    print(f"   export CLOUDFLARE_API_BASE_URL={server.url}")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -6,229 +6,2865 @@ Cloudflare 临时邮箱自动生成脚本
 
 import os
 import sys
+import ssl
+import asyncio
 import json
 import random
+import secrets
 import string
 import argparse
 import fnmatch
+import csv
+import gzip
+import time
+import atexit
+import re
+import bisect
+import threading
+import cProfile
+import pstats
+import signal
+import subprocess
+import tempfile
+import contextlib
+import socketserver
+import http.client
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from collections import deque
+from concurrent.futures import Future, ThreadPoolExecutor, as_completed
+from email.utils import parsedate_to_datetime
 from datetime import datetime, timedelta
-from typing import Dict, List, Optional
-import urllib.request
-import urllib.error
+from typing import Callable, Dict, Generator, Iterable, Iterator, List, Optional, Tuple
+import urllib.parse
 
+if os.name == 'nt':
+    import msvcrt
+else:
+    import fcntl
 
-class CloudflareEmailManager:
+
+class CloudflareAPIError(Exception):
+    """Cloudflare API 调用失败（HTTP 错误、网络异常或 success=false）"""
+
+    def __init__(self, message: str, status: Optional[int] = None):
+        super().__init__(message)
+        self.status = status
+
+
+class HTTPTransport:
+    """HTTP 传输层接口
+
+    request() 返回 (状态码, 原因短语, 响应头, 响应体字节)，响应头的键为小写，
+    HTTP 错误状态不抛异常，由调用方决定如何处理。
+    响应体已解压；响应头中的 content-length 为解压前实际传输的字节数。
+    测试时可替换为指向本地模拟服务器的实现。
+    """
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        headers: Dict[str, str],
+        body: Optional[bytes] = None
+    ) -> Tuple[int, str, Dict[str, str], bytes]:
+        raise NotImplementedError
+
+    def close(self):
+        """释放底层连接"""
+
+
+class PooledHTTPTransport(HTTPTransport):
+    """基于 http.client 的持久连接池
+    - 按 (scheme, host, port) 复用 keep-alive 连接，省去重复的 TCP + TLS 握手
+    - 线程安全，空闲连接数上限为 pool_size
+    - 自动请求并解码 gzip 响应
+    """
+
+    def __init__(self, pool_size: int = 8, timeout: float = 30):
+        self.pool_size = pool_size
+        self.timeout = timeout
+        self._idle: Dict[Tuple[str, str, int], List[http.client.HTTPConnection]] = {}
+        self._lock = threading.Lock()
+
+    def _acquire(self, key: Tuple[str, str, int]) -> Tuple[http.client.HTTPConnection, bool]:
+        """取出一个空闲连接，没有则新建；第二个返回值表示是否为复用连接"""
+        with self._lock:
+            idle = self._idle.get(key)
+            if idle:
+                return idle.pop(), True
+
+        scheme, host, port = key
+        if scheme == "https":
+            return http.client.HTTPSConnection(host, port, timeout=self.timeout), False
+        return http.client.HTTPConnection(host, port, timeout=self.timeout), False
+
+    def _release(self, key: Tuple[str, str, int], conn: http.client.HTTPConnection):
+        """归还连接，超出上限时直接关闭"""
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.pool_size:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def request(
+        self,
+        method: str,
+        url: str,
+        headers: Dict[str, str],
+        body: Optional[bytes] = None
+    ) -> Tuple[int, str, Dict[str, str], bytes]:
+        parts = urllib.parse.urlsplit(url)
+        scheme = parts.scheme or "https"
+        key = (scheme, parts.hostname, parts.port or (443 if scheme == "https" else 80))
+        path = parts.path or "/"
+        if parts.query:
+            path = f"{path}?{parts.query}"
+
+        headers = dict(headers)
+        headers.setdefault("Accept-Encoding", "gzip")
+
+        # 复用的连接可能已被服务端关闭，此时换一个新连接重试一次
+        while True:
+            conn, reused = self._acquire(key)
+            try:
+                conn.request(method, path, body=body, headers=headers)
+                response = conn.getresponse()
+                data = response.read()
+            except ConnectionError:
+                conn.close()
+                if reused:
+                    continue
+                raise
+            except Exception:
+                conn.close()
+                raise
+            break
+
+        if response.will_close:
+            conn.close()
+        else:
+            self._release(key, conn)
+
+        response_headers = {k.lower(): v for k, v in response.getheaders()}
+        # chunked 响应没有 Content-Length，补上解压前的字节数供指标统计
+        response_headers["content-length"] = str(len(data))
+        if response_headers.get("content-encoding", "").lower() == "gzip":
+            data = gzip.decompress(data)
+
+        return response.status, response.reason, response_headers, data
+
+    def close(self):
+        with self._lock:
+            idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for conn in conns:
+                conn.close()
+
+
+class AsyncHTTPTransport:
+    """异步 HTTP 传输层接口，返回值与 HTTPTransport.request() 相同"""
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        headers: Dict[str, str],
+        body: Optional[bytes] = None
+    ) -> Tuple[int, str, Dict[str, str], bytes]:
+        raise NotImplementedError
+
+    async def close(self):
+        """释放底层连接"""
+
+
+class AsyncPooledHTTPTransport(AsyncHTTPTransport):
+    """基于 asyncio 流的 HTTP/1.1 持久连接池（仅标准库）
+    - 按 (scheme, host, port) 复用 keep-alive 连接，同时在途的请求数不超过 max_connections
+    - 支持 Content-Length / chunked 响应与 gzip 解码
+    - 必须在同一个事件循环中使用
+    """
+
+    def __init__(self, max_connections: int = 32, timeout: float = 30):
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self._idle: Dict[Tuple[str, str, int], List[Tuple[asyncio.StreamReader, asyncio.StreamWriter]]] = {}
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        self._ssl_context: Optional[ssl.SSLContext] = None
+
+    async def _open(self, key: Tuple[str, str, int]) -> Tuple[asyncio.StreamReader, asyncio.StreamWriter]:
+        scheme, host, port = key
+        if scheme == "https":
+            if self._ssl_context is None:
+                self._ssl_context = ssl.create_default_context()
+            connecting = asyncio.open_connection(host, port, ssl=self._ssl_context)
+        else:
+            connecting = asyncio.open_connection(host, port)
+        # 建立连接（含 TLS 握手）同样受超时限制
+        return await asyncio.wait_for(connecting, self.timeout)
+
+    @staticmethod
+    async def _close(writer: asyncio.StreamWriter):
+        """关闭连接并等待底层传输释放"""
+        writer.close()
+        with contextlib.suppress(Exception):
+            await writer.wait_closed()
+
+    @staticmethod
+    async def _read_response(reader: asyncio.StreamReader) -> Tuple[int, str, Dict[str, str], bytes, bool]:
+        """读取一个完整响应，最后一个返回值表示连接能否复用"""
+        status_line = await reader.readline()
+        if not status_line:
+            raise ConnectionResetError("连接已被服务端关闭")
+        version, _, rest = status_line.decode('latin-1').strip().partition(" ")
+        status_str, _, reason = rest.partition(" ")
+        status = int(status_str)
+
+        response_headers: Dict[str, str] = {}
+        while True:
+            line = await reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            name, _, value = line.decode('latin-1').partition(":")
+            response_headers[name.strip().lower()] = value.strip()
+
+        keep_alive = version == "HTTP/1.1" and response_headers.get("connection", "").lower() != "close"
+        if response_headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await reader.readline()).split(b";")[0].strip(), 16)
+                if size == 0:
+                    # 跳过 trailer
+                    while (await reader.readline()) not in (b"\r\n", b"\n", b""):
+                        pass
+                    break
+                chunks.append(await reader.readexactly(size))
+                await reader.readexactly(2)
+            data = b"".join(chunks)
+        elif "content-length" in response_headers:
+            data = await reader.readexactly(int(response_headers["content-length"]))
+        else:
+            data = await reader.read()
+            keep_alive = False
+
+        response_headers["content-length"] = str(len(data))
+        if response_headers.get("content-encoding", "").lower() == "gzip":
+            data = gzip.decompress(data)
+        return status, reason, response_headers, data, keep_alive
+
+    async def request(
+        self,
+        method: str,
+        url: str,
+        headers: Dict[str, str],
+        body: Optional[bytes] = None
+    ) -> Tuple[int, str, Dict[str, str], bytes]:
+        parts = urllib.parse.urlsplit(url)
+        scheme = parts.scheme or "https"
+        key = (scheme, parts.hostname, parts.port or (443 if scheme == "https" else 80))
+        path = parts.path or "/"
+        if parts.query:
+            path = f"{path}?{parts.query}"
+
+        default_port = 443 if scheme == "https" else 80
+        host_header = parts.hostname if key[2] == default_port else f"{parts.hostname}:{key[2]}"
+        lines = [f"{method} {path} HTTP/1.1", f"Host: {host_header}", "Accept-Encoding: gzip"]
+        lines.extend(f"{name}: {value}" for name, value in headers.items())
+        lines.append(f"Content-Length: {len(body or b'')}")
+        payload = ("\r\n".join(lines) + "\r\n\r\n").encode('latin-1') + (body or b"")
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_connections)
+
+        async with self._semaphore:
+            # 复用的连接可能已被服务端关闭，此时换一个新连接重试一次
+            while True:
+                idle = self._idle.get(key)
+                reused = bool(idle)
+                reader, writer = idle.pop() if idle else await self._open(key)
+                try:
+                    writer.write(payload)
+                    await writer.drain()
+                    status, reason, response_headers, data, keep_alive = await asyncio.wait_for(
+                        self._read_response(reader), self.timeout
+                    )
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    await self._close(writer)
+                    if reused:
+                        continue
+                    raise
+                except BaseException:
+                    writer.close()
+                    raise
+                break
+
+        if keep_alive:
+            self._idle.setdefault(key, []).append((reader, writer))
+        else:
+            await self._close(writer)
+        return status, reason, response_headers, data
+
+    async def close(self):
+        idle, self._idle = self._idle, {}
+        for conns in idle.values():
+            for _, writer in conns:
+                await self._close(writer)
+
+
+class AdaptiveRateLimiter:
+    """自适应令牌桶限速器（线程安全）
+
+    - acquire() 按当前速率发放令牌，没有令牌时阻塞等待
+    - 成功响应加性提速（每秒约 +increase req/s），直到 max_rate
+    - 收到 429 时速率减半（不低于 min_rate），并按 Retry-After 暂停所有请求
+    - rate <= 0 表示不限速
+    - 指定 shared 时，取得本进程令牌后还要向跨进程共享预算预约时隙，
+      429 的 Retry-After 暂停也会同步给同一台机器上的其他进程
+    """
+
+    def __init__(
+        self,
+        rate: float = 5.0,
+        max_rate: float = 10.0,
+        min_rate: float = 0.5,
+        burst: float = 2.0,
+        increase: float = 0.5,
+        shared: Optional["SharedRateBudget"] = None
+    ):
+        self.rate = rate
+        self.shared = shared
+        self.max_rate = max(max_rate, rate)
+        self.min_rate = min(min_rate, rate) if rate > 0 else min_rate
+        self.burst = burst
+        self.increase = increase
+        self._tokens = burst
+        self._last = time.monotonic()
+        self._paused_until = 0.0
+        self._lock = threading.Lock()
+
+    def _try_acquire(self) -> float:
+        """尝试取一个令牌，成功返回 0，否则返回建议等待的秒数"""
+        if self.rate <= 0:
+            return 0.0
+        with self._lock:
+            now = time.monotonic()
+            if now < self._paused_until:
+                return self._paused_until - now
+            self._tokens = min(self.burst, self._tokens + (now - self._last) * self.rate)
+            self._last = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return 0.0
+            return (1 - self._tokens) / self.rate
+
+    def acquire(self):
+        """获取一个令牌（阻塞当前线程）"""
+        while True:
+            wait = self._try_acquire()
+            if wait <= 0:
+                break
+            time.sleep(wait)
+        if self.shared is not None:
+            wait = self.shared.reserve()
+            if wait > 0:
+                time.sleep(wait)
+
+    async def acquire_async(self):
+        """获取一个令牌（只挂起当前协程）"""
+        while True:
+            wait = self._try_acquire()
+            if wait <= 0:
+                break
+            await asyncio.sleep(wait)
+        if self.shared is not None:
+            # reserve() 需要等待文件锁（其他进程可能正持有），放到线程池中执行，不阻塞事件循环
+            wait = await asyncio.get_running_loop().run_in_executor(None, self.shared.reserve)
+            if wait > 0:
+                await asyncio.sleep(wait)
+
+    def on_success(self):
+        """加性增：每个成功请求提速 increase / rate"""
+        if self.rate <= 0:
+            return
+        with self._lock:
+            self.rate = min(self.max_rate, self.rate + self.increase / self.rate)
+
+    def on_throttle(self, retry_after: Optional[float] = None, share: bool = True):
+        """乘性减：速率减半，清空令牌，并在 retry_after 秒内暂停发放
+
+        share=False 时不同步给共享预算（异步调用方改用 pause_shared_async）
+        """
+        if share and self.shared is not None and retry_after:
+            self.shared.pause(retry_after)
+        if self.rate <= 0:
+            return
+        with self._lock:
+            self.rate = max(self.min_rate, self.rate / 2)
+            self._tokens = 0.0
+            self._last = time.monotonic()
+            if retry_after:
+                self._paused_until = max(self._paused_until, self._last + retry_after)
+
+    async def pause_shared_async(self, retry_after: Optional[float]):
+        """把 Retry-After 暂停同步给共享预算（与 reserve 一样放到线程池中执行，不阻塞事件循环）"""
+        if self.shared is not None and retry_after:
+            await asyncio.get_running_loop().run_in_executor(None, self.shared.pause, retry_after)
+
+
+def parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """解析 Retry-After 响应头（秒数或 HTTP 日期），无法解析时返回 None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        retry_at = parsedate_to_datetime(value)
+        return max(0.0, retry_at.timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RequestMetrics:
+    """进程内的请求指标（线程安全）
+
+    按 "方法 端点模板" 统计请求数、状态码、延迟直方图、重试次数、收发字节数，
+    以及分页获取的页数；可输出摘要表、JSON 或 Prometheus textfile 格式
+    """
+
+    # 延迟直方图的桶上限（秒）
+    BUCKETS = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.started = time.time()
+        self.endpoints: Dict[str, Dict] = {}
+        self.pages_fetched = 0
+
+    @staticmethod
+    def endpoint_label(method: str, endpoint: str) -> str:
+        """把具体请求归一为端点模板，如 DELETE /zones/{zone_id}/email/routing/rules/{rule_id}"""
+        path = endpoint.split("?", 1)[0]
+        path = re.sub(r"^/zones/[^/]+", "/zones/{zone_id}", path)
+        path = re.sub(r"^/accounts/[^/]+", "/accounts/{account_id}", path)
+        path = re.sub(r"/rules/(?!catch_all$)[^/]+$", "/rules/{rule_id}", path)
+        path = re.sub(r"/addresses/[^/]+$", "/addresses/{address_id}", path)
+        return f"{method} {path}"
+
+    def _endpoint(self, label: str) -> Dict:
+        stats = self.endpoints.get(label)
+        if stats is None:
+            stats = self.endpoints[label] = {
+                "requests": 0,
+                "errors": 0,
+                "retries": 0,
+                "status": {},
+                "latency_sum": 0.0,
+                "latency_max": 0.0,
+                "buckets": [0] * (len(self.BUCKETS) + 1),
+                "bytes_sent": 0,
+                "bytes_received": 0,
+            }
+        return stats
+
+    def record(
+        self,
+        label: str,
+        status: Optional[int],
+        latency: float,
+        bytes_sent: int = 0,
+        bytes_received: int = 0
+    ):
+        """记录一次请求（status 为 None 表示网络异常）"""
+        with self._lock:
+            stats = self._endpoint(label)
+            stats["requests"] += 1
+            key = str(status) if status is not None else "error"
+            stats["status"][key] = stats["status"].get(key, 0) + 1
+            if status is None or status >= 400:
+                stats["errors"] += 1
+            stats["latency_sum"] += latency
+            stats["latency_max"] = max(stats["latency_max"], latency)
+            for i, bound in enumerate(self.BUCKETS):
+                if latency <= bound:
+                    stats["buckets"][i] += 1
+                    break
+            else:
+                stats["buckets"][-1] += 1
+            stats["bytes_sent"] += bytes_sent
+            stats["bytes_received"] += bytes_received
+
+    def record_retry(self, label: str):
+        with self._lock:
+            self._endpoint(label)["retries"] += 1
+
+    def record_page(self):
+        with self._lock:
+            self.pages_fetched += 1
+
+    def snapshot(self) -> Dict:
+        """当前指标的 JSON 可序列化副本"""
+        with self._lock:
+            return {
+                "started": self.started,
+                "elapsed": time.time() - self.started,
+                "pages_fetched": self.pages_fetched,
+                "buckets": list(self.BUCKETS),
+                "endpoints": json.loads(json.dumps(self.endpoints)),
+            }
+
+    def print_summary(self, file=None):
+        """打印摘要表，可据此判断时间花在 API、分页还是本地处理上"""
+        file = file or sys.stderr
+        data = self.snapshot()
+        endpoints = data["endpoints"]
+        api_time = sum(stats["latency_sum"] for stats in endpoints.values())
+
+        print(f"\n📊 请求统计", file=file)
+        print(f"{'端点':<58} {'请求':>6} {'错误':>5} {'重试':>5} {'平均ms':>8} {'最大ms':>8} {'收KB':>8}", file=file)
+        print("-" * 104, file=file)
+        for label, stats in sorted(endpoints.items()):
+            avg = stats["latency_sum"] / stats["requests"] * 1000 if stats["requests"] else 0
+            print(
+                f"{label:<58} {stats['requests']:>6} {stats['errors']:>5} {stats['retries']:>5} "
+                f"{avg:>8.1f} {stats['latency_max'] * 1000:>8.1f} {stats['bytes_received'] / 1024:>8.1f}",
+                file=file
+            )
+        print("-" * 104, file=file)
+        print(f"⏱  总耗时 {data['elapsed']:.2f}s | API 请求累计 {api_time:.2f}s | 分页获取 {data['pages_fetched']} 页", file=file)
+
+    def to_prometheus(self) -> str:
+        """Prometheus textfile collector 格式"""
+        data = self.snapshot()
+        prefix = "cf_temp_email"
+        lines = [
+            f"# TYPE {prefix}_requests_total counter",
+            f"# TYPE {prefix}_retries_total counter",
+            f"# TYPE {prefix}_request_bytes_total counter",
+            f"# TYPE {prefix}_response_bytes_total counter",
+            f"# TYPE {prefix}_request_duration_seconds histogram",
+        ]
+        for label, stats in sorted(data["endpoints"].items()):
+            method, path = label.split(" ", 1)
+            tags = f'method="{method}",endpoint="{path}"'
+            for status, count in sorted(stats["status"].items()):
+                lines.append(f'{prefix}_requests_total{{{tags},status="{status}"}} {count}')
+            lines.append(f"{prefix}_retries_total{{{tags}}} {stats['retries']}")
+            lines.append(f"{prefix}_request_bytes_total{{{tags}}} {stats['bytes_sent']}")
+            lines.append(f"{prefix}_response_bytes_total{{{tags}}} {stats['bytes_received']}")
+            cumulative = 0
+            for bound, count in zip(self.BUCKETS, stats["buckets"]):
+                cumulative += count
+                lines.append(f'{prefix}_request_duration_seconds_bucket{{{tags},le="{bound}"}} {cumulative}')
+            lines.append(f'{prefix}_request_duration_seconds_bucket{{{tags},le="+Inf"}} {stats["requests"]}')
+            lines.append(f"{prefix}_request_duration_seconds_sum{{{tags}}} {stats['latency_sum']:.6f}")
+            lines.append(f"{prefix}_request_duration_seconds_count{{{tags}}} {stats['requests']}")
+        lines.append(f"# TYPE {prefix}_pages_fetched_total counter")
+        lines.append(f"{prefix}_pages_fetched_total {data['pages_fetched']}")
+        lines.append(f"# TYPE {prefix}_run_duration_seconds gauge")
+        lines.append(f"{prefix}_run_duration_seconds {data['elapsed']:.6f}")
+        return "\n".join(lines) + "\n"
+
+    def dump(self, path: str):
+        """写出指标文件：.prom 为 Prometheus textfile 格式，其余为 JSON（原子替换）"""
+        if path.endswith(".prom"):
+            content = self.to_prometheus()
+        else:
+            content = json.dumps(self.snapshot(), indent=2, ensure_ascii=False)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        os.replace(tmp_path, path)
+
+
+# 进程内共享的请求指标，所有管理器默认记录到这里
+METRICS = RequestMetrics()
+
+
+class FileLock:
+    """跨进程互斥锁，锁定 path + '.lock' 旁路文件（Windows 使用 msvcrt，其余使用 fcntl）"""
+
+    def __init__(self, path: str):
+        self.lock_path = f"{path}.lock"
+        self._file = None
+
+    def __enter__(self):
+        self._file = open(self.lock_path, 'a+')
+        if os.name == 'nt':
+            self._file.seek(0)
+            while True:
+                try:
+                    msvcrt.locking(self._file.fileno(), msvcrt.LK_LOCK, 1)
+                    break
+                except OSError:
+                    # LK_LOCK 重试约 10 秒后仍失败会抛出 OSError，继续等待
+                    continue
+        else:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        if os.name == 'nt':
+            self._file.seek(0)
+            msvcrt.locking(self._file.fileno(), msvcrt.LK_UNLCK, 1)
+        else:
+            fcntl.flock(self._file.fileno(), fcntl.LOCK_UN)
+        self._file.close()
+        self._file = None
+
+
+class SharedRateBudget:
+    """同一台机器上所有 temp_email.py 进程共享的请求预算（跨进程令牌桶）
+
+    状态文件只保存下一个空闲时隙的时间戳（墙上时间，各进程可比较）。
+    reserve() 在文件锁内预约一个时隙并立即释放锁，调用方在锁外等待：
+    - 总吞吐不超过 rate req/s，空闲时最多允许 burst 个请求连发
+    - 时隙按预约先后分配，多个进程排在同一个队列里，不会有进程被饿死
+    - pause() 把空闲时隙推后，让所有进程一起遵守 Retry-After
+    """
+
+    DEFAULT_PATH = os.path.join(tempfile.gettempdir(), "temp_email_rate_budget.json")
+
+    def __init__(self, rate: float, burst: float = 2.0, path: Optional[str] = None):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.path = path or os.getenv("CLOUDFLARE_RATE_BUDGET_FILE") or self.DEFAULT_PATH
+
+    @classmethod
+    def from_env(cls) -> Optional["SharedRateBudget"]:
+        """按 CLOUDFLARE_SHARED_RATE 创建共享预算，未设置或 <= 0 时返回 None"""
+        rate = float(os.getenv("CLOUDFLARE_SHARED_RATE") or 0)
+        return cls(rate) if rate > 0 else None
+
+    def _read(self) -> Dict[str, float]:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            # 文件不存在或损坏时从空闲状态开始
+            return {}
+
+    def _update(self, func: Callable[[float, float], float]) -> Tuple[float, float]:
+        """在文件锁内用 func(当前时间, 原空闲时隙) 计算新的空闲时隙并写回，返回 (当前时间, 新空闲时隙)"""
+        with FileLock(self.path):
+            state = self._read()
+            now = time.time()
+            state["next"] = func(now, float(state.get("next") or 0.0))
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(state, f)
+            os.replace(tmp_path, self.path)
+        return now, state["next"]
+
+    def reserve(self) -> float:
+        """预约下一个请求时隙，返回发送前需要等待的秒数"""
+        interval = 1.0 / self.rate
+        # 空闲期间积攒的额度不超过 burst 个
+        now, next_free = self._update(lambda now, next_free: max(next_free, now - (self.burst - 1) * interval) + interval)
+        return max(0.0, next_free - interval - now)
+
+    def pause(self, seconds: float):
+        """seconds 秒内不再发放时隙（所有共享该预算的进程）"""
+        self._update(lambda now, next_free: max(next_free, now + seconds))
+
+
+class RuleIndex:
+    """本地路由规则快照（邮箱 → 规则 ID、转发目标、启用状态、创建时间）
+
+    - 每次完整列出规则时整体刷新，本进程的创建/删除会同步更新
+    - 超过 ttl 秒视为过期，过期时由调用方回退到 API
+    - 从磁盘载入的快照可能缺少其他进程的修改，未命中时由调用方回退到 API；
+      本进程完整列出后的快照在有效期内未命中即不存在（见 is_authoritative）
+    - 修改先记在内存中，进程退出时在文件锁内与磁盘上的快照合并后写回；创建时 ttl <= 0 则不读写磁盘
+      （之后调大 ttl 只影响本进程内的新鲜度判断，如 serve / exec）
+    """
+
+    # 需要在进程退出时写回的实例（按快照文件分组，每个文件只注册一次 atexit）
+    _exit_flush: Dict[str, List["RuleIndex"]] = {}
+    _exit_lock = threading.Lock()
+
+    def __init__(self, path: str, zone_id: str, ttl: float):
+        # 转为绝对路径，进程退出写回时不受工作目录变化影响
+        self.path = os.path.abspath(path)
+        self.zone_id = zone_id
+        self.ttl = ttl
+        self.persist = ttl > 0
+        self._lock = threading.Lock()
+        self._entries: Dict[str, Dict] = {}
+        self._emails_by_tag: Dict[str, str] = {}
+        self._updated_at: Optional[float] = None
+        # 快照是否来自本进程的完整列出
+        self._listed = False
+        # 上次列出或写回之后本进程的创建/删除（邮箱 → 条目，删除为 None），写回时叠加到磁盘快照上
+        self._changes: Dict[str, Optional[Dict]] = {}
+        self._dirty = False
+        self._load()
+        if self.persist:
+            self._register_exit_flush()
+
+    def _register_exit_flush(self):
+        with RuleIndex._exit_lock:
+            indexes = RuleIndex._exit_flush.get(self.path)
+            if indexes is None:
+                indexes = RuleIndex._exit_flush[self.path] = []
+                atexit.register(RuleIndex._flush_at_exit, self.path)
+            indexes.append(self)
+
+    @staticmethod
+    def _flush_at_exit(path: str):
+        for index in RuleIndex._exit_flush.get(path, []):
+            index.flush()
+
+    @staticmethod
+    def rule_email(rule: Dict) -> Optional[str]:
+        """提取规则中 to 字段匹配的邮箱地址"""
+        for matcher in rule.get("matchers", []):
+            if matcher.get("field") == "to":
+                return matcher.get("value")
+        return None
+
+    @staticmethod
+    def summarize(rule: Dict) -> Dict:
+        """把完整规则压缩为快照条目"""
+        target = None
+        for action in rule.get("actions", []):
+            if action.get("type") == "forward" and action.get("value"):
+                target = action["value"][0]
+                break
+        return {
+            "tag": rule.get("tag"),
+            "target": target,
+            "enabled": rule.get("enabled", True),
+            "created": rule.get("created"),
+            "name": rule.get("name"),
+        }
+
+    @staticmethod
+    def to_rule(email: str, entry: Dict) -> Dict:
+        """把快照条目还原为与 API 返回结构一致的规则"""
+        return {
+            "id": entry["tag"],
+            "tag": entry["tag"],
+            "name": entry.get("name"),
+            "enabled": entry.get("enabled", True),
+            "created": entry.get("created"),
+            "matchers": [{"type": "literal", "field": "to", "value": email}],
+            "actions": [{"type": "forward", "value": [entry["target"]] if entry.get("target") else []}],
+        }
+
+    def _read(self) -> Optional[Dict]:
+        """读取磁盘上本 zone 的快照，不存在、损坏或属于其他 zone 时返回 None"""
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                snapshot = json.load(f)
+        except Exception:
+            # 快照损坏时视为没有快照
+            return None
+        if snapshot.get("zone_id") != self.zone_id or snapshot.get("updated_at") is None:
+            return None
+        return snapshot
+
+    def _load(self):
+        if not self.persist or not os.path.exists(self.path):
+            return
+        snapshot = self._read()
+        if snapshot is None:
+            return
+        self._entries = snapshot.get("rules", {})
+        self._emails_by_tag = {entry["tag"]: email for email, entry in self._entries.items()}
+        self._updated_at = snapshot["updated_at"]
+
+    def is_fresh(self) -> bool:
+        """快照是否存在且未过期"""
+        if self.ttl <= 0 or self._updated_at is None:
+            return False
+        return time.time() - self._updated_at < self.ttl
+
+    def is_authoritative(self) -> bool:
+        """快照未过期且由本进程完整列出：此时未命中即视为不存在，不必回退到 API"""
+        return self._listed and self.is_fresh()
+
+    def get(self, email: str) -> Optional[Dict]:
+        with self._lock:
+            return self._entries.get(email)
+
+    def emails(self) -> List[str]:
+        """快照中的全部邮箱地址"""
+        with self._lock:
+            return list(self._entries)
+
+    @classmethod
+    def collect(cls, entries: Dict[str, Dict], rule: Dict):
+        """把一条规则的快照条目加入 entries（用于边遍历边构建快照）"""
+        email = cls.rule_email(rule)
+        if email:
+            entries[email] = cls.summarize(rule)
+
+    def replace(self, rules: List[Dict]):
+        """用完整的规则列表刷新快照"""
+        entries: Dict[str, Dict] = {}
+        for rule in rules:
+            self.collect(entries, rule)
+        self.replace_entries(entries)
+
+    def replace_entries(self, entries: Dict[str, Dict]):
+        """用完整的快照条目刷新快照"""
+        with self._lock:
+            self._entries = entries
+            self._emails_by_tag = {entry["tag"]: email for email, entry in entries.items()}
+            self._updated_at = time.time()
+            self._listed = True
+            self._changes = {}
+            self._dirty = True
+
+    def add(self, rule: Dict):
+        email = self.rule_email(rule)
+        if not email:
+            return
+        with self._lock:
+            self._entries[email] = self._changes[email] = self.summarize(rule)
+            self._emails_by_tag[rule.get("tag")] = email
+            self._dirty = True
+
+    def remove_tag(self, tag: str):
+        with self._lock:
+            email = self._emails_by_tag.pop(tag, None)
+            if email is not None:
+                self._entries.pop(email, None)
+                self._changes[email] = None
+                self._dirty = True
+
+    def flush(self):
+        """把内存中的快照写回磁盘（文件锁内重新读取并合并，原子替换）
+
+        磁盘上的快照不比本进程的旧时（如其他进程在本进程载入后重新列出或写回过），
+        以磁盘快照为基础叠加本进程的创建/删除，多个进程先后写回不会丢失对方的修改
+        """
+        if not self.persist or not self._dirty:
+            return
+        try:
+            with FileLock(self.path):
+                disk = self._read()
+                with self._lock:
+                    if not self._dirty or self._updated_at is None:
+                        return
+                    if disk is not None and disk["updated_at"] >= self._updated_at:
+                        entries = dict(disk.get("rules", {}))
+                        for email, entry in self._changes.items():
+                            if entry is None:
+                                entries.pop(email, None)
+                            else:
+                                entries[email] = entry
+                        self._entries = entries
+                        self._emails_by_tag = {entry["tag"]: email for email, entry in entries.items()}
+                        self._updated_at = disk["updated_at"]
+                    snapshot = {
+                        "zone_id": self.zone_id,
+                        "updated_at": self._updated_at,
+                        "rules": dict(self._entries),
+                    }
+                    self._changes = {}
+                    self._dirty = False
+                tmp_path = f"{self.path}.{os.getpid()}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(snapshot, f, ensure_ascii=False)
+                os.replace(tmp_path, self.path)
+        except Exception:
+            # 静默失败，下次会回退到 API
+            pass
+
+
+class HistoryStore:
+    """追加写入的本地历史记录（JSONL，每行一条）
+
+    - add() 只写入内存缓冲，flush() 在文件锁内一次性追加，多个进程同时运行也安全
+    - 首次使用时自动把旧版 temp_emails.json 迁移进来
+    - iter_entries() 逐行读取并过滤，不会把整个文件载入内存
+    """
+
+    DEFAULT_PATH = "temp_emails.jsonl"
+    LEGACY_PATH = "temp_emails.json"
+
+    def __init__(self, path: str = DEFAULT_PATH, legacy_path: Optional[str] = LEGACY_PATH):
+        self.path = path
+        self.legacy_path = legacy_path
+        self._pending: List[Dict] = []
+        self._lock = threading.Lock()
+
+    def _migrate_legacy(self):
+        """把旧版 JSON 数组格式的历史追加到 JSONL，并将旧文件改名为 .migrated（需在文件锁内调用）"""
+        if not self.legacy_path or not os.path.exists(self.legacy_path):
+            return
+        try:
+            with open(self.legacy_path, 'r', encoding='utf-8') as f:
+                legacy = json.load(f)
+        except Exception:
+            return
+        with open(self.path, 'a', encoding='utf-8') as f:
+            for entry in legacy:
+                f.write(json.dumps(entry, ensure_ascii=False) + "\n")
+        os.replace(self.legacy_path, f"{self.legacy_path}.migrated")
+
+    def add(
+        self,
+        email: str,
+        rule_id: str,
+        description: str,
+        target: Optional[str] = None,
+        expires_at: Optional[datetime] = None
+    ):
+        """记录一条历史（调用 flush() 后才写入磁盘）"""
+        entry = {
+            "email": email,
+            "rule_id": rule_id,
+            "description": description,
+            "created_at": datetime.now().isoformat()
+        }
+        if target:
+            entry["target"] = target
+        if expires_at:
+            entry["expires_at"] = expires_at.isoformat(timespec='seconds')
+        with self._lock:
+            self._pending.append(entry)
+
+    def flush(self):
+        """把缓冲的记录一次性追加到文件"""
+        with self._lock:
+            pending, self._pending = self._pending, []
+        if not pending:
+            return
+        lines = "".join(json.dumps(entry, ensure_ascii=False) + "\n" for entry in pending)
+        with FileLock(self.path):
+            self._migrate_legacy()
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write(lines)
+
+    def iter_entries(
+        self,
+        prefix: Optional[str] = None,
+        target: Optional[str] = None,
+        since: Optional[str] = None,
+        until: Optional[str] = None
+    ) -> Iterator[Dict]:
+        """按条件逐条产出历史记录
+
+        prefix: 邮箱用户名前缀；target: 转发目标；
+        since/until: ISO 日期或时间（如 2025-10-01），按相同精度比较，两端都包含
+        """
+        if self.legacy_path and os.path.exists(self.legacy_path):
+            with FileLock(self.path):
+                self._migrate_legacy()
+        if not os.path.exists(self.path):
+            return
+
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    # 跳过被中断写入的残缺行
+                    continue
+
+                email = entry.get("email", "")
+                created_at = entry.get("created_at", "")
+                if prefix and not email.split('@')[0].startswith(prefix):
+                    continue
+                if target and entry.get("target") != target:
+                    continue
+                if since and created_at[:len(since)] < since:
+                    continue
+                if until and created_at[:len(until)] > until:
+                    continue
+                yield entry
+
+
+class AddressPool:
+    """预先创建好规则的地址池（ready 待租用，leased 已租出），状态保存在本地 JSON 文件中
+
+    - 每次读改写都在文件锁内完成，多个进程同时 lease 也不会拿到同一个地址
+    - lease/release 只修改本地状态，不发请求；创建与回收规则由调用方完成
+    - 按 zone 分别保存，切换 CLOUDFLARE_ZONE_ID 不会混用
+    """
+
+    DEFAULT_PATH = "temp_email_pool.json"
+    FILL_TIMEOUT = 300  # 补充标记超过该秒数仍未清除，视为补充进程已退出
+
+    def __init__(self, zone_id: str, path: Optional[str] = None):
+        self.path = os.path.abspath(path or os.getenv("ADDRESS_POOL_FILE", self.DEFAULT_PATH))
+        self.zone_id = zone_id
+
+    def _read(self) -> Dict:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception:
+            # 状态文件损坏时视为空池
+            return {}
+
+    @contextlib.contextmanager
+    def _transaction(self) -> Iterator[Dict]:
+        """在文件锁内读取本 zone 的状态，正常退出时原子写回"""
+        with FileLock(self.path):
+            data = self._read()
+            state = data.setdefault(self.zone_id, {})
+            state.setdefault("size", 0)
+            state.setdefault("prefix", None)
+            state.setdefault("ready", [])
+            state.setdefault("leased", {})
+            yield state
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=2)
+            os.replace(tmp_path, self.path)
+
+    def status(self) -> Dict:
+        with self._transaction() as state:
+            return json.loads(json.dumps(state))
+
+    def emails(self) -> set:
+        """池中全部地址（含已租出的），生成新地址时用于排除冲突"""
+        with self._transaction() as state:
+            return {entry["email"].lower() for entry in state["ready"]} | {email.lower() for email in state["leased"]}
+
+    def configure(self, size: Optional[int] = None, prefix: Optional[str] = None):
+        """更新目标容量与地址前缀（后台补充时沿用）"""
+        with self._transaction() as state:
+            if size is not None:
+                state["size"] = max(0, size)
+            if prefix is not None:
+                state["prefix"] = prefix or None
+
+    def retain(self, live_emails: set) -> List[Dict]:
+        """丢弃规则已不存在的待租用地址，返回被丢弃的条目"""
+        with self._transaction() as state:
+            dropped = [entry for entry in state["ready"] if entry["email"].lower() not in live_emails]
+            state["ready"] = [entry for entry in state["ready"] if entry["email"].lower() in live_emails]
+            return dropped
+
+    def add_ready(self, entry: Dict):
+        with self._transaction() as state:
+            state["ready"].append(entry)
+
+    def take_ready(self) -> List[Dict]:
+        """取出全部待租用地址（用于清空地址池）"""
+        with self._transaction() as state:
+            ready, state["ready"] = state["ready"], []
+            state["size"] = 0
+            return ready
+
+    def lease(self, target: str) -> Optional[Dict]:
+        """租出最早创建的一个地址；池为空时返回 None"""
+        with self._transaction() as state:
+            if not state["ready"]:
+                return None
+            entry = state["ready"].pop(0)
+            entry.update({"target": target, "leased_at": datetime.now().isoformat()})
+            state["leased"][entry["email"]] = entry
+            return dict(entry)
+
+    def release(self, email: str) -> Optional[Dict]:
+        """收回一个已租出的地址，返回其条目；不是从池中租出的返回 None"""
+        with self._transaction() as state:
+            for leased_email in list(state["leased"]):
+                if leased_email.lower() == email.lower():
+                    return state["leased"].pop(leased_email)
+            return None
+
+    def restore_lease(self, entry: Dict):
+        """回收失败时把条目放回已租出列表"""
+        with self._transaction() as state:
+            state["leased"][entry["email"]] = entry
+
+    def claim_fill(self, when_low: bool = True) -> bool:
+        """没有正在运行的补充时（when_low=True 时还要求低于目标容量），标记开始补充并返回 True"""
+        with self._transaction() as state:
+            filling_since = state.get("filling_since")
+            if when_low and len(state["ready"]) >= state["size"]:
+                return False
+            if filling_since and time.time() - filling_since < self.FILL_TIMEOUT:
+                return False
+            state["filling_since"] = time.time()
+            return True
+
+    def release_fill(self):
+        """补充结束，清除补充标记"""
+        with self._transaction() as state:
+            state.pop("filling_since", None)
+
+
+class AddressRegistry:
+    """catch-all 模式下的本地地址登记表
+
+    - 以 JSONL 操作日志保存（add / remove / catch_all），内存中按邮箱与 ID 建立索引
+    - 写入在文件锁内先追上其他进程追加的记录再校验，多个进程同时创建也不会重复
+    - 已删除的记录过多时重写为只含有效地址的日志
+    """
+
+    DEFAULT_PATH = "temp_email_registry.jsonl"
+    COMPACT_THRESHOLD = 1000  # 失效记录超过该数量（且多于有效地址）时压缩日志
+
+    def __init__(self, zone_id: str, path: Optional[str] = None):
+        self.path = os.path.abspath(path or os.getenv("ADDRESS_REGISTRY_FILE", self.DEFAULT_PATH))
+        self.zone_id = zone_id
+        self.catch_all_target: Optional[str] = None
+        self._lock = threading.Lock()
+        self._reset()
+        with self._lock:
+            self._catch_up()
+
+    def _reset(self):
+        self._entries: Dict[str, Dict] = {}
+        self._emails_by_tag: Dict[str, str] = {}
+        self._offset = 0
+        self._inode: Optional[int] = None
+        self._records = 0
+
+    def _apply(self, record: Dict):
+        self._records += 1
+        if record.get("zone_id") != self.zone_id:
+            return
+        op = record.get("op")
+        if op == "add":
+            self._entries[record["email"].lower()] = self._entry(record)
+            self._emails_by_tag[record["tag"]] = record["email"].lower()
+        elif op == "remove":
+            email = self._emails_by_tag.pop(record.get("tag"), None)
+            if email is not None:
+                self._entries.pop(email, None)
+        elif op == "catch_all":
+            self.catch_all_target = record.get("target")
+
+    @staticmethod
+    def _entry(record: Dict) -> Dict:
+        """由 add 记录构建内存中的条目"""
+        entry = {k: record.get(k) for k in ("tag", "target", "name", "created")}
+        entry["enabled"] = True
+        return {**entry, "email": record["email"]}
+
+    def _catch_up(self):
+        """读取其他进程追加的记录（需持有 self._lock）"""
+        try:
+            stat = os.stat(self.path)
+        except FileNotFoundError:
+            if self._inode is not None:
+                self._reset()
+            return
+        if stat.st_ino != self._inode or stat.st_size < self._offset:
+            # 日志被压缩重写，从头读取
+            self._reset()
+            self._inode = stat.st_ino
+        if stat.st_size == self._offset:
+            return
+        with open(self.path, 'rb') as f:
+            f.seek(self._offset)
+            data = f.read()
+        # 只消费完整的行，写了一半的行留到下次
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            try:
+                self._apply(json.loads(line))
+            except (ValueError, KeyError):
+                # 跳过残缺行
+                continue
+        self._offset += end
+
+    @contextlib.contextmanager
+    def _writing(self) -> Iterator[List[Dict]]:
+        """在文件锁内追上最新状态，退出时追加调用方放入的记录"""
+        with self._lock, FileLock(self.path):
+            self._catch_up()
+            records: List[Dict] = []
+            yield records
+            if not records:
+                return
+            with open(self.path, 'a', encoding='utf-8') as f:
+                f.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records))
+            for record in records:
+                self._apply(record)
+            stat = os.stat(self.path)
+            self._inode, self._offset = stat.st_ino, stat.st_size
+            if self._records - len(self._entries) > max(self.COMPACT_THRESHOLD, len(self._entries)):
+                self._compact()
+
+    def _compact(self):
+        """重写日志，只保留有效地址与 catch-all 配置（需持有文件锁）"""
+        records = [
+            {"op": "add", "zone_id": self.zone_id, "email": entry["email"], "tag": entry["tag"],
+             "target": entry["target"], "name": entry["name"], "created": entry["created"]}
+            for entry in self._entries.values()
+        ]
+        if self.catch_all_target:
+            records.insert(0, {"op": "catch_all", "zone_id": self.zone_id, "target": self.catch_all_target})
+        tmp_path = f"{self.path}.tmp"
+        with open(tmp_path, 'w', encoding='utf-8') as f:
+            f.write("".join(json.dumps(r, ensure_ascii=False) + "\n" for r in records))
+        os.replace(tmp_path, self.path)
+        self._reset()
+        self._catch_up()
+
+    def refresh(self):
+        with self._lock:
+            self._catch_up()
+
+    def get(self, email: str) -> Optional[Dict]:
+        with self._lock:
+            return self._entries.get(email.lower())
+
+    def entries(self) -> List[Dict]:
+        """全部有效地址，按创建顺序"""
+        with self._lock:
+            return list(self._entries.values())
+
+    def emails(self) -> set:
+        with self._lock:
+            return set(self._entries)
+
+    def add(self, email: str, target: str, name: str, tag: Optional[str] = None) -> Dict:
+        """登记一个地址；已存在时抛出 CloudflareAPIError（与 API 的重复规则错误一致）"""
+        with self._writing() as records:
+            existing = self._entries.get(email.lower())
+            if existing is not None and (tag is None or existing["tag"] != tag):
+                raise CloudflareAPIError(f"创建路由规则失败: 地址 {email} 已存在", 400)
+            if tag is not None:
+                records.append({"op": "remove", "zone_id": self.zone_id, "tag": tag})
+            record = {
+                "op": "add", "zone_id": self.zone_id, "email": email, "tag": tag or secrets.token_hex(16),
+                "target": target, "name": name, "created": datetime.now().isoformat()
+            }
+            records.append(record)
+        # 由本次写入的记录构建返回值，不在锁外读取可能已被其他线程修改的共享状态
+        return self._entry(record)
+
+    def remove(self, tag: str) -> bool:
+        with self._writing() as records:
+            if tag not in self._emails_by_tag:
+                return False
+            records.append({"op": "remove", "zone_id": self.zone_id, "tag": tag})
+        return True
+
+    def set_catch_all(self, target: str):
+        with self._writing() as records:
+            records.append({"op": "catch_all", "zone_id": self.zone_id, "target": target})
+
+
+DURATION_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400, "w": 604800}
+
+
+def parse_duration(value: str) -> timedelta:
+    """解析时长（如 90s、30m、2h、1d、1h30m），用作 argparse 的 type"""
+    parts = re.findall(r"(\d+(?:\.\d+)?)([smhdw])", value.strip().lower())
+    if not parts or "".join(n + u for n, u in parts) != value.strip().lower():
+        raise argparse.ArgumentTypeError(f"无法解析时长: {value}（示例: 30m、2h、1d、1h30m）")
+    seconds = sum(float(number) * DURATION_UNITS[unit] for number, unit in parts)
+    if seconds <= 0:
+        raise argparse.ArgumentTypeError("时长必须大于 0")
+    return timedelta(seconds=seconds)
+
+
+class ExpiryIndex:
+    """带过期时间的地址索引，按到期时间排序保存在本地 JSON 文件中
+
+    - 条目为 [到期时间戳, 邮箱, 规则ID]，列表始终有序，插入用 insort，
+      查找到期条目只需一次二分，无需列出整个 zone
+    - 读改写在文件锁内完成；按 zone 与后端分别保存
+    """
+
+    DEFAULT_PATH = "temp_email_expiry.json"
+    NAME_PATTERN = re.compile(r"\(expires (\d{4}-\d{2}-\d{2}T[\d:.]+)\)")
+
+    def __init__(self, key: str, path: Optional[str] = None):
+        self.path = os.path.abspath(path or os.getenv("EXPIRY_INDEX_FILE", self.DEFAULT_PATH))
+        self.key = key
+
+    def _read(self) -> Dict:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except Exception:
+            # 索引损坏时视为空（可用 reap --scan 从规则名称重建）
+            return {}
+
+    @contextlib.contextmanager
+    def _transaction(self) -> Iterator[List[List]]:
+        with FileLock(self.path):
+            data = self._read()
+            entries = data.setdefault(self.key, [])
+            yield entries
+            tmp_path = f"{self.path}.tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+
+    @staticmethod
+    def mark_name(name: str, expires_at: datetime) -> str:
+        """在规则名称中记录到期时间（本地索引丢失时可用 reap --scan 重建）"""
+        return f"{name} (expires {expires_at.isoformat(timespec='seconds')})"
+
+    @classmethod
+    def expiry_from_name(cls, name: Optional[str]) -> Optional[float]:
+        """从规则名称中解析到期时间戳；没有记录时返回 None"""
+        match = cls.NAME_PATTERN.search(name or "")
+        if not match:
+            return None
+        try:
+            return datetime.fromisoformat(match.group(1)).timestamp()
+        except ValueError:
+            return None
+
+    def replace(self, items: Iterable[Tuple[float, str, str]]):
+        """用完整的条目列表重建索引"""
+        with self._transaction() as entries:
+            entries[:] = sorted([expires, email, tag] for expires, email, tag in items)
+
+    def add(self, items: Iterable[Tuple[float, str, str]]):
+        """登记 (到期时间戳, 邮箱, 规则ID)；同一规则重复登记时以新的为准"""
+        items = list(items)
+        if not items:
+            return
+        tags = {tag for _, _, tag in items}
+        with self._transaction() as entries:
+            if any(entry[2] in tags for entry in entries):
+                entries[:] = [entry for entry in entries if entry[2] not in tags]
+            for expires, email, tag in items:
+                bisect.insort(entries, [expires, email, tag])
+
+    def due(self, now: Optional[float] = None) -> List[List]:
+        """已到期的条目（按到期时间先后）"""
+        now = time.time() if now is None else now
+        with FileLock(self.path):
+            entries = self._read().get(self.key, [])
+        # [now, 最大字符] 大于所有到期时间 <= now 的条目
+        return entries[:bisect.bisect_right(entries, [now, "\uffff"])]
+
+    def next_expiry(self) -> Optional[float]:
+        with FileLock(self.path):
+            entries = self._read().get(self.key, [])
+        return entries[0][0] if entries else None
+
+    def remove(self, tags: Iterable[str]):
+        tags = set(tags)
+        if not tags:
+            return
+        with self._transaction() as entries:
+            entries[:] = [entry for entry in entries if entry[2] not in tags]
+
+    def __len__(self) -> int:
+        with FileLock(self.path):
+            return len(self._read().get(self.key, []))
+
+
+class DestinationCache:
+    """已验证转发目标地址的本地缓存（按 account 保存在 JSON 文件中）
+
+    - 只记录已验证的地址，超过 ttl 秒视为过期
+    - 命中时不发请求；目标不在缓存中时由调用方重新获取一次再判断，
+      刚在控制台验证的地址不会被旧缓存误拒
+    """
+
+    DEFAULT_PATH = "temp_email_destinations.json"
+
+    def __init__(self, account_id: str, path: Optional[str] = None, ttl: Optional[float] = None):
+        self.path = os.path.abspath(path or os.getenv("DESTINATION_CACHE_FILE", self.DEFAULT_PATH))
+        self.account_id = account_id
+        self.ttl = float(os.getenv("DESTINATION_CACHE_TTL", "3600")) if ttl is None else ttl
+        self._lock = threading.Lock()
+        self._verified: Optional[set] = None
+        self._fetched_at = 0.0
+
+    def _read(self) -> Dict:
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return {}
+
+    def verified(self) -> Optional[set]:
+        """未过期时返回已验证地址集合（小写），否则返回 None"""
+        with self._lock:
+            if self._verified is None and self.ttl > 0:
+                entry = self._read().get(self.account_id) or {}
+                self._verified = set(entry.get("verified", []))
+                self._fetched_at = float(entry.get("fetched_at") or 0.0)
+            if self._verified is None or time.time() - self._fetched_at > self.ttl:
+                return None
+            return self._verified
+
+    def store(self, emails: Iterable[str]):
+        """记录刚从 API 获取的已验证地址"""
+        with self._lock:
+            self._verified = {email.lower() for email in emails}
+            self._fetched_at = time.time()
+            if self.ttl <= 0:
+                return
+            with FileLock(self.path):
+                data = self._read()
+                data[self.account_id] = {"fetched_at": self._fetched_at, "verified": sorted(self._verified)}
+                tmp_path = f"{self.path}.tmp"
+                with open(tmp_path, 'w', encoding='utf-8') as f:
+                    json.dump(data, f, ensure_ascii=False)
+                os.replace(tmp_path, self.path)
+
+
+class BatchJournal:
+    """批量操作的预写日志（JSONL），用于中断后 --resume 继续
+
+    - 第一行为计划：命令、zone、参数与全部待处理项目（每项含 email）
+    - 每个项目成功后立即追加一条 done 记录（在工作线程中写入，不等按顺序输出）
+    - committed 记录列出已写入历史记录与过期索引的邮箱（create 使用），恢复时把其余 done
+      补写进去：已完成但还没按顺序输出、或被强制终止的运行中完成的项目也不会漏记
+    - 全部完成且都已记录后删除日志文件
+    """
+
+    DEFAULT_DIR = "temp_email_journals"
+    # 完成的项目需要写入历史记录的命令
+    RECORDED_COMMANDS = ("create",)
+
+    def __init__(self, path: str, plan: Dict):
+        self.path = path
+        self.command = plan["command"]
+        self.state_key = plan["state_key"]
+        self.params: Dict = plan.get("params") or {}
+        self.items: List[Dict] = plan["items"]
+        self.done: Dict[str, Dict] = {}
+        self._uncommitted: List[str] = []
+        self._lock = threading.Lock()
+
+    @classmethod
+    def start(cls, command: str, state_key: str, params: Dict, items: List[Dict]) -> "BatchJournal":
+        """创建新的日志并写入计划"""
+        directory = os.getenv("BATCH_JOURNAL_DIR", cls.DEFAULT_DIR)
+        os.makedirs(directory, exist_ok=True)
+        path = os.path.join(directory, f"{command}-{datetime.now():%Y%m%d-%H%M%S}-{os.getpid()}.jsonl")
+        plan = {
+            "type": "plan",
+            "command": command,
+            "state_key": state_key,
+            "created_at": datetime.now().isoformat(),
+            "params": params,
+            "items": items,
+        }
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(json.dumps(plan, ensure_ascii=False) + "\n")
+        return cls(path, plan)
+
+    @classmethod
+    def load(cls, path: str, command: str, state_key: str) -> "BatchJournal":
+        """读取已有日志；命令或 zone 不一致时抛出 ValueError"""
+        with open(path, 'r', encoding='utf-8') as f:
+            lines = f.read().splitlines()
+        try:
+            plan = json.loads(lines[0])
+        except (IndexError, ValueError):
+            raise ValueError(f"{path} 不是有效的批量操作日志")
+        if plan.get("type") != "plan" or plan.get("command") != command:
+            raise ValueError(f"{path} 不是 {command} 操作的日志")
+        if plan.get("state_key") != state_key:
+            raise ValueError(f"{path} 属于 {plan.get('state_key')}，与当前配置 {state_key} 不一致")
+
+        journal = cls(path, plan)
+        for line in lines[1:]:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # 跳过中断时写了一半的行
+                continue
+            if record.get("type") == "done":
+                journal.done[record["email"]] = record
+                if command in cls.RECORDED_COMMANDS:
+                    journal._uncommitted.append(record["email"])
+            elif record.get("type") == "committed":
+                committed = set(record.get("emails", []))
+                journal._uncommitted = [email for email in journal._uncommitted if email not in committed]
+        return journal
+
+    def _append(self, record: Dict):
+        with self._lock, open(self.path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+    def pending(self) -> List[Dict]:
+        """尚未完成的项目（按计划顺序）"""
+        return [item for item in self.items if item["email"] not in self.done]
+
+    def uncommitted(self) -> List[Dict]:
+        """已完成但还没有写入历史记录的项目（连同 done 记录中的结果）"""
+        items = {item["email"]: item for item in self.items}
+        return [dict(items[email], **self.done[email]) for email in self._uncommitted if email in items]
+
+    def complete(self, email: str, **result):
+        """记录一个项目已完成（线程安全）"""
+        record = {"type": "done", "email": email, **result}
+        self._append(record)
+        with self._lock:
+            self.done[email] = record
+            if self.command in self.RECORDED_COMMANDS:
+                self._uncommitted.append(email)
+
+    def commit(self, emails: Iterable[str]):
+        """记录这些已完成的项目已写入历史记录与过期索引"""
+        emails = list(emails)
+        if not emails:
+            return
+        self._append({"type": "committed", "emails": emails})
+        committed = set(emails)
+        with self._lock:
+            self._uncommitted = [email for email in self._uncommitted if email not in committed]
+
+    def close(self):
+        """全部完成且都已记录时删除日志，否则提示如何继续"""
+        pending = self.pending()
+        if pending or self._uncommitted:
+            if pending:
+                print(f"💾 未完成的 {len(pending)} 个项目已记录在 {self.path}")
+            else:
+                print(f"💾 {len(self._uncommitted)} 个已完成的项目尚未写入历史记录，已保留在 {self.path}")
+            print(f"   可运行 {self.command} --resume {self.path} 继续")
+        else:
+            with contextlib.suppress(OSError):
+                os.remove(self.path)
+
+
+class BaseEmailManager:
+    """Cloudflare Email Routing 管理器的公共部分
+
+    负责读取配置、生成邮箱地址、构建规则请求体、限速与重试决策，
+    同步版 CloudflareEmailManager 与异步版 AsyncCloudflareEmailManager 共用
+    """
+
+    BASE_URL = "https://api.cloudflare.com/client/v4"
+    PER_PAGE = 50  # Cloudflare API 每页最多 50 条
+    MAX_PAGES = 100  # 安全限制：最多获取 100 页（防止无限循环）
+
+    def __init__(self, zone_id: Optional[str] = None, email_domain: Optional[str] = None):
+        """从环境变量初始化配置
+
+        zone_id / email_domain: 覆盖 CLOUDFLARE_ZONE_ID / EMAIL_DOMAIN（多 zone 模式下每个分片各自指定）
+        """
+        self.api_token = os.getenv("CLOUDFLARE_API_TOKEN")
+        self.zone_id = zone_id or os.getenv("CLOUDFLARE_ZONE_ID")
+        self.account_id = os.getenv("CLOUDFLARE_ACCOUNT_ID")
+        self.forward_to = os.getenv("FORWARD_TO_EMAIL")
+        self.email_domain = email_domain or os.getenv("EMAIL_DOMAIN")
+        self.email_prefix = os.getenv("EMAIL_PREFIX", "temp")
+
+        # 验证必需配置
+        if not all([self.api_token, self.zone_id, self.forward_to, self.email_domain]):
+            raise ValueError(
+                "缺少必需的环境变量！请检查以下配置：\n"
+                "- CLOUDFLARE_API_TOKEN\n"
+                "- CLOUDFLARE_ZONE_ID\n"
+                "- FORWARD_TO_EMAIL\n"
+                "- EMAIL_DOMAIN\n\n"
+                "请参考 .env.example 文件配置"
+            )
+
+        # API 地址可通过环境变量覆盖（用于指向本地模拟服务器）
+        self.base_url = os.getenv("CLOUDFLARE_API_BASE_URL", self.BASE_URL).rstrip("/")
+        # 分页列表时并发获取页面的数量
+        self.page_concurrency = 8
+
+        # 请求限速与重试（默认 5 req/s 起步，最高 10 req/s）
+        self.rate_limiter = AdaptiveRateLimiter(
+            rate=float(os.getenv("CLOUDFLARE_RATE_LIMIT", "5")),
+            max_rate=float(os.getenv("CLOUDFLARE_MAX_RATE", "10")),
+            shared=SharedRateBudget.from_env()
+        )
+        self.max_retries = int(os.getenv("CLOUDFLARE_MAX_RETRIES", "4"))
+
+        self.rule_index = self._make_rule_index(zone_id)
+
+        # 请求指标（进程内共享）
+        self.metrics = METRICS
+
+    def _make_rule_index(self, zone_id: Optional[str]) -> RuleIndex:
+        """本地规则快照，进程退出时写回磁盘；显式指定 zone 时每个 zone 使用单独的文件"""
+        cache_path = os.getenv("RULE_CACHE_FILE", "temp_email_rules_cache.json")
+        if zone_id:
+            root, ext = os.path.splitext(cache_path)
+            cache_path = f"{root}.{zone_id}{ext}"
+        return RuleIndex(cache_path, self.zone_id, float(os.getenv("RULE_CACHE_TTL", "300")))
+
+    def _request_headers(self) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {self.api_token}",
+            "Content-Type": "application/json"
+        }
+
+    def _retry_delay(
+        self,
+        method: str,
+        attempt: int,
+        status: Optional[int] = None,
+        response_headers: Optional[Dict[str, str]] = None,
+        share_throttle: bool = True
+    ) -> Optional[float]:
+        """判断第 attempt 次请求的结果是否需要重试，返回重试前的等待秒数，不重试时返回 None
+
+        - 429 一律按 Retry-After（或指数退避）重试，此时请求未被处理，POST 也是安全的
+        - 网络异常（status 为 None）与 5xx 仅对幂等请求（GET/PUT/DELETE）做带抖动的指数退避重试
+        - 同时把成功/限流信号反馈给限速器（share_throttle=False 时 429 暂停不同步给共享预算，由调用方处理）
+        """
+        can_retry = attempt <= self.max_retries
+        idempotent = method in ("GET", "PUT", "DELETE")
+
+        if status == 429:
+            retry_after = parse_retry_after((response_headers or {}).get("retry-after"))
+            self.rate_limiter.on_throttle(retry_after, share=share_throttle)
+            if not can_retry:
+                return None
+            # 有 Retry-After 时由限速器统一暂停
+            return 0.0 if retry_after is not None else self._backoff_delay(attempt)
+        if status is None or status >= 500:
+            if idempotent and can_retry:
+                return self._backoff_delay(attempt)
+            return None
+        if status < 400:
+            self.rate_limiter.on_success()
+        return None
+
+    @staticmethod
+    def _parse_response(status: int, reason: str, body: bytes) -> Dict:
+        """解析响应体，HTTP 错误状态抛出 CloudflareAPIError"""
+        if status >= 400:
+            error_body = body.decode('utf-8', errors='replace')
+            raise CloudflareAPIError(
+                f"API 请求失败: {status} {reason}\n详细信息: {error_body}",
+                status=status
+            )
+
+        try:
+            return json.loads(body.decode('utf-8'))
+        except Exception as e:
+            raise CloudflareAPIError(f"请求异常: {str(e)}", status=status) from e
+
+    @staticmethod
+    def _backoff_delay(attempt: int) -> float:
+        """第 attempt 次重试前的等待时间（full jitter 指数退避，上限 30 秒）"""
+        return random.uniform(0, min(30.0, 0.5 * 2 ** attempt))
+
+    def generate_random_email(self, prefix: Optional[str] = None) -> str:
+        """生成随机邮箱地址
+        规则：
+        - prefix 为 None 或 "" 时，生成纯随机邮箱（8位小写字母）
+        - prefix 为其他值时，生成 prefix-xxxxxxxx 格式
+        使用 secrets 生成，地址不可预测
+        """
+        random_str = ''.join(secrets.choice(string.ascii_lowercase) for _ in range(8))
+        if prefix is None or prefix == "":
+            local_part = random_str
+        else:
+            local_part = f"{prefix}-{random_str}"
+        return f"{local_part}@{self.email_domain}"
+
+    def generate_unique_emails(
+        self,
+        count: int,
+        prefix: Optional[str] = None,
+        existing: Optional[Iterable[str]] = None
+    ) -> List[str]:
+        """在本地一次性生成 count 个互不重复、且不与 existing 冲突的随机邮箱"""
+        taken = {email.lower() for email in (existing or ())}
+        emails: List[str] = []
+        while len(emails) < count:
+            email = self.generate_random_email(prefix)
+            if email.lower() in taken:
+                continue
+            taken.add(email.lower())
+            emails.append(email)
+        return emails
+
+    def generate_numbered_email(self, prefix: str, number: int, digits: int = 4) -> str:
+        """生成带编号的邮箱地址
+        规则：
+        - prefix: 前缀（如 'ul'）
+        - number: 编号（如 1）
+        - digits: 编号位数（如 4 表示 0001）
+        返回: prefix + 补零编号 @ domain （如: ul0001@domain.com）
+        """
+        number_str = str(number).zfill(digits)
+        local_part = f"{prefix}{number_str}"
+        return f"{local_part}@{self.email_domain}"
+
+    def generate_numbered_emails(self, prefix: str, numbers: Iterable[int], digits: int = 4) -> List[str]:
+        """批量生成编号邮箱地址（顺序与 numbers 一致）"""
+        return [self.generate_numbered_email(prefix, number, digits) for number in numbers]
+
+    @property
+    def state_key(self) -> str:
+        """本地状态文件（地址池、过期索引）中的键，不同 zone 与后端互不混用"""
+        return self.zone_id
+
+    def _rules_endpoint(self, rule_id: Optional[str] = None) -> str:
+        endpoint = f"/zones/{self.zone_id}/email/routing/rules"
+        return f"{endpoint}/{rule_id}" if rule_id else endpoint
+
+    def _build_rule_data(
+        self,
+        email: str,
+        description: Optional[str] = None,
+        forward_to: Optional[str] = None
+    ) -> Dict:
+        """构建创建路由规则的请求体"""
+        return {
+            "actions": [
+                {
+                    "type": "forward",
+                    "value": [forward_to or self.forward_to]
+                }
+            ],
+            "matchers": [
+                {
+                    "type": "literal",
+                    "field": "to",
+                    "value": email
+                }
+            ],
+            "enabled": True,
+            "name": description or f"Temp email: {email}"
+        }
+
+    @staticmethod
+    def _retargeted_rule_data(rule: Dict, forward_to: str, enabled: Optional[bool] = None) -> Dict:
+        """基于现有规则构建 PUT 请求体：只替换转发目标，保留匹配条件、名称与启用状态
+
+        enabled 不为 None 时同时设置启用状态（sync 用来确保规则启用）
+        """
+        return {
+            "actions": [{"type": "forward", "value": [forward_to]}],
+            "matchers": rule.get("matchers", []),
+            "enabled": rule.get("enabled", True) if enabled is None else enabled,
+            "name": rule.get("name") or "",
+            "priority": rule.get("priority", 0),
+        }
+
+    def _renamed_rule_data(self, email: str, description: str) -> Dict:
+        """回收地址池规则的 PUT 请求体：换成新地址并恢复默认转发目标"""
+        rule_data = self._build_rule_data(email, description)
+        rule_data["priority"] = 0
+        return rule_data
+
+    def _created_rule(self, response: Dict) -> Dict:
+        """处理创建规则的响应：成功时更新本地快照并返回规则"""
+        if response.get("success"):
+            rule = response.get("result", {})
+            self.rule_index.add(rule)
+            return rule
+        else:
+            errors = response.get("errors", [])
+            raise CloudflareAPIError(f"创建路由规则失败: {errors}")
+
+    def _rules_page_endpoint(self, page: int, per_page: int) -> str:
+        return f"{self._rules_endpoint()}?page={page}&per_page={per_page}"
+
+    def _rules_page(self, response: Dict) -> Optional[Tuple[List[Dict], Dict]]:
+        """解析单页路由规则响应，返回 (result, result_info)；API 返回失败时返回 None（列表视为不完整）"""
+        self.metrics.record_page()
+        if not response.get("success"):
+            print(f"❌ 获取路由规则失败: {response.get('errors')}")
+            return None
+        return response.get("result", []), response.get("result_info", {})
+
+    @staticmethod
+    def _total_pages(result: List[Dict], result_info: Dict, per_page: int) -> Optional[int]:
+        """由第 1 页推算总页数：第 1 页不满时为 1，result_info 没有给出时返回 None（需逐页获取）"""
+        if len(result) < per_page:
+            return 1
+        total_pages = result_info.get("total_pages")
+        if total_pages is None and result_info.get("total_count") is not None:
+            total_pages = -(-result_info["total_count"] // per_page)
+        return total_pages
+
+    @staticmethod
+    def _match_rule(rules: Iterable[Dict], email: str) -> Optional[Dict]:
+        for rule in rules:
+            matchers = rule.get("matchers", [])
+            for matcher in matchers:
+                if matcher.get("field") == "to" and matcher.get("value") == email:
+                    return rule
+        return None
+
+
+class CloudflareEmailManager(BaseEmailManager):
     """Cloudflare Email Routing API 管理器"""
 
-    BASE_URL = "https://api.cloudflare.com/client/v4"
+    def __init__(
+        self,
+        transport: Optional[HTTPTransport] = None,
+        zone_id: Optional[str] = None,
+        email_domain: Optional[str] = None
+    ):
+        """从环境变量初始化配置
+
+        transport: 自定义 HTTP 传输层（默认使用持久连接池）
+        zone_id / email_domain: 覆盖环境变量中的 zone 与域名
+        """
+        super().__init__(zone_id, email_domain)
+        # 所有方法共享同一个连接池
+        self.transport = transport or PooledHTTPTransport()
+        # 已验证转发目标的缓存，首次预检时创建
+        self.destinations: Optional[DestinationCache] = None
+
+    def _make_request(
+        self,
+        endpoint: str,
+        method: str = "GET",
+        data: Optional[Dict] = None
+    ) -> Dict:
+        """发送 HTTP 请求到 Cloudflare API，失败时抛出 CloudflareAPIError
+
+        所有请求经过自适应限速器，重试规则见 _retry_delay()
+        """
+        url = f"{self.base_url}{endpoint}"
+        headers = self._request_headers()
+        request_data = json.dumps(data).encode('utf-8') if data else None
+
+        label = self.metrics.endpoint_label(method, endpoint)
+        sent = len(request_data or b"")
+
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire()
+            attempt += 1
+            if attempt > 1:
+                self.metrics.record_retry(label)
+
+            started = time.perf_counter()
+            try:
+                status, reason, response_headers, body = self.transport.request(
+                    method, url, headers, request_data
+                )
+            except Exception as e:
+                self.metrics.record(label, None, time.perf_counter() - started, sent)
+                delay = self._retry_delay(method, attempt)
+                if delay is None:
+                    raise CloudflareAPIError(f"请求异常: {str(e)}") from e
+                time.sleep(delay)
+                continue
+            received = int(response_headers.get("content-length", len(body)))
+            self.metrics.record(label, status, time.perf_counter() - started, sent, received)
+
+            delay = self._retry_delay(method, attempt, status, response_headers)
+            if delay is None:
+                return self._parse_response(status, reason, body)
+            time.sleep(delay)
+
+    def create_routing_rule(
+        self,
+        email: str,
+        description: Optional[str] = None,
+        forward_to: Optional[str] = None
+    ) -> Dict:
+        """创建邮件路由规则"""
+        rule_data = self._build_rule_data(email, description, forward_to)
+        response = self._make_request(self._rules_endpoint(), method="POST", data=rule_data)
+        return self._created_rule(response)
+
+    def _fetch_rules_page(self, page: int, per_page: int) -> Optional[Tuple[List[Dict], Dict]]:
+        """获取单页路由规则，返回 (result, result_info)；API 返回失败时返回 None"""
+        return self._rules_page(self._make_request(self._rules_page_endpoint(page, per_page)))
+
+    def iter_routing_rules(
+        self,
+        verbose: bool = False,
+        first_page: Optional[Tuple[List[Dict], Dict]] = None
+    ) -> Generator[Dict, None, bool]:
+        """逐页产出所有邮件路由规则
+
+        先获取第 1 页并立即产出；若 result_info 给出了总页数，则以有界窗口并发预取其余页面，
+        按页码顺序产出；否则退回逐页获取。完整遍历后刷新本地规则快照。
+        first_page: 已获取的第 1 页 (result, result_info)（如 probe_rules 的探测结果），不再重复请求
+        生成器的返回值表示是否完整获取（某页失败或超过 MAX_PAGES 时为 False），见 fetch_routing_rules
+        """
+        per_page = self.PER_PAGE
+        max_pages = self.MAX_PAGES
+
+        page_data = first_page if first_page is not None else self._fetch_rules_page(1, per_page)
+        if page_data is None:
+            return False
+        # 只有完整获取时才刷新本地快照
+        complete = True
+        index_entries: Dict[str, Dict] = {}
+        total = 0
+
+        result, result_info = page_data
+        if verbose:
+            print(f"  第 1 页: 获取到 {len(result)} 条记录")
+            print(f"  result_info: {result_info}")
+
+        for rule in result:
+            RuleIndex.collect(index_entries, rule)
+            yield rule
+        total += len(result)
+
+        total_pages = self._total_pages(result, result_info, per_page)
+        if verbose and len(result) < per_page:
+            print(f"  返回记录数 ({len(result)}) < 每页数量 ({per_page})，没有更多数据")
+
+        if total_pages is not None:
+            # 已知总页数：并发获取剩余页面
+            last_page = min(total_pages, max_pages)
+            if total_pages > max_pages:
+                complete = False
+                if verbose:
+                    print(f"  达到最大页数限制 ({max_pages} 页)，只获取前 {max_pages} 页")
+            if verbose and last_page > 1:
+                print(f"  共 {total_pages} 页，并发获取第 2-{last_page} 页（并发数: {self.page_concurrency}）")
+
+            pages = run_concurrently(
+                lambda page: self._fetch_rules_page(page, per_page),
+                range(2, last_page + 1),
+                self.page_concurrency
+            )
+            for page, page_data, error in pages:
+                if error is not None:
+                    raise error
+                if page_data is None:
+                    complete = False
+                    break
+                result, _ = page_data
+                if verbose:
+                    print(f"  第 {page} 页: 获取到 {len(result)} 条记录")
+                for rule in result:
+                    RuleIndex.collect(index_entries, rule)
+                    yield rule
+                total += len(result)
+        else:
+            # 未知总页数：逐页获取，直到返回不足一页
+            page = 2
+            while page <= max_pages:
+                page_data = self._fetch_rules_page(page, per_page)
+                if page_data is None:
+                    complete = False
+                    break
+
+                result, result_info = page_data
+                if verbose:
+                    print(f"  第 {page} 页: 获取到 {len(result)} 条记录")
+                    print(f"  result_info: {result_info}")
+
+                for rule in result:
+                    RuleIndex.collect(index_entries, rule)
+                    yield rule
+                total += len(result)
+                if len(result) < per_page:
+                    if verbose:
+                        print(f"  返回记录数 ({len(result)}) < 每页数量 ({per_page})，没有更多数据")
+                    break
+                page += 1
+            else:
+                complete = False
+                if verbose:
+                    print(f"  达到最大页数限制 ({max_pages} 页)，停止获取")
+
+        if verbose:
+            print(f"  ✅ 总共获取到 {total} 条路由规则")
+
+        if complete:
+            self.rule_index.replace_entries(index_entries)
+        return complete
+
+    def probe_rules(self) -> Tuple[object, object]:
+        """低成本的变化探测（一次请求）：返回 (变化信号, 探测到的第 1 页)
+
+        信号由 result_info.total_count 与第 1 页的规则内容组成，与上次相同即视为没有变化；
+        有变化时把第 1 页传给 fetch_routing_rules(first_page=...)，只需再获取第 2 页之后的页面
+        （第 1 页已包含全部规则时不再发请求）
+        """
+        page_data = self._fetch_rules_page(1, self.PER_PAGE)
+        if page_data is None:
+            raise CloudflareAPIError("获取第 1 页路由规则失败")
+        result, result_info = page_data
+        return (result_info.get("total_count", len(result)), result), page_data
+
+    def fetch_routing_rules(self, verbose: bool = False, first_page: object = None) -> Tuple[List[Dict], bool]:
+        """列出所有邮件路由规则，同时返回是否完整获取（first_page 见 iter_routing_rules）"""
+        rules: List[Dict] = []
+        iterator = self.iter_routing_rules(verbose=verbose, first_page=first_page)
+        while True:
+            try:
+                rules.append(next(iterator))
+            except StopIteration as stop:
+                return rules, stop.value is not False
+
+    def list_routing_rules(self, verbose: bool = False) -> List[Dict]:
+        """列出所有邮件路由规则（支持分页）"""
+        return list(self.iter_routing_rules(verbose=verbose))
+
+    def existing_emails(self, cached_only: bool = False) -> set:
+        """当前 zone 中已存在的邮箱地址（小写）
+
+        本地快照未过期时直接使用快照；否则列出一次全部规则（cached_only=True 时返回空集合）
+        """
+        if not self.rule_index.is_fresh():
+            if cached_only:
+                return set()
+            self.list_routing_rules()
+        return {email.lower() for email in self.rule_index.emails()}
+
+    def update_routing_rule(self, rule_id: str, rule_data: Dict) -> Dict:
+        """原地更新邮件路由规则（PUT，需提供完整的 matchers/actions/enabled/name）"""
+        response = self._make_request(self._rules_endpoint(rule_id), method="PUT", data=rule_data)
+
+        if not response.get("success"):
+            raise CloudflareAPIError(f"更新路由规则失败: {response.get('errors', [])}")
+        rule = {**rule_data, **(response.get("result") or {}), "tag": rule_id}
+        # 地址可能被改名，先移除旧条目
+        self.rule_index.remove_tag(rule_id)
+        self.rule_index.add(rule)
+        return rule
+
+    def delete_routing_rule(self, rule_id: str) -> bool:
+        """删除邮件路由规则"""
+        response = self._make_request(self._rules_endpoint(rule_id), method="DELETE")
+
+        success = response.get("success", False)
+        if success:
+            self.rule_index.remove_tag(rule_id)
+        return success
+
+    def find_rule_by_email(self, email: str, refresh: bool = False) -> Optional[Dict]:
+        """根据邮箱地址查找路由规则
+
+        优先查本地快照；快照过期、refresh=True，或未命中且快照不是本进程列出的（见 RuleIndex.is_authoritative）时
+        重新列出全部规则
+        """
+        if not refresh and self.rule_index.is_fresh():
+            entry = self.rule_index.get(email)
+            if entry:
+                return self.rule_index.to_rule(email, entry)
+            if self.rule_index.is_authoritative():
+                return None
+
+        return self._match_rule(self.list_routing_rules(), email)
+
+    def list_destination_addresses(self) -> List[Dict]:
+        """列出账户下的全部转发目标地址（需要 CLOUDFLARE_ACCOUNT_ID）"""
+        addresses: List[Dict] = []
+        page = 1
+        while page <= self.MAX_PAGES:
+            response = self._make_request(
+                f"/accounts/{self.account_id}/email/routing/addresses?page={page}&per_page={self.PER_PAGE}"
+            )
+            addresses.extend(response.get("result") or [])
+            info = response.get("result_info") or {}
+            if page >= int(info.get("total_pages") or 1):
+                break
+            page += 1
+        return addresses
+
+    def verify_destinations(self, targets: Iterable[Optional[str]]):
+        """预检转发目标：有未验证的目标时抛出 CloudflareAPIError，避免在必然失败的创建上浪费请求
+
+        已验证地址缓存在本地（DestinationCache），命中时不发请求；未设置 CLOUDFLARE_ACCOUNT_ID
+        或无法获取地址列表（如 API Token 没有相应权限）时跳过检查
+        """
+        targets = {target.lower() for target in targets if target}
+        if not targets or not self.account_id:
+            return
+        if self.destinations is None:
+            self.destinations = DestinationCache(self.account_id)
+        verified = self.destinations.verified()
+        if verified is not None and targets <= verified:
+            return
+
+        try:
+            addresses = self.list_destination_addresses()
+        except CloudflareAPIError as e:
+            print(f"⚠️  无法获取已验证的转发目标（{e}），跳过检查", file=sys.stderr)
+            return
+        verified = {a["email"].lower() for a in addresses if a.get("email") and a.get("verified")}
+        self.destinations.store(verified)
+
+        # 直接用刚获取的列表判断（DESTINATION_CACHE_TTL=0 时缓存不保存）
+        missing = sorted(targets - verified)
+        if missing:
+            raise CloudflareAPIError(
+                f"转发目标尚未在 Email Routing 中验证: {', '.join(missing)}（请先在 Cloudflare 控制台添加并完成验证）",
+                400
+            )
+
+
+class CatchAllEmailManager(CloudflareEmailManager):
+    """catch-all 模式：整个域名只用一条 catch-all 规则转发，地址只登记在本地
+
+    创建/删除/列出都只读写本地登记表，不发请求，也不受每个 zone 200 条规则的限制；
+    首次使用时把 zone 的 catch-all 规则配置为转发到 FORWARD_TO_EMAIL（只需一次）。
+    注意：catch-all 会接收发往该域名任意地址的邮件，删除只表示不再分配该地址
+    """
+
+    def __init__(self, transport: Optional[HTTPTransport] = None):
+        super().__init__(transport)
+        self.registry = AddressRegistry(self.zone_id)
+        self._catch_all_lock = threading.Lock()
+
+    @property
+    def state_key(self) -> str:
+        return f"{self.zone_id}:catchall"
+
+    def ensure_catch_all(self) -> str:
+        """确保 zone 的 catch-all 规则已启用并转发到 FORWARD_TO_EMAIL，返回转发目标"""
+        if self.registry.catch_all_target == self.forward_to:
+            return self.forward_to
+        with self._catch_all_lock:
+            if self.registry.catch_all_target != self.forward_to:
+                self._configure_catch_all()
+        return self.forward_to
+
+    def _configure_catch_all(self):
+        endpoint = self._rules_endpoint("catch_all")
+        current = self._make_request(endpoint).get("result") or {}
+        targets = [
+            value for action in current.get("actions", []) if action.get("type") == "forward"
+            for value in action.get("value", [])
+        ]
+        if not (current.get("enabled") and targets == [self.forward_to]):
+            self.verify_destinations([self.forward_to])
+            print(f"🔧 配置 catch-all 规则: 所有地址转发到 {self.forward_to}")
+            response = self._make_request(endpoint, method="PUT", data={
+                "name": "Catch-all (temp_email)",
+                "enabled": True,
+                "matchers": [{"type": "all"}],
+                "actions": [{"type": "forward", "value": [self.forward_to]}],
+            })
+            if not response.get("success"):
+                raise CloudflareAPIError(f"配置 catch-all 规则失败: {response.get('errors', [])}")
+        self.registry.set_catch_all(self.forward_to)
+
+    def _check_target(self, forward_to: Optional[str]) -> str:
+        target = self.ensure_catch_all()
+        if forward_to and forward_to != target:
+            raise CloudflareAPIError(f"catch-all 模式下所有地址都转发到 {target}，不支持单独指定转发目标 {forward_to}")
+        return target
+
+    @staticmethod
+    def _to_rule(entry: Dict) -> Dict:
+        return RuleIndex.to_rule(entry["email"], entry)
+
+    def create_routing_rule(
+        self,
+        email: str,
+        description: Optional[str] = None,
+        forward_to: Optional[str] = None
+    ) -> Dict:
+        """在本地登记地址（不发请求）"""
+        target = self._check_target(forward_to)
+        entry = self.registry.add(email, target, description or f"Temp email: {email}")
+        return self._to_rule(entry)
+
+    def iter_routing_rules(self, verbose: bool = False, first_page: object = None) -> Generator[Dict, None, bool]:
+        self.registry.refresh()
+        if verbose:
+            print(f"📋 catch-all 模式：从本地登记表读取（{self.registry.path}）")
+        for entry in self.registry.entries():
+            yield self._to_rule(entry)
+        return True
+
+    def probe_rules(self) -> Tuple[object, object]:
+        # 本地登记表读取不需要请求，以完整列表作为信号
+        return list(self.iter_routing_rules()), None
+
+    def existing_emails(self, cached_only: bool = False) -> set:
+        self.registry.refresh()
+        return self.registry.emails()
+
+    def update_routing_rule(self, rule_id: str, rule_data: Dict) -> Dict:
+        """本地改名（地址池回收）；转发目标只能是 catch-all 的目标"""
+        target = self._check_target(RuleIndex.summarize(rule_data).get("target"))
+        entry = self.registry.add(RuleIndex.rule_email(rule_data), target, rule_data.get("name") or "", tag=rule_id)
+        return self._to_rule(entry)
+
+    def delete_routing_rule(self, rule_id: str) -> bool:
+        """从本地登记表移除地址；不存在时与 API 一样返回 404"""
+        if not self.registry.remove(rule_id):
+            raise CloudflareAPIError("删除路由规则失败: 地址不存在", 404)
+        return True
+
+    def find_rule_by_email(self, email: str, refresh: bool = False) -> Optional[Dict]:
+        self.registry.refresh()
+        entry = self.registry.get(email)
+        return self._to_rule(entry) if entry else None
+
+
+class ShardedRuleIndex:
+    """多 zone 模式下把各分片的规则快照合并成一个视图（接口与 RuleIndex 一致）"""
+
+    def __init__(self, manager: "MultiZoneEmailManager"):
+        self.manager = manager
+        self.to_rule = RuleIndex.to_rule
+
+    @property
+    def _indexes(self) -> List[RuleIndex]:
+        return [shard.rule_index for shard in self.manager.shards]
 
-    def __init__(self):
-        """从环境变量初始化配置"""
-        self.api_token = os.getenv("CLOUDFLARE_API_TOKEN")
-        self.zone_id = os.getenv("CLOUDFLARE_ZONE_ID")
-        self.account_id = os.getenv("CLOUDFLARE_ACCOUNT_ID")
-        self.forward_to = os.getenv("FORWARD_TO_EMAIL")
-        self.email_domain = os.getenv("EMAIL_DOMAIN")
-        self.email_prefix = os.getenv("EMAIL_PREFIX", "temp")
+    @property
+    def ttl(self) -> float:
+        return min(index.ttl for index in self._indexes)
 
-        # 验证必需配置
-        if not all([self.api_token, self.zone_id, self.forward_to, self.email_domain]):
-            raise ValueError(
-                "缺少必需的环境变量！请检查以下配置：\n"
-                "- CLOUDFLARE_API_TOKEN\n"
-                "- CLOUDFLARE_ZONE_ID\n"
-                "- FORWARD_TO_EMAIL\n"
-                "- EMAIL_DOMAIN\n\n"
-                "请参考 .env.example 文件配置"
+    @ttl.setter
+    def ttl(self, value: float):
+        for index in self._indexes:
+            index.ttl = value
+
+    def is_fresh(self) -> bool:
+        return all(index.is_fresh() for index in self._indexes)
+
+    def is_authoritative(self) -> bool:
+        return all(index.is_authoritative() for index in self._indexes)
+
+    def get(self, email: str) -> Optional[Dict]:
+        shard = self.manager.shard_for(email)
+        return shard.rule_index.get(email) if shard else None
+
+    def emails(self) -> List[str]:
+        return [email for index in self._indexes for email in index.emails()]
+
+    def add(self, rule: Dict):
+        shard = self.manager.shard_for(RuleIndex.rule_email(rule) or "")
+        if shard:
+            shard.rule_index.add(rule)
+
+    def remove_tag(self, tag: str):
+        for index in self._indexes:
+            index.remove_tag(tag)
+
+    def flush(self):
+        for index in self._indexes:
+            index.flush()
+
+
+class MultiZoneEmailManager(CloudflareEmailManager):
+    """多 zone 分片：CLOUDFLARE_ZONES 配置多组 zone/域名，突破单个 zone 的规则数量限制
+
+    - create 按各 zone 的剩余容量分配新地址，地址按域名路由到对应 zone
+    - list / delete --batch / cleanup 并发查询所有 zone 并合并结果
+    - 所有分片共享同一个连接池、限速器与请求指标
+    """
+
+    def __init__(self, zones: List[Tuple[str, str]], transport: Optional[HTTPTransport] = None):
+        if not zones:
+            raise ValueError("CLOUDFLARE_ZONES 至少需要一组 zone_id:域名")
+        super().__init__(transport, zones[0][0], zones[0][1])
+        self.quota = int(os.getenv("CLOUDFLARE_RULE_QUOTA", "200"))
+        self.shards: List[CloudflareEmailManager] = []
+        for zone_id, domain in zones:
+            shard = CloudflareEmailManager(self.transport, zone_id, domain)
+            shard.rate_limiter = self.rate_limiter
+            self.shards.append(shard)
+        self._shards_by_domain = {shard.email_domain.lower(): shard for shard in self.shards}
+        self._shards_by_tag: Dict[str, CloudflareEmailManager] = {}
+        # 已分配、尚未发出创建请求的地址（创建请求结束后移除）
+        self._planned: set = set()
+        self._plan_lock = threading.Lock()
+        # 最近一次 existing_emails() 的结果，创建/改名/删除后失效
+        self._known_emails: Optional[set] = None
+        self._tag_lock = threading.Lock()
+
+    def _make_rule_index(self, zone_id: Optional[str]) -> "ShardedRuleIndex":
+        # 快照由各分片分别保存，这里只合并视图
+        return ShardedRuleIndex(self)
+
+    @staticmethod
+    def parse_zones(value: str) -> List[Tuple[str, str]]:
+        """解析 "zone_id:域名,zone_id:域名" 格式的配置"""
+        zones = []
+        for item in value.split(","):
+            item = item.strip()
+            if not item:
+                continue
+            zone_id, sep, domain = item.partition(":")
+            if not sep or not zone_id.strip() or not domain.strip():
+                raise ValueError(f"CLOUDFLARE_ZONES 格式错误: {item}（应为 zone_id:域名）")
+            zones.append((zone_id.strip(), domain.strip()))
+        return zones
+
+    @property
+    def state_key(self) -> str:
+        return "+".join(shard.zone_id for shard in self.shards)
+
+    def shard_for(self, email: str) -> Optional[CloudflareEmailManager]:
+        """按邮箱域名找到对应的分片"""
+        return self._shards_by_domain.get(email.rpartition('@')[2].lower())
+
+    def _remember(self, shard: CloudflareEmailManager, rules: Iterable[Dict]):
+        with self._tag_lock:
+            for rule in rules:
+                self._shards_by_tag[rule.get("tag")] = shard
+
+    def _shard_for_tag(self, rule_id: str) -> Optional[CloudflareEmailManager]:
+        with self._tag_lock:
+            shard = self._shards_by_tag.get(rule_id)
+        if shard is None:
+            for candidate in self.shards:
+                if any(entry and entry.get("tag") == rule_id
+                       for entry in map(candidate.rule_index.get, candidate.rule_index.emails())):
+                    return candidate
+        return shard
+
+    def _require_shard(self, email: str) -> CloudflareEmailManager:
+        shard = self.shard_for(email)
+        if shard is None:
+            domains = ", ".join(self._shards_by_domain)
+            raise CloudflareAPIError(f"邮箱 {email} 的域名不在已配置的 zone 中（{domains}）", 400)
+        return shard
+
+    def _allocate(self, count: int, existing: Iterable[str]) -> List[CloudflareEmailManager]:
+        """按剩余容量把 count 个新地址分配到各分片（每次分给剩余最多的分片），返回每个地址的分片"""
+        used = {shard.email_domain.lower(): 0 for shard in self.shards}
+        # 本进程已分配但尚未创建的地址也占用容量
+        with self._plan_lock:
+            planned = set(self._planned)
+        for email in set(existing) | planned:
+            domain = email.rpartition('@')[2].lower()
+            if domain in used:
+                used[domain] += 1
+        free = {domain: self.quota - n for domain, n in used.items()}
+        if sum(max(0, n) for n in free.values()) < count:
+            raise CloudflareAPIError(
+                f"所有 zone 剩余容量共 {sum(max(0, n) for n in free.values())} 个，不足以创建 {count} 个"
             )
 
-    def _make_request(
+        assigned = []
+        for _ in range(count):
+            domain = max(free, key=free.get)
+            free[domain] -= 1
+            assigned.append(self._shards_by_domain[domain])
+        return assigned
+
+    def generate_unique_emails(
+        self,
+        count: int,
+        prefix: Optional[str] = None,
+        existing: Optional[Iterable[str]] = None
+    ) -> List[str]:
+        """按剩余容量在各 zone 生成互不重复的新地址"""
+        existing = set(existing or ())
+        shards = self._allocate(count, existing)
+        emails: List[str] = []
+        for shard in self.shards:
+            share = sum(1 for assigned in shards if assigned is shard)
+            if share:
+                emails.extend(shard.generate_unique_emails(share, prefix, existing))
+        with self._plan_lock:
+            self._planned.update(email.lower() for email in emails)
+        return emails
+
+    def generate_numbered_email(self, prefix: str, number: int, digits: int = 4) -> str:
+        return self.generate_numbered_emails(prefix, [number], digits)[0]
+
+    def generate_numbered_emails(self, prefix: str, numbers: Iterable[int], digits: int = 4) -> List[str]:
+        """编号地址：任一 zone 已有同名用户名时返回该地址（由调用方跳过），
+        其余编号一次性按剩余容量分配到各 zone（整批只统计一次已有地址）"""
+        existing = self._known_emails if self._known_emails is not None else self.existing_emails(cached_only=True)
+        emails: List[Optional[str]] = []
+        new_usernames: List[Tuple[int, str]] = []
+        for number in numbers:
+            username = self.shards[0].generate_numbered_email(prefix, number, digits).split('@')[0]
+            found = next((
+                f"{username}@{shard.email_domain}" for shard in self.shards
+                if f"{username}@{shard.email_domain}".lower() in existing
+            ), None)
+            if found is None:
+                new_usernames.append((len(emails), username))
+            emails.append(found)
+
+        shards = self._allocate(len(new_usernames), existing) if new_usernames else []
+        for (position, username), shard in zip(new_usernames, shards):
+            emails[position] = f"{username}@{shard.email_domain}"
+        with self._plan_lock:
+            self._planned.update(emails[position].lower() for position, _ in new_usernames)
+        return emails
+
+    def existing_emails(self, cached_only: bool = False) -> set:
+        emails: set = set()
+        for _, result, error in run_concurrently(
+            lambda shard: shard.existing_emails(cached_only), self.shards, len(self.shards), ordered=False
+        ):
+            if error is not None:
+                raise error
+            emails |= result
+        # 供随后逐个生成编号地址时判断冲突，避免每个编号都查询一次
+        self._known_emails = emails
+        return emails
+
+    def create_routing_rule(
+        self,
+        email: str,
+        description: Optional[str] = None,
+        forward_to: Optional[str] = None
+    ) -> Dict:
+        shard = self._require_shard(email)
+        self._known_emails = None
+        try:
+            rule = shard.create_routing_rule(email, description, forward_to)
+        finally:
+            # 创建成功后地址已计入快照，失败的地址不再占用容量
+            with self._plan_lock:
+                self._planned.discard(email.lower())
+        self._remember(shard, [rule])
+        return rule
+
+    def iter_routing_rules(self, verbose: bool = False, first_page: object = None) -> Generator[Dict, None, bool]:
+        """并发列出所有 zone 的规则，按 zone 完成顺序合并输出；任一 zone 不完整时返回 False
+
+        first_page: probe_rules 探测到的各 zone 第 1 页（zone_id → 第 1 页），不再重复请求
+        """
+        first_pages = first_page or {}
+
+        def list_shard(shard: CloudflareEmailManager) -> Tuple[List[Dict], bool]:
+            return shard.fetch_routing_rules(verbose=verbose, first_page=first_pages.get(shard.zone_id))
+
+        complete = True
+        for shard, listing, error in run_concurrently(list_shard, self.shards, len(self.shards), ordered=False):
+            if error is not None:
+                raise CloudflareAPIError(f"列出 zone {shard.zone_id}（{shard.email_domain}）的规则失败: {error}")
+            rules, shard_complete = listing
+            complete = complete and shard_complete
+            self._remember(shard, rules)
+            yield from rules
+        return complete
+
+    def probe_rules(self) -> Tuple[object, object]:
+        """并发探测各 zone，返回合并的信号与各 zone 的第 1 页（zone_id → 第 1 页）"""
+        probes = {}
+        for shard, probe, error in run_concurrently(lambda shard: shard.probe_rules(), self.shards, len(self.shards)):
+            if error is not None:
+                raise error
+            probes[shard.zone_id] = probe
+        signature = tuple(probes[shard.zone_id][0] for shard in self.shards)
+        return signature, {zone_id: probe[1] for zone_id, probe in probes.items()}
+
+    def update_routing_rule(self, rule_id: str, rule_data: Dict) -> Dict:
+        shard = self._shard_for_tag(rule_id) or self._require_shard(RuleIndex.rule_email(rule_data) or "")
+        self._known_emails = None
+        return shard.update_routing_rule(rule_id, rule_data)
+
+    def delete_routing_rule(self, rule_id: str) -> bool:
+        """删除规则；规则所在 zone 未知时依次尝试各 zone"""
+        self._known_emails = None
+        shard = self._shard_for_tag(rule_id)
+        if shard is not None:
+            return shard.delete_routing_rule(rule_id)
+        for candidate in self.shards:
+            try:
+                return candidate.delete_routing_rule(rule_id)
+            except CloudflareAPIError as e:
+                if e.status != 404:
+                    raise
+        raise CloudflareAPIError(f"删除路由规则失败: 所有 zone 中都没有规则 {rule_id}", 404)
+
+    def find_rule_by_email(self, email: str, refresh: bool = False) -> Optional[Dict]:
+        shard = self.shard_for(email)
+        if shard is None:
+            return None
+        rule = shard.find_rule_by_email(email, refresh)
+        if rule:
+            self._remember(shard, [rule])
+        return rule
+
+
+def create_manager() -> CloudflareEmailManager:
+    """按配置创建管理器
+
+    EMAIL_BACKEND: rules（默认，每个地址一条路由规则）或 catchall；
+    rules 模式下设置了 CLOUDFLARE_ZONES 时使用多 zone 分片
+    """
+    backend = os.getenv("EMAIL_BACKEND", "rules").lower()
+    if backend == "catchall":
+        return CatchAllEmailManager()
+    if backend != "rules":
+        raise ValueError(f"未知的 EMAIL_BACKEND: {backend}（可选 rules / catchall）")
+    zones = os.getenv("CLOUDFLARE_ZONES")
+    if zones:
+        return MultiZoneEmailManager(MultiZoneEmailManager.parse_zones(zones))
+    return CloudflareEmailManager()
+
+
+class AsyncCloudflareEmailManager(BaseEmailManager):
+    """异步版 Cloudflare Email Routing API 管理器
+
+    与 CloudflareEmailManager 共用配置、规则构建、限速重试与本地快照，
+    所有网络调用只挂起当前协程，适合在一个事件循环中并发创建大量邮箱：
+
+        async with AsyncCloudflareEmailManager() as manager:
+            rules = await asyncio.gather(*(manager.create_routing_rule(e) for e in emails))
+    """
+
+    def __init__(self, transport: Optional[AsyncHTTPTransport] = None):
+        """从环境变量初始化配置
+
+        transport: 自定义异步 HTTP 传输层（默认使用 asyncio 持久连接池）
+        """
+        super().__init__()
+        self.transport = transport or AsyncPooledHTTPTransport()
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.close()
+
+    async def close(self):
+        """关闭连接池并写回本地快照"""
+        await self.transport.close()
+        self.rule_index.flush()
+
+    async def _make_request(
         self,
         endpoint: str,
         method: str = "GET",
         data: Optional[Dict] = None
     ) -> Dict:
-        """发送 HTTP 请求到 Cloudflare API"""
-        url = f"{self.BASE_URL}{endpoint}"
-        headers = {
-            "Authorization": f"Bearer {self.api_token}",
-            "Content-Type": "application/json"
-        }
-
+        """发送 HTTP 请求到 Cloudflare API，失败时抛出 CloudflareAPIError"""
+        url = f"{self.base_url}{endpoint}"
+        headers = self._request_headers()
         request_data = json.dumps(data).encode('utf-8') if data else None
-        req = urllib.request.Request(
-            url,
-            data=request_data,
-            headers=headers,
-            method=method
-        )
 
-        try:
-            with urllib.request.urlopen(req) as response:
-                return json.loads(response.read().decode('utf-8'))
-        except urllib.error.HTTPError as e:
-            error_body = e.read().decode('utf-8')
-            print(f"❌ API 请求失败: {e.code} {e.reason}")
-            print(f"详细信息: {error_body}")
-            sys.exit(1)
-        except Exception as e:
-            print(f"❌ 请求异常: {str(e)}")
-            sys.exit(1)
+        label = self.metrics.endpoint_label(method, endpoint)
+        sent = len(request_data or b"")
 
-    def generate_random_email(self, prefix: Optional[str] = None) -> str:
-        """生成随机邮箱地址
-        规则：
-        - prefix 为 None 或 "" 时，生成纯随机邮箱（8位小写字母）
-        - prefix 为其他值时，生成 prefix-xxxxxxxx 格式
-        """
-        random_str = ''.join(random.choices(string.ascii_lowercase, k=8))
-        if prefix is None or prefix == "":
-            local_part = random_str
-        else:
-            local_part = f"{prefix}-{random_str}"
-        return f"{local_part}@{self.email_domain}"
+        attempt = 0
+        while True:
+            await self.rate_limiter.acquire_async()
+            attempt += 1
+            if attempt > 1:
+                self.metrics.record_retry(label)
 
-    def generate_numbered_email(self, prefix: str, number: int, digits: int = 4) -> str:
-        """生成带编号的邮箱地址
-        规则：
-        - prefix: 前缀（如 'ul'）
-        - number: 编号（如 1）
-        - digits: 编号位数（如 4 表示 0001）
-        返回: prefix + 补零编号 @ domain （如: ul0001@domain.com）
-        """
-        number_str = str(number).zfill(digits)
-        local_part = f"{prefix}{number_str}"
-        return f"{local_part}@{self.email_domain}"
+            started = time.perf_counter()
+            try:
+                status, reason, response_headers, body = await self.transport.request(
+                    method, url, headers, request_data
+                )
+            except Exception as e:
+                self.metrics.record(label, None, time.perf_counter() - started, sent)
+                delay = self._retry_delay(method, attempt)
+                if delay is None:
+                    raise CloudflareAPIError(f"请求异常: {str(e)}") from e
+                await asyncio.sleep(delay)
+                continue
+            received = int(response_headers.get("content-length", len(body)))
+            self.metrics.record(label, status, time.perf_counter() - started, sent, received)
 
-    def create_routing_rule(
+            delay = self._retry_delay(method, attempt, status, response_headers, share_throttle=False)
+            if status == 429:
+                await self.rate_limiter.pause_shared_async(parse_retry_after(response_headers.get("retry-after")))
+            if delay is None:
+                return self._parse_response(status, reason, body)
+            await asyncio.sleep(delay)
+
+    async def create_routing_rule(
         self,
         email: str,
         description: Optional[str] = None,
         forward_to: Optional[str] = None
     ) -> Dict:
         """创建邮件路由规则"""
-        endpoint = f"/zones/{self.zone_id}/email/routing/rules"
+        rule_data = self._build_rule_data(email, description, forward_to)
+        response = await self._make_request(self._rules_endpoint(), method="POST", data=rule_data)
+        return self._created_rule(response)
 
-        rule_data = {
-            "actions": [
-                {
-                    "type": "forward",
-                    "value": [forward_to or self.forward_to]
-                }
-            ],
-            "matchers": [
-                {
-                    "type": "literal",
-                    "field": "to",
-                    "value": email
-                }
-            ],
-            "enabled": True,
-            "name": description or f"Temp email: {email}"
-        }
+    async def _fetch_rules_page(self, page: int, per_page: int) -> Optional[Tuple[List[Dict], Dict]]:
+        """获取单页路由规则，返回 (result, result_info)；API 返回失败时返回 None"""
+        return self._rules_page(await self._make_request(self._rules_page_endpoint(page, per_page)))
 
-        response = self._make_request(endpoint, method="POST", data=rule_data)
+    async def fetch_routing_rules(self) -> Tuple[List[Dict], bool]:
+        """列出所有邮件路由规则，同时返回是否完整获取
 
-        if response.get("success"):
-            return response.get("result", {})
+        与同步版相同：先取第 1 页，已知总页数时并发获取其余页面并按页码合并，否则逐页获取；
+        某页失败时只保留它之前的页面，超过 MAX_PAGES 或失败时视为不完整，不刷新本地快照
+        """
+        per_page = self.PER_PAGE
+        page_data = await self._fetch_rules_page(1, per_page)
+        if page_data is None:
+            return [], False
+        result, result_info = page_data
+        all_rules = list(result)
+        complete = True
+
+        total_pages = self._total_pages(result, result_info, per_page)
+        if total_pages is not None:
+            last_page = min(total_pages, self.MAX_PAGES)
+            complete = total_pages <= self.MAX_PAGES
+            semaphore = asyncio.Semaphore(self.page_concurrency)
+
+            async def fetch(page: int) -> Optional[Tuple[List[Dict], Dict]]:
+                async with semaphore:
+                    return await self._fetch_rules_page(page, per_page)
+
+            for page_data in await asyncio.gather(*(fetch(page) for page in range(2, last_page + 1))):
+                if page_data is None:
+                    complete = False
+                    break
+                all_rules.extend(page_data[0])
         else:
-            errors = response.get("errors", [])
-            print(f"❌ 创建路由规则失败: {errors}")
-            sys.exit(1)
+            # 未知总页数：逐页获取，直到返回不足一页
+            for page in range(2, self.MAX_PAGES + 1):
+                page_data = await self._fetch_rules_page(page, per_page)
+                if page_data is None:
+                    complete = False
+                    break
+                result, _ = page_data
+                all_rules.extend(result)
+                if len(result) < per_page:
+                    break
+            else:
+                complete = False
 
-    def list_routing_rules(self, verbose: bool = False) -> List[Dict]:
-        """列出所有邮件路由规则（支持分页）"""
-        all_rules = []
-        page = 1
-        per_page = 50  # Cloudflare API 每页最多 50 条
+        if complete:
+            self.rule_index.replace(all_rules)
+        return all_rules, complete
 
-        while True:
-            endpoint = f"/zones/{self.zone_id}/email/routing/rules?page={page}&per_page={per_page}"
-            response = self._make_request(endpoint)
+    async def list_routing_rules(self) -> List[Dict]:
+        """列出所有邮件路由规则（某页失败时返回已获取的部分）"""
+        return (await self.fetch_routing_rules())[0]
 
-            if not response.get("success"):
-                print(f"❌ 获取路由规则失败: {response.get('errors')}")
-                break
+    async def delete_routing_rule(self, rule_id: str) -> bool:
+        """删除邮件路由规则"""
+        response = await self._make_request(self._rules_endpoint(rule_id), method="DELETE")
 
-            result = response.get("result", [])
-            result_info = response.get("result_info", {})
+        success = response.get("success", False)
+        if success:
+            self.rule_index.remove_tag(rule_id)
+        return success
 
-            if verbose:
-                print(f"  第 {page} 页: 获取到 {len(result)} 条记录")
-                print(f"  result_info: {result_info}")
+    async def find_rule_by_email(self, email: str, refresh: bool = False) -> Optional[Dict]:
+        """根据邮箱地址查找路由规则（快照命中时不发请求，未命中时的处理与同步版相同）"""
+        if not refresh and self.rule_index.is_fresh():
+            entry = self.rule_index.get(email)
+            if entry:
+                return self.rule_index.to_rule(email, entry)
+            if self.rule_index.is_authoritative():
+                return None
 
-            if not result:
-                # 没有更多数据了
-                if verbose:
-                    print(f"  第 {page} 页没有数据，停止获取")
-                break
+        return self._match_rule(await self.list_routing_rules(), email)
 
-            all_rules.extend(result)
 
-            # 检查是否还有更多页 - 使用多种方式判断
-            # 方法1: 检查返回的记录数是否少于每页数量
-            if len(result) < per_page:
-                if verbose:
-                    print(f"  返回记录数 ({len(result)}) < 每页数量 ({per_page})，没有更多数据")
-                break
+def run_concurrently(
+    func: Callable,
+    items: Iterable,
+    concurrency: int = 1,
+    ordered: bool = True
+) -> Iterator[Tuple[object, object, Optional[Exception]]]:
+    """用有界线程池执行 func(item)，逐个产出 (item, 结果, 异常)
+    ordered=True 时按输入顺序产出，否则按完成顺序产出；
+    concurrency <= 1 时在当前线程顺序执行
+    """
+    if concurrency <= 1:
+        for item in items:
+            try:
+                yield item, func(item), None
+            except Exception as e:
+                yield item, None, e
+        return
 
-            # 方法2: 检查 result_info 中的分页信息
-            total_count = result_info.get("total_count")
-            if total_count is not None and len(all_rules) >= total_count:
-                if verbose:
-                    print(f"  已获取所有记录 ({len(all_rules)}/{total_count})")
-                break
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        if not ordered:
+            futures = {executor.submit(func, item): item for item in items}
+            for future in as_completed(futures):
+                try:
+                    yield futures[future], future.result(), None
+                except Exception as e:
+                    yield futures[future], None, e
+            return
 
-            total_pages = result_info.get("total_pages")
-            if total_pages is not None and page >= total_pages:
-                if verbose:
-                    print(f"  已到达最后一页 ({page}/{total_pages})")
+        # 按顺序产出时只预提交有限数量的任务，消费方处理慢时内存占用也保持平稳
+        window = deque()
+        items = iter(items)
+        for item in items:
+            window.append((item, executor.submit(func, item)))
+            if len(window) >= concurrency * 2:
                 break
+        while window:
+            item, future = window.popleft()
+            try:
+                result, error = future.result(), None
+            except Exception as e:
+                result, error = None, e
+            for next_item in items:
+                window.append((next_item, executor.submit(func, next_item)))
+                break
+            yield item, result, error
 
-            page += 1
 
-            # 安全限制：最多获取 100 页（防止无限循环）
-            if page > 100:
-                if verbose:
-                    print(f"  达到最大页数限制 (100 页)，停止获取")
-                break
+def apply_with_progress(
+    func: Callable[[str], object],
+    items: List[Tuple[str, str]],
+    verb: str,
+    concurrency: int = 1,
+    retry_rounds: int = 0
+) -> List[Tuple[str, str, Exception]]:
+    """并发对 (邮箱, 规则ID) 列表执行 func(规则ID)，实时显示进度并打印汇总
 
-        if verbose:
-            print(f"  ✅ 总共获取到 {len(all_rules)} 条路由规则")
+    verb 为进度与汇总中的动作名称（如“删除”）；失败项最多再重试 retry_rounds 轮。
+    返回最终仍失败的 (邮箱, 规则ID, 错误)
+    """
+    total = len(items)
+    done = 0
+    pending = items
+    failed: List[Tuple[str, str, Exception]] = []
+    started = time.monotonic()
 
-        return all_rules
+    for round_no in range(retry_rounds + 1):
+        if round_no:
+            print(f"\n🔁 第 {round_no} 轮重试: {len(pending)} 个失败项")
+        failed = []
+        for (email, rule_id), _, error in run_concurrently(
+            lambda item: func(item[1]), pending, concurrency, ordered=False
+        ):
+            elapsed = max(time.monotonic() - started, 1e-6)
+            if error is None:
+                done += 1
+                status = f"✅ {verb}: {email}"
+            else:
+                failed.append((email, rule_id, error))
+                status = f"❌ 失败: {email} (错误: {error})"
+            print(f"[{done + len(failed)}/{total}] {status}  ({done / elapsed:.1f} 个/秒)")
+        if not failed:
+            break
+        pending = [(email, rule_id) for email, rule_id, _ in failed]
 
-    def delete_routing_rule(self, rule_id: str) -> bool:
-        """删除邮件路由规则"""
-        endpoint = f"/zones/{self.zone_id}/email/routing/rules/{rule_id}"
-        response = self._make_request(endpoint, method="DELETE")
+    # 显示结果统计
+    elapsed = time.monotonic() - started
+    print(f"\n{'='*60}")
+    print(f"✅ 成功{verb}: {done} 个")
+    if failed:
+        print(f"❌ {verb}失败: {len(failed)} 个")
+        for email, rule_id, _ in failed:
+            print(f"   - {email} ({rule_id})")
+    print(f"📊 总计: {total} 个，耗时 {elapsed:.1f} 秒")
+    print(f"{'='*60}")
 
-        return response.get("success", False)
+    return failed
 
-    def find_rule_by_email(self, email: str) -> Optional[Dict]:
-        """根据邮箱地址查找路由规则"""
-        rules = self.list_routing_rules()
-        for rule in rules:
-            matchers = rule.get("matchers", [])
-            for matcher in matchers:
-                if matcher.get("field") == "to" and matcher.get("value") == email:
-                    return rule
-        return None
 
+def delete_rules(
+    manager: CloudflareEmailManager,
+    items: List[Tuple[str, str]],
+    concurrency: int = 1,
+    retry_rounds: int = 0,
+    on_deleted: Optional[Callable[[str], None]] = None
+) -> List[Tuple[str, str, Exception]]:
+    """并发删除 (邮箱, 规则ID) 列表，实时显示进度并打印汇总
 
-def create_email(args):
-    """创建临时邮箱（支持批量、指定转发目标、输出目录、编号）"""
-    manager = CloudflareEmailManager()
+    已不存在（404）的规则视为删除成功；失败项最多再重试 retry_rounds 轮。
+    on_deleted(规则ID) 在每条规则删除成功后立即调用（工作线程中）。
+    返回最终仍失败的 (邮箱, 规则ID, 错误)
+    """
+    def delete_one(rule_id: str) -> bool:
+        try:
+            if not manager.delete_routing_rule(rule_id):
+                raise CloudflareAPIError("API 返回 success=false")
+        except CloudflareAPIError as e:
+            if e.status != 404:
+                raise
+            manager.rule_index.remove_tag(rule_id)
+        if on_deleted is not None:
+            on_deleted(rule_id)
+        return True
 
-    # 目标转发地址（优先使用参数）
-    target_to = getattr(args, 'to', None) or manager.forward_to
+    return apply_with_progress(delete_one, items, "删除", concurrency, retry_rounds)
 
-    created: List[str] = []
-    count = max(1, int(getattr(args, 'count', 1) or 1))
 
-    # 检查是否使用编号模式
-    use_number = getattr(args, 'number', None) is not None or getattr(args, 'start', None) is not None
+def retarget_rules(
+    manager: CloudflareEmailManager,
+    rules: List[Dict],
+    forward_to: str,
+    concurrency: int = 1,
+    retry_rounds: int = 0
+) -> List[Tuple[str, str, Exception]]:
+    """并发把规则的转发目标原地改为 forward_to（每条规则一次 PUT），实时显示进度并打印汇总
+
+    返回最终仍失败的 (邮箱, 规则ID, 错误)
+    """
+    rules_by_tag = {rule.get("tag"): rule for rule in rules}
+
+    def retarget_one(rule_id: str) -> Dict:
+        return manager.update_routing_rule(rule_id, manager._retargeted_rule_data(rules_by_tag[rule_id], forward_to))
+
+    items = [(RuleIndex.rule_email(rule) or "N/A", rule.get("tag")) for rule in rules]
+    return apply_with_progress(retarget_one, items, "改向", concurrency, retry_rounds)
+
+
+def numbers_in_use(emails: Iterable[str], prefix: str, digits: int) -> List[int]:
+    """从现有地址中取出 prefix + 补零编号 格式的编号，返回升序列表
+
+    只统计编号恰好为 digits 位的用户名（digits=4 时 ul0001 计入，ul001、ul10000 不计入）；
+    不区分域名（多 zone 模式下用户名在各 zone 间唯一）
+    """
+    pattern = re.compile(rf"^{re.escape(prefix.lower())}(\d{{{digits}}})@")
+    numbers = set()
+    for email in emails:
+        match = pattern.match(email.lower())
+        if match:
+            numbers.add(int(match.group(1)))
+    return sorted(numbers)
 
+
+def allocate_numbers(
+    used: List[int],
+    count: int,
+    start: int = 1,
+    fill_gaps: bool = False,
+    digits: int = 4
+) -> List[int]:
+    """在有序的已用编号列表中分配 count 个空闲编号（不超过 digits 位）
+
+    - 默认（--next）：从 start 与已用最大编号 + 1 中较大者开始连续分配
+    - fill_gaps：从 start 开始依次填补空缺；用 bisect 定位起点，
+      每次跳到下一个已用编号，整段取出空闲区间
+    编号空间不足时抛出 ValueError
+    """
+    stop = 10 ** digits
+    if not fill_gaps:
+        first = max(start, used[-1] + 1) if used else start
+        if first + count > stop:
+            raise ValueError(f"{digits} 位编号不足以再连续分配 {count} 个（从 {first} 开始）")
+        return list(range(first, first + count))
+
+    allocated: List[int] = []
+    number = start
+    i = bisect.bisect_left(used, number)
+    while len(allocated) < count:
+        if i < len(used) and used[i] == number:
+            number += 1
+            i += 1
+            continue
+        # [number, 下一个已用编号) 都是空闲的
+        limit = used[i] if i < len(used) else stop
+        take = min(limit - number, count - len(allocated))
+        if take <= 0:
+            raise ValueError(f"{digits} 位编号中只剩 {len(allocated)} 个空闲编号，不足 {count} 个")
+        allocated.extend(range(number, number + take))
+        number += take
+    return allocated
+
+
+def plan_creates(
+    args,
+    manager: CloudflareEmailManager,
+    count: int,
+    expires_at: Optional[datetime]
+) -> Tuple[List[Tuple[str, str]], List[str]]:
+    """按参数生成全部待创建的 (邮箱, 描述)，返回 (计划, 已存在而跳过的邮箱)"""
+    # 检查是否使用编号模式（--next / --fill-gaps 自动分配空闲编号）
+    auto_number = getattr(args, 'next', False) or getattr(args, 'fill_gaps', False)
+    use_number = auto_number or getattr(args, 'number', None) is not None or getattr(args, 'start', None) is not None
+    if auto_number and getattr(args, 'number', None) is not None:
+        print("❌ --next / --fill-gaps 会自动分配编号，不能与 --number 同时使用")
+        sys.exit(1)
+
+    # 批量创建前先取一次现有地址集合，在本地排除冲突，不在必然失败的地址上浪费请求；
+    # 单个创建只使用未过期的本地快照（自动分配编号需要完整列表）
+    existing = manager.existing_emails(cached_only=count == 1 and not auto_number)
+
+    planned: List[Tuple[str, str]] = []
+    skipped: List[str] = []
     if use_number:
         # 编号模式
         if not args.prefix:
@@ -242,58 +2878,180 @@ def create_email(args):
 
         digits = getattr(args, 'digits', 4)
 
-        for i in range(count):
-            current_number = start_number + i
-            email = manager.generate_numbered_email(args.prefix, current_number, digits)
-
-            print(f"📧 正在创建临时邮箱: {email}")
-            print(f"📮 转发目标: {target_to}")
+        if auto_number:
+            used = numbers_in_use(existing, args.prefix, digits)
+            try:
+                numbers = allocate_numbers(used, count, start_number, getattr(args, 'fill_gaps', False), digits)
+            except ValueError as e:
+                print(f"❌ {e}，请使用 --fill-gaps 或增大 --digits")
+                sys.exit(1)
+            print(f"🔢 已占用 {len(used)} 个编号，分配: {', '.join(str(n).zfill(digits) for n in numbers[:10])}"
+                  + (" ..." if len(numbers) > 10 else ""))
+        else:
+            numbers = [start_number + i for i in range(count)]
 
-            # 创建路由规则
+        for email in manager.generate_numbered_emails(args.prefix, numbers, digits):
+            if email.lower() in existing:
+                skipped.append(email)
+                continue
             description = args.description or f"Numbered email created at {datetime.now().isoformat()}"
-            rule = manager.create_routing_rule(email, description, forward_to=target_to)
+            if expires_at:
+                description = ExpiryIndex.mark_name(description, expires_at)
+            planned.append((email, description))
+    else:
+        # 原有的随机模式
+        if args.email and count == 1:
+            email = args.email if '@' in args.email else f"{args.email}@{manager.email_domain}"
+            if email.lower() in existing:
+                print(f"❌ 邮箱 {email} 已存在")
+                sys.exit(1)
+            emails = [email]
+        else:
+            # 处理无前缀选项或自定义前缀
+            prefix = "" if getattr(args, 'no_prefix', False) else args.prefix
+            emails = manager.generate_unique_emails(count, prefix, existing)
 
-            print(f"✅ 临时邮箱创建成功!")
-            print(f"📧 邮箱地址: {email}")
-            print(f"🆔 规则 ID: {rule.get('tag')}")
-            print(f"📝 描述: {rule.get('name')}")
-            if count > 1:
-                print()  # 批量创建时添加空行分隔
+        for email in emails:
+            description = args.description or f"Temporary email created at {datetime.now().isoformat()}"
+            if expires_at:
+                description = ExpiryIndex.mark_name(description, expires_at)
+            planned.append((email, description))
 
-            # 保存到本地记录（可选）
-            save_to_history(email, rule.get('tag'), description)
-            created.append(email)
+    return planned, skipped
+
+
+def create_email(args):
+    """创建临时邮箱（支持批量、并发、指定转发目标、输出目录、编号）"""
+    manager = create_manager()
+    concurrency = max(1, int(getattr(args, 'concurrency', 1) or 1))
+    out_dir = getattr(args, 'output_dir', None)
+    created: List[str] = []
+
+    journal: Optional[BatchJournal] = None
+    resume_path = getattr(args, 'resume', None)
+    if resume_path:
+        # 从日志继续：不重新规划，也不列出 zone
+        try:
+            journal = BatchJournal.load(resume_path, "create", manager.state_key)
+        except (OSError, ValueError) as e:
+            print(f"❌ 无法读取日志 {resume_path}: {e}")
+            sys.exit(1)
+        target_to = journal.params["target"]
+        manager.verify_destinations([target_to])
+        expires_at = datetime.fromisoformat(journal.params["expires_at"]) if journal.params.get("expires_at") else None
+        out_dir = out_dir or journal.params.get("output_dir")
+        count = len(journal.items)
+        planned = [(item["email"], item["description"]) for item in journal.pending()]
+        skipped: List[str] = []
+        print(f"♻️  继续批量创建: 已完成 {len(journal.done)} 个，剩余 {len(planned)} 个\n")
     else:
-        # 原有的随机模式
-        for _ in range(count):
-            # 生成邮箱地址
-            if args.email and count == 1:
-                email = args.email if '@' in args.email else f"{args.email}@{manager.email_domain}"
-            else:
-                # 处理无前缀选项或自定义前缀
-                if getattr(args, 'no_prefix', False):
-                    email = manager.generate_random_email("")
-                else:
-                    email = manager.generate_random_email(args.prefix)
+        # 目标转发地址（优先使用参数），未验证时在发出任何创建请求前失败
+        target_to = getattr(args, 'to', None) or manager.forward_to
+        manager.verify_destinations([target_to])
+
+        # 过期时间（--ttl），记录在规则名称与本地过期索引中，由 reap 删除
+        ttl = getattr(args, 'ttl', None)
+        expires_at = datetime.now() + ttl if ttl else None
 
+        count = max(1, int(getattr(args, 'count', 1) or 1))
+        planned, skipped = plan_creates(args, manager, count, expires_at)
+        if count > 1 and planned:
+            journal = BatchJournal.start("create", manager.state_key, {
+                "target": target_to,
+                "expires_at": expires_at.isoformat() if expires_at else None,
+                "output_dir": out_dir,
+            }, [{"email": email, "description": description} for email, description in planned])
+
+    for email in skipped:
+        print(f"⏭️  已存在，跳过: {email}")
+    if skipped:
+        print()
+
+    if concurrency > 1:
+        print(f"⚡ 并发创建 {len(planned)} 个邮箱（并发数: {concurrency}）")
+        print(f"📮 转发目标: {target_to}\n")
+
+    def create_one(item: Tuple[str, str]) -> Dict:
+        email, description = item
+        if concurrency <= 1:
             print(f"📧 正在创建临时邮箱: {email}")
             print(f"📮 转发目标: {target_to}")
-
-            # 创建路由规则
-            description = args.description or f"Temporary email created at {datetime.now().isoformat()}"
+        try:
             rule = manager.create_routing_rule(email, description, forward_to=target_to)
+        except CloudflareAPIError:
+            if not resume_path:
+                raise
+            # 上次运行可能已创建成功、但在写入日志前被中断（本地快照可能没有记录，重新列出）
+            rule = manager.find_rule_by_email(email, refresh=True)
+            if rule is None or RuleIndex.summarize(rule)["target"] != target_to:
+                raise
+        if journal is not None:
+            journal.complete(email, tag=rule.get("tag"))
+        return rule
+
+    # 结果按编号/生成顺序输出，单个失败不影响其余邮箱
+    history = HistoryStore()
+    expiring: List[Tuple[float, str, str]] = []
+    failed: List[Tuple[str, Exception]] = []
+    # 本次写入历史记录的邮箱，写入成功后在日志中标记为 committed
+    recorded: List[str] = []
+    if resume_path:
+        # 补记上次已完成、但没来得及写入历史记录的项目
+        for item in journal.uncommitted():
+            history.add(item["email"], item.get("tag"), item["description"], target=target_to, expires_at=expires_at)
+            if expires_at:
+                expiring.append((expires_at.timestamp(), item["email"], item.get("tag")))
+            recorded.append(item["email"])
+    try:
+        for (email, description), rule, error in run_concurrently(create_one, planned, concurrency):
+            if error is not None:
+                print(f"❌ 创建失败: {email}")
+                print(f"   {error}")
+                if count > 1:
+                    print()
+                failed.append((email, error))
+                continue
 
             print(f"✅ 临时邮箱创建成功!")
             print(f"📧 邮箱地址: {email}")
             print(f"🆔 规则 ID: {rule.get('tag')}")
             print(f"📝 描述: {rule.get('name')}")
+            if expires_at:
+                print(f"⏰ 到期时间: {expires_at.isoformat(timespec='seconds')}")
+            if count > 1:
+                print()  # 批量创建时添加空行分隔
 
-            # 保存到本地记录（可选）
-            save_to_history(email, rule.get('tag'), description)
+            # 保存到本地记录（本次运行结束时统一写入）
+            history.add(email, rule.get('tag'), description, target=target_to, expires_at=expires_at)
+            if expires_at:
+                expiring.append((expires_at.timestamp(), email, rule.get('tag')))
+            recorded.append(email)
             created.append(email)
+    finally:
+        # 历史记录与过期索引都写入成功后才在日志中标记，否则 --resume 时补记
+        committed = True
+        try:
+            history.flush()
+        except Exception:
+            # 静默失败，不影响主要功能
+            committed = False
+        if expiring:
+            # 过期索引是 reap 的唯一依据，写入失败需要提示
+            try:
+                ExpiryIndex(manager.state_key).add(expiring)
+            except Exception as e:
+                committed = False
+                print(f"⚠️  写入过期索引失败: {e}（可用 reap --scan 从规则名称重建）")
+        if journal is not None:
+            if committed:
+                journal.commit(recorded)
+            journal.close()
+
+    if journal is not None:
+        # 输出文件包含整批（含之前运行）已成功的邮箱
+        created = [item["email"] for item in journal.items if item["email"] in journal.done]
 
     # 若指定输出目录，则把生成的邮箱写入 以目标邮箱命名的 .txt 文件
-    out_dir = getattr(args, 'output_dir', None)
     if out_dir:
         try:
             os.makedirs(out_dir, exist_ok=True)
@@ -306,55 +3064,207 @@ def create_email(args):
             # 静默失败，不影响主流程
             pass
 
+    if count > 1:
+        print(f"{'='*60}")
+        print(f"✅ 成功创建: {len(created)} 个")
+        if skipped:
+            print(f"⏭️  已存在跳过: {len(skipped)} 个")
+        if failed:
+            print(f"❌ 创建失败: {len(failed)} 个")
+            for email, _ in failed:
+                print(f"   - {email}")
+        print(f"{'='*60}")
+
+    if failed:
+        sys.exit(1)
+
 
 def list_emails(args):
-    """列出所有临时邮箱"""
-    manager = CloudflareEmailManager()
+    """列出所有临时邮箱（边获取边输出）"""
+    manager = create_manager()
+
+    output_format = getattr(args, 'format', 'table') or 'table'
+    if getattr(args, 'watch', False):
+        if output_format == 'csv':
+            print("❌ --watch 只支持 table 与 jsonl 格式")
+            sys.exit(1)
+        return watch_rules(manager, args.interval, output_format, getattr(args, 'resync', 0) or 0)
+    if output_format != 'table':
+        return export_rules(manager, output_format)
+
+    # 检查是否启用详细模式
+    verbose = getattr(args, 'verbose', False)
+
+    print("📋 正在获取所有邮件路由规则...")
+    if verbose:
+        print("🔍 启用详细模式，显示分页信息：")
+
+    idx = 0
+    for idx, rule in enumerate(manager.iter_routing_rules(verbose=verbose), 1):
+        if idx == 1:
+            print_rule_table_header()
+        print_rule_row(idx, rule)
+
+    if idx == 0:
+        print("📭 没有找到任何路由规则")
+        return
+
+    print(f"\n共找到 {idx} 条路由规则")
+
+
+def print_rule_table_header():
+    print()
+    print(f"{'序号':<4} {'邮箱地址':<40} {'规则ID':<20} {'状态':<8} {'创建时间'}")
+    print("-" * 100)
+
+
+def print_rule_row(idx: int, rule: Dict):
+    email = RuleIndex.rule_email(rule) or "N/A"
+    rule_id = rule.get("tag", "N/A")[:18]
+    status = "✅ 启用" if rule.get("enabled") else "❌ 禁用"
+    created = rule.get("created", "N/A")
+    print(f"{idx:<4} {email:<40} {rule_id:<20} {status:<8} {created}")
+
+
+def diff_rules(old: Dict[str, Dict], new: Dict[str, Dict]) -> Tuple[List[Dict], List[Dict], List[Tuple[Dict, Dict]]]:
+    """比较两个 {规则ID: 规则} 快照，返回 (新增, 删除, [(旧, 新)] 有变化的规则)"""
+    added = [rule for tag, rule in new.items() if tag not in old]
+    removed = [rule for tag, rule in old.items() if tag not in new]
+    changed = [
+        (old[tag], rule) for tag, rule in new.items()
+        if tag in old and (
+            RuleIndex.summarize(old[tag]) != RuleIndex.summarize(rule)
+            or RuleIndex.rule_email(old[tag]) != RuleIndex.rule_email(rule)
+        )
+    ]
+    return added, removed, changed
+
+
+def describe_rule_change(old: Dict, new: Dict) -> str:
+    """用一行文字描述规则的变化"""
+    before, after = RuleIndex.summarize(old), RuleIndex.summarize(new)
+    parts = []
+    if RuleIndex.rule_email(old) != RuleIndex.rule_email(new):
+        parts.append(f"地址 {RuleIndex.rule_email(old)} → {RuleIndex.rule_email(new)}")
+    if before["target"] != after["target"]:
+        parts.append(f"转发目标 {before['target']} → {after['target']}")
+    if before["enabled"] != after["enabled"]:
+        parts.append("已启用" if after["enabled"] else "已禁用")
+    if before["name"] != after["name"]:
+        parts.append(f"描述 “{before['name']}” → “{after['name']}”")
+    return "；".join(parts) or "规则已更新"
+
+
+def watch_rules(manager: CloudflareEmailManager, interval: float, output_format: str = 'table', resync: int = 0):
+    """持续监视路由规则，只输出新增、删除与变化的规则（Ctrl-C 退出）
 
-    # 检查是否启用详细模式
-    verbose = getattr(args, 'verbose', False)
+    每次只探测第 1 页与 total_count，信号不变时不再请求；变化时才完整获取并与内存中的上一份快照比较。
+    第 1 页之后的规则被修改、且总数不变时探测不到，可用 resync 每隔 N 次强制完整获取一次
+    """
+    def fetch(first_page: object) -> Dict[str, Dict]:
+        # 沿用探测到的第 1 页，只获取之后的页面（第 1 页已是完整列表时不再请求）
+        rules, finished = manager.fetch_routing_rules(first_page=first_page)
+        if not finished:
+            # 列表不完整时比较会误报删除，保留上一份快照与信号
+            raise CloudflareAPIError("未能完整获取路由规则")
+        return {rule.get("tag"): rule for rule in rules}
 
-    print("📋 正在获取所有邮件路由规则...")
-    if verbose:
-        print("🔍 启用详细模式，显示分页信息：")
+    def emit(event: str, rule: Dict, previous: Optional[Dict] = None):
+        now = datetime.now().isoformat(timespec='seconds')
+        if output_format == 'jsonl':
+            record = {"time": now, "event": event, "rule": rule}
+            if previous is not None:
+                record["previous"] = previous
+            print(json.dumps(record, ensure_ascii=False), flush=True)
+            return
+        email = RuleIndex.rule_email(rule)
+        if event == "added":
+            line = f"➕ {email} → {RuleIndex.summarize(rule)['target']}"
+        elif event == "removed":
+            line = f"➖ {email}"
+        else:
+            line = f"✏️  {email}: {describe_rule_change(previous, rule)}"
+        print(f"[{now[11:]}] {line}", flush=True)
 
-    rules = manager.list_routing_rules(verbose=verbose)
+    signature, first_page = manager.probe_rules()
+    snapshot = fetch(first_page)
+    if output_format == 'jsonl':
+        for rule in snapshot.values():
+            emit("added", rule)
+    else:
+        if snapshot:
+            print_rule_table_header()
+            for idx, rule in enumerate(snapshot.values(), 1):
+                print_rule_row(idx, rule)
+        print(f"\n👀 正在监视 {len(snapshot)} 条路由规则（每 {interval:g} 秒检查一次，Ctrl-C 退出）", flush=True)
 
-    if not rules:
-        print("📭 没有找到任何路由规则")
-        return
+    polls = 0
+    try:
+        while True:
+            time.sleep(interval)
+            polls += 1
+            try:
+                new_signature, first_page = manager.probe_rules()
+                if new_signature == signature and not (resync and polls % resync == 0):
+                    continue
+                current = fetch(first_page)
+            except CloudflareAPIError as e:
+                # 长时间运行的监视不因单次失败退出，下次继续检查
+                print(f"⚠️  检查失败，将在下次重试: {e}", file=sys.stderr, flush=True)
+                continue
+            signature = new_signature
 
-    print(f"\n找到 {len(rules)} 条路由规则:\n")
-    print(f"{'序号':<4} {'邮箱地址':<40} {'规则ID':<20} {'状态':<8} {'创建时间'}")
-    print("-" * 100)
+            added, removed, changed = diff_rules(snapshot, current)
+            for rule in added:
+                emit("added", rule)
+            for rule in removed:
+                emit("removed", rule)
+            for old, new in changed:
+                emit("changed", new, old)
+            snapshot = current
+    except KeyboardInterrupt:
+        if output_format != 'jsonl':
+            print("\n👋 已停止监视")
 
-    for idx, rule in enumerate(rules, 1):
-        email = "N/A"
-        for matcher in rule.get("matchers", []):
-            if matcher.get("field") == "to":
-                email = matcher.get("value", "N/A")
-                break
 
-        rule_id = rule.get("tag", "N/A")[:18]
-        status = "✅ 启用" if rule.get("enabled") else "❌ 禁用"
-        created = rule.get("created", "N/A")
+def export_rules(manager: CloudflareEmailManager, output_format: str):
+    """以 jsonl / csv 格式逐条输出规则，便于管道处理（不输出提示信息）"""
+    if output_format == 'jsonl':
+        for rule in manager.iter_routing_rules():
+            print(json.dumps(rule, ensure_ascii=False), flush=True)
+        return
 
-        print(f"{idx:<4} {email:<40} {rule_id:<20} {status:<8} {created}")
+    writer = csv.writer(sys.stdout)
+    writer.writerow(["email", "rule_id", "target", "enabled", "created", "name"])
+    for rule in manager.iter_routing_rules():
+        entry = RuleIndex.summarize(rule)
+        writer.writerow([
+            RuleIndex.rule_email(rule) or "",
+            entry["tag"] or "",
+            entry["target"] or "",
+            "true" if entry["enabled"] else "false",
+            entry["created"] or "",
+            entry["name"] or "",
+        ])
+        sys.stdout.flush()
 
 
 def delete_email(args):
     """删除临时邮箱"""
-    manager = CloudflareEmailManager()
+    manager = create_manager()
 
-    # 检查是否为批量删除模式
-    if getattr(args, 'batch', False):
+    # 检查是否为批量删除模式（--resume 继续中断的批量删除）
+    if getattr(args, 'batch', False) or getattr(args, 'resume', None):
         return delete_batch_emails(args, manager)
 
     email = args.email
+    if not email:
+        print("❌ 请指定要删除的邮箱地址")
+        sys.exit(1)
 
     # 查找规则
     print(f"🔍 正在查找邮箱: {email}")
-    rule = manager.find_rule_by_email(email)
+    rule = manager.find_rule_by_email(email, refresh=getattr(args, 'refresh', False))
 
     if not rule:
         print(f"❌ 未找到邮箱 {email} 对应的路由规则")
@@ -372,7 +3282,15 @@ def delete_email(args):
 
     # 删除规则
     print(f"🗑️  正在删除...")
-    success = manager.delete_routing_rule(rule_id)
+    try:
+        success = manager.delete_routing_rule(rule_id)
+    except CloudflareAPIError as e:
+        if e.status != 404:
+            raise
+        # 规则已在别处被删除，本地快照过期
+        manager.rule_index.remove_tag(rule_id)
+        print(f"❌ 规则 {rule_id} 已不存在，请使用 --refresh 重新查找")
+        sys.exit(1)
 
     if success:
         print(f"✅ 成功删除邮箱: {email}")
@@ -383,7 +3301,22 @@ def delete_email(args):
 
 def delete_batch_emails(args, manager: CloudflareEmailManager):
     """批量删除符合通配符规则的邮箱"""
+    concurrency = max(1, int(getattr(args, 'concurrency', 1) or 1))
+    if getattr(args, 'resume', None):
+        # 从日志继续：直接删除剩余规则，不重新列出 zone，也不再确认
+        try:
+            journal = BatchJournal.load(args.resume, "delete", manager.state_key)
+        except (OSError, ValueError) as e:
+            print(f"❌ 无法读取日志 {args.resume}: {e}")
+            sys.exit(1)
+        items = [(item['email'], item['tag']) for item in journal.pending()]
+        print(f"♻️  继续批量删除 '{journal.params.get('pattern')}': 已完成 {len(journal.done)} 个，剩余 {len(items)} 个")
+        return run_batch_delete(args, manager, journal, items, concurrency)
+
     pattern = args.email  # 在批量模式下，email 参数实际是通配符模式
+    if not pattern:
+        print("❌ 请指定通配符模式")
+        sys.exit(1)
 
     print(f"🔍 正在查找匹配 '{pattern}' 的邮箱...")
 
@@ -432,37 +3365,38 @@ def delete_batch_emails(args, manager: CloudflareEmailManager):
             return
 
     # 批量删除
-    print(f"\n🗑️  开始批量删除...")
-    deleted = 0
-    failed = 0
-
-    for item in matched_rules:
-        email = item['email']
-        rule_id = item['rule'].get('tag')
+    items = [(item['email'], item['rule'].get('tag')) for item in matched_rules]
+    journal = BatchJournal.start(
+        "delete", manager.state_key, {"pattern": pattern},
+        [{"email": email, "tag": tag} for email, tag in items]
+    )
+    run_batch_delete(args, manager, journal, items, concurrency)
 
-        try:
-            if manager.delete_routing_rule(rule_id):
-                print(f"✅ 删除: {email}")
-                deleted += 1
-            else:
-                print(f"❌ 失败: {email}")
-                failed += 1
-        except Exception as e:
-            print(f"❌ 失败: {email} (错误: {e})")
-            failed += 1
 
-    # 显示结果统计
-    print(f"\n{'='*60}")
-    print(f"✅ 成功删除: {deleted} 个")
-    if failed > 0:
-        print(f"❌ 删除失败: {failed} 个")
-    print(f"📊 总计: {deleted + failed} 个")
-    print(f"{'='*60}")
+def run_batch_delete(
+    args,
+    manager: CloudflareEmailManager,
+    journal: BatchJournal,
+    items: List[Tuple[str, str]],
+    concurrency: int
+):
+    """执行批量删除，每删除一条规则立即记入日志"""
+    emails = {tag: email for email, tag in items}
+    print(f"\n🗑️  开始批量删除（并发数: {concurrency}）...")
+    try:
+        failed = delete_rules(
+            manager, items, concurrency, getattr(args, 'retry_failed', 0) or 0,
+            on_deleted=lambda tag: journal.complete(emails[tag])
+        )
+    finally:
+        journal.close()
+    if failed:
+        sys.exit(1)
 
 
 def cleanup_emails(args):
     """清理所有临时邮箱"""
-    manager = CloudflareEmailManager()
+    manager = create_manager()
 
     print("🔍 正在获取所有路由规则...")
     rules = manager.list_routing_rules()
@@ -479,49 +3413,878 @@ def cleanup_emails(args):
             print("❌ 取消清理")
             return
 
-    deleted = 0
+    items = []
     for rule in rules:
-        rule_id = rule.get("tag")
         email = "N/A"
         for matcher in rule.get("matchers", []):
             if matcher.get("field") == "to":
                 email = matcher.get("value", "N/A")
                 break
+        items.append((email, rule.get("tag")))
+
+    concurrency = max(1, int(getattr(args, 'concurrency', 1) or 1))
+    print(f"🗑️  开始清理（并发数: {concurrency}）...")
+    failed = delete_rules(manager, items, concurrency, getattr(args, 'retry_failed', 0) or 0)
+    if failed:
+        sys.exit(1)
+
+
+def retarget_emails(args):
+    """批量修改转发目标：按用户名通配符和/或当前转发目标选择规则，通过 PUT 原地更新"""
+    if not args.pattern and not args.from_target:
+        print("❌ 请至少指定 --pattern 或 --from 之一")
+        sys.exit(1)
+
+    manager = create_manager()
+    manager.verify_destinations([args.to])
+    conditions = []
+    if args.pattern:
+        conditions.append(f"用户名匹配 '{args.pattern}'")
+    if args.from_target:
+        conditions.append(f"当前转发到 {args.from_target}")
+    print(f"🔍 正在查找{' 且 '.join(conditions)} 的邮箱...")
+
+    matched = []
+    unchanged = 0
+    for rule in manager.list_routing_rules():
+        email = RuleIndex.rule_email(rule)
+        if not email:
+            continue
+        target = RuleIndex.summarize(rule)["target"]
+        if args.pattern and not fnmatch.fnmatch(email.split('@')[0], args.pattern):
+            continue
+        if args.from_target and (target or "").lower() != args.from_target.lower():
+            continue
+        if target == args.to:
+            unchanged += 1
+            continue
+        matched.append(rule)
+
+    if not matched:
+        print(f"📭 没有需要修改的邮箱" + (f"（{unchanged} 个已转发到 {args.to}）" if unchanged else ""))
+        return
+
+    print(f"\n找到 {len(matched)} 个需要修改的邮箱：")
+    print("-" * 60)
+    for idx, rule in enumerate(matched, 1):
+        print(f"{idx:<4} {RuleIndex.rule_email(rule):<40} {RuleIndex.summarize(rule)['target']} → {args.to}")
+    print("-" * 60)
+    if unchanged:
+        print(f"⏭️  已转发到 {args.to}，跳过: {unchanged} 个")
+
+    if args.dry_run:
+        print("🔎 --dry-run：未执行任何变更")
+        return
+    if not args.yes:
+        confirm = input(f"\n⚠️  确定要把这 {len(matched)} 个邮箱改为转发到 {args.to} 吗? (y/N): ")
+        if confirm.lower() != 'y':
+            print("❌ 取消修改")
+            return
+
+    concurrency = max(1, int(getattr(args, 'concurrency', 1) or 1))
+    print(f"\n🔄 开始修改转发目标（并发数: {concurrency}）...")
+    failed = retarget_rules(manager, matched, args.to, concurrency, getattr(args, 'retry_failed', 0) or 0)
+    if failed:
+        sys.exit(1)
+
+
+def reap_emails(args):
+    """删除已到期的邮箱：只读本地过期索引找到到期规则，没有到期项时不发任何请求"""
+    manager = create_manager()
+    index = ExpiryIndex(manager.state_key)
+
+    if args.scan:
+        # 从规则名称重建索引（需要列出一次全部规则）
+        print("🔍 正在从规则名称重建过期索引...")
+        items = []
+        for rule in manager.list_routing_rules():
+            expires = ExpiryIndex.expiry_from_name(rule.get("name"))
+            email = RuleIndex.rule_email(rule)
+            if expires is not None and email:
+                items.append((expires, email, rule.get("tag")))
+        index.replace(items)
+        print(f"✅ 已登记 {len(items)} 个带过期时间的邮箱")
+
+    due = index.due()
+    if not due:
+        if not args.quiet:
+            next_expiry = index.next_expiry()
+            if next_expiry is None:
+                print("✅ 没有带过期时间的邮箱")
+            else:
+                print(f"✅ 没有到期的邮箱（下一个到期: {datetime.fromtimestamp(next_expiry).isoformat(timespec='seconds')}）")
+        return
+
+    print(f"⏰ 找到 {len(due)} 个已到期的邮箱")
+    if args.dry_run:
+        for expires, email, _ in due:
+            print(f"   - {email}（{datetime.fromtimestamp(expires).isoformat(timespec='seconds')} 到期）")
+        print("🔎 --dry-run：未执行任何变更")
+        return
+
+    concurrency = max(1, int(getattr(args, 'concurrency', 1) or 1))
+    items = [(email, tag) for _, email, tag in due]
+    failed = delete_rules(manager, items, concurrency, getattr(args, 'retry_failed', 0) or 0)
+    # 删除成功（或规则已不存在）的移出索引，失败的留到下次
+    failed_tags = {tag for _, tag, _ in failed}
+    index.remove(tag for _, tag in items if tag not in failed_tags)
+    if failed:
+        sys.exit(1)
+
+
+def load_desired_state(path: str, manager: BaseEmailManager) -> Dict[str, str]:
+    """读取期望状态文件，返回 {邮箱(小写): 转发目标}
+
+    支持两种格式：
+    - JSON 对象：{"ul0001": "user1@qq.com", "ul0002@domain.com": null}
+    - 文本：每行 "邮箱 [转发目标]"，# 开头为注释
+    省略域名时使用 EMAIL_DOMAIN，省略转发目标时使用 FORWARD_TO_EMAIL
+    """
+    with open(path, 'r', encoding='utf-8') as f:
+        content = f.read()
+
+    pairs: List[Tuple[str, Optional[str]]] = []
+    if content.lstrip().startswith("{"):
+        pairs = list(json.loads(content).items())
+    else:
+        for line in content.splitlines():
+            line = line.split("#", 1)[0].strip()
+            if line:
+                fields = line.split()
+                pairs.append((fields[0], fields[1] if len(fields) > 1 else None))
+
+    desired: Dict[str, str] = {}
+    for email, target in pairs:
+        email = email if '@' in email else f"{email}@{manager.email_domain}"
+        desired[email.lower()] = target or manager.forward_to
+    return desired
+
+
+def sync_emails(args):
+    """按期望状态文件同步路由规则：只执行必要的创建、删除与转发目标更新"""
+    manager = create_manager()
+    desired = load_desired_state(args.file, manager)
+    scope = getattr(args, 'scope', None) or '*'
+
+    print(f"🔍 正在获取当前路由规则...")
+    current: Dict[str, Dict] = {}
+    for rule in manager.list_routing_rules():
+        email = RuleIndex.rule_email(rule)
+        if email:
+            current[email.lower()] = rule
+
+    # 计算差异
+    to_create = [(email, target) for email, target in desired.items() if email not in current]
+    to_update = []
+    for email, target in desired.items():
+        rule = current.get(email)
+        if rule is None:
+            continue
+        entry = RuleIndex.summarize(rule)
+        if entry["target"] != target or not entry["enabled"]:
+            to_update.append((email, target, rule))
+    to_delete = [] if getattr(args, 'no_delete', False) else [
+        (email, rule) for email, rule in current.items()
+        if email not in desired and fnmatch.fnmatch(email.split('@')[0], scope)
+    ]
+    unchanged = len(desired) - len(to_create) - len(to_update)
 
-        print(f"🗑️  删除: {email} ({rule_id[:18]}...)")
-        if manager.delete_routing_rule(rule_id):
-            deleted += 1
+    print(f"\n📋 同步计划（期望 {len(desired)} 个，当前 {len(current)} 个）:")
+    print("-" * 60)
+    for email, target in to_create:
+        print(f"  + {email} → {target}")
+    for email, target, rule in to_update:
+        old_target = RuleIndex.summarize(rule)["target"]
+        print(f"  ~ {email}: {old_target} → {target}")
+    for email, _ in to_delete:
+        print(f"  - {email}")
+    print("-" * 60)
+    print(f"创建 {len(to_create)} | 更新 {len(to_update)} | 删除 {len(to_delete)} | 不变 {unchanged}")
 
-    print(f"\n✅ 成功删除 {deleted}/{len(rules)} 条规则")
+    if not (to_create or to_update or to_delete):
+        print("✅ 已是期望状态，无需变更")
+        return
+    if getattr(args, 'dry_run', False):
+        print("🔎 --dry-run：未执行任何变更")
+        return
+    if to_delete and not args.yes:
+        confirm = input(f"\n⚠️  将删除 {len(to_delete)} 条不在期望状态中的规则，确定继续吗? (y/N): ")
+        if confirm.lower() != 'y':
+            print("❌ 取消同步")
+            return
 
+    manager.verify_destinations([target for _, target in to_create] + [target for _, target, _ in to_update])
+    operations = (
+        [("create", email, target, None) for email, target in to_create]
+        + [("update", email, target, rule) for email, target, rule in to_update]
+        + [("delete", email, None, rule) for email, rule in to_delete]
+    )
+    description = f"Synced email created at {datetime.now().isoformat()}"
 
-def save_to_history(email: str, rule_id: str, description: str):
-    """保存到本地历史记录"""
-    history_file = "temp_emails.json"
+    def apply(operation: Tuple[str, str, Optional[str], Optional[Dict]]) -> Dict:
+        action, email, target, rule = operation
+        if action == "create":
+            return manager.create_routing_rule(email, description, forward_to=target)
+        if action == "update":
+            return manager.update_routing_rule(rule["tag"], manager._retargeted_rule_data(rule, target, enabled=True))
+        if not manager.delete_routing_rule(rule["tag"]):
+            raise CloudflareAPIError("API 返回 success=false")
+        return rule
 
+    concurrency = max(1, int(getattr(args, 'concurrency', 1) or 1))
+    symbols = {"create": "+", "update": "~", "delete": "-"}
+    history = HistoryStore()
+    failed = []
+    print(f"\n🔄 开始同步（并发数: {concurrency}）...")
     try:
-        if os.path.exists(history_file):
-            with open(history_file, 'r', encoding='utf-8') as f:
-                history = json.load(f)
-        else:
-            history = []
+        for (action, email, target, _), rule, error in run_concurrently(apply, operations, concurrency, ordered=False):
+            if error is not None:
+                failed.append((action, email, error))
+                print(f"❌ {symbols[action]} {email} (错误: {error})")
+                continue
+            print(f"✅ {symbols[action]} {email}")
+            if action == "create":
+                history.add(email, rule.get('tag'), description, target=target)
+    finally:
+        try:
+            history.flush()
+        except Exception:
+            # 静默失败，不影响主要功能
+            pass
 
-        history.append({
-            "email": email,
-            "rule_id": rule_id,
-            "description": description,
-            "created_at": datetime.now().isoformat()
-        })
+    print(f"\n{'='*60}")
+    print(f"✅ 成功: {len(operations) - len(failed)} 个操作")
+    if failed:
+        print(f"❌ 失败: {len(failed)} 个操作")
+        for action, email, _ in failed:
+            print(f"   {symbols[action]} {email}")
+    print(f"{'='*60}")
+    if failed:
+        sys.exit(1)
+
+
+def fill_pool(
+    manager: CloudflareEmailManager,
+    pool: AddressPool,
+    concurrency: int = 4,
+    claimed: bool = False
+) -> Tuple[int, int]:
+    """把地址池补充到目标容量，返回 (成功数, 失败数)
+
+    先领取补充标记（claimed=True 表示调用方已领取，如 lease 启动的后台补充），
+    已有补充正在运行时直接返回，避免两个补充同时进行、超出目标容量；结束时清除标记
+    """
+    if not claimed and not pool.claim_fill(when_low=False):
+        print("⏳ 已有补充正在进行，本次跳过")
+        return 0, 0
+    try:
+        # 列出一次现有规则：丢弃已被删除的待租用地址，并排除新地址冲突
+        live = manager.existing_emails()
+        dropped = pool.retain(live)
+        for entry in dropped:
+            print(f"🗑️  规则已不存在，移出地址池: {entry['email']}")
+
+        state = pool.status()
+        missing = state["size"] - len(state["ready"])
+        if missing <= 0:
+            print(f"✅ 地址池已满（{len(state['ready'])}/{state['size']}）")
+            return 0, 0
+
+        manager.verify_destinations([manager.forward_to])
+        emails = manager.generate_unique_emails(missing, state["prefix"], live | pool.emails())
+        description = f"Pool email created at {datetime.now().isoformat()}"
+        print(f"📦 补充地址池: {missing} 个（并发数: {concurrency}）")
 
-        with open(history_file, 'w', encoding='utf-8') as f:
-            json.dump(history, f, indent=2, ensure_ascii=False)
-    except Exception as e:
-        # 静默失败，不影响主要功能
+        def create_one(email: str) -> Dict:
+            return manager.create_routing_rule(email, description)
+
+        created = failed = 0
+        for email, rule, error in run_concurrently(create_one, emails, concurrency, ordered=False):
+            if error is not None:
+                failed += 1
+                print(f"❌ 创建失败: {email} ({error})")
+                continue
+            # 每创建一个就写入状态，中途退出也不会丢失已创建的规则
+            pool.add_ready({
+                "email": email, "tag": rule.get("tag"), "name": rule.get("name") or description,
+                "created_at": datetime.now().isoformat()
+            })
+            created += 1
+            print(f"✅ {email}")
+        return created, failed
+    finally:
+        pool.release_fill()
+
+
+def start_background_fill():
+    """启动独立的后台进程补充地址池，当前命令立即返回"""
+    # 补充标记已由 lease 领取
+    command = [sys.executable, os.path.abspath(__file__), "pool", "fill", "--claimed"]
+    options = {"stdin": subprocess.DEVNULL, "stdout": subprocess.DEVNULL, "stderr": subprocess.DEVNULL}
+    if os.name == 'nt':
+        options["creationflags"] = subprocess.DETACHED_PROCESS | subprocess.CREATE_NEW_PROCESS_GROUP
+    else:
+        options["start_new_session"] = True
+    try:
+        subprocess.Popen(command, **options)
+    except OSError:
+        # 后台补充失败不影响本次租用，下次 lease 会再尝试
         pass
 
 
-def main():
-    """主函数"""
+def pool_command(args):
+    """地址池：fill 预先创建、lease 租用、release 回收、status 查看、drain 清空"""
+    manager = create_manager()
+    pool = AddressPool(manager.state_key)
+    action = args.pool_action
+
+    def pooled_rule(entry: Dict, target: Optional[str]) -> Dict:
+        """还原池中地址的规则，PUT 时保留名称（描述）"""
+        if "name" not in entry:
+            # 旧版地址池没有记录名称，从快照或 API 获取
+            rule = manager.find_rule_by_email(entry["email"])
+            if rule is not None:
+                return rule
+        return RuleIndex.to_rule(entry["email"], {"tag": entry["tag"], "target": target, "name": entry.get("name")})
+
+    if action == 'fill':
+        pool.configure(size=args.size, prefix=args.prefix)
+        created, failed = fill_pool(manager, pool, max(1, args.concurrency), getattr(args, 'claimed', False))
+        state = pool.status()
+        print(f"📦 地址池: 可用 {len(state['ready'])}/{state['size']}，已租出 {len(state['leased'])}")
+        if failed:
+            sys.exit(1)
+
+    elif action == 'lease':
+        target = args.to or manager.forward_to
+        if target != manager.forward_to:
+            # 先预检目标，避免租出地址后才发现无法转发（缓存命中时不发请求）
+            manager.verify_destinations([target])
+        entry = pool.lease(target)
+        if entry is None:
+            print("❌ 地址池为空，请先运行: pool fill --size N")
+            sys.exit(1)
+        if target != manager.forward_to:
+            # 非默认转发目标需要一次 PUT
+            try:
+                rule = pooled_rule(entry, manager.forward_to)
+                manager.update_routing_rule(entry["tag"], manager._retargeted_rule_data(rule, target))
+            except CloudflareAPIError:
+                pool.release(entry["email"])
+                pool.add_ready({k: entry[k] for k in ("email", "tag", "name", "created_at") if k in entry})
+                raise
+
+        history = HistoryStore()
+        history.add(entry["email"], entry["tag"], "Leased from address pool", target=target)
+        try:
+            history.flush()
+        except Exception:
+            # 静默失败，不影响主要功能
+            pass
+
+        if not args.no_refill and pool.claim_fill():
+            start_background_fill()
+
+        if args.quiet:
+            print(entry["email"])
+        else:
+            print(f"✅ 已租用: {entry['email']}")
+            print(f"🆔 规则 ID: {entry['tag']}")
+            print(f"📮 转发目标: {target}")
+
+    elif action == 'release':
+        email = args.email if '@' in args.email else f"{args.email}@{manager.email_domain}"
+        entry = pool.release(email)
+        if entry is None:
+            print(f"❌ {email} 不是从地址池租出的地址")
+            sys.exit(1)
+
+        try:
+            if args.keep_address:
+                # 保留地址，只恢复默认转发目标
+                new_email = entry["email"]
+                if entry.get("target") != manager.forward_to:
+                    rule = pooled_rule(entry, entry.get("target"))
+                    manager.update_routing_rule(entry["tag"], manager._retargeted_rule_data(rule, manager.forward_to))
+            else:
+                # 原地改名为新地址（PUT），旧地址立即失效，无需删除再创建
+                state = pool.status()
+                existing = pool.emails() | manager.existing_emails(cached_only=True) | {email.lower()}
+                new_email = manager.generate_unique_emails(1, state["prefix"], existing)[0]
+                description = f"Pool email recycled at {datetime.now().isoformat()}"
+                manager.update_routing_rule(entry["tag"], manager._renamed_rule_data(new_email, description))
+        except CloudflareAPIError:
+            pool.restore_lease(entry)
+            raise
+
+        ready = {"email": new_email, "tag": entry["tag"], "created_at": datetime.now().isoformat()}
+        if new_email != entry["email"]:
+            ready["name"] = description
+        elif "name" in entry:
+            ready["name"] = entry["name"]
+        pool.add_ready(ready)
+        print(f"♻️  已回收: {email}")
+        if new_email != email:
+            print(f"📧 规则已改名为: {new_email}（放回地址池）")
+
+    elif action == 'drain':
+        state = pool.status()
+        if not state["ready"]:
+            print("📭 地址池中没有待租用的地址")
+            return
+        if not args.yes:
+            confirm = input(f"⚠️  将删除地址池中 {len(state['ready'])} 个待租用地址的规则，确定继续吗? (y/N): ")
+            if confirm.lower() != 'y':
+                print("❌ 取消清空")
+                return
+        ready = pool.take_ready()
+        failed = delete_rules(manager, [(entry["email"], entry["tag"]) for entry in ready], max(1, args.concurrency))
+        if failed:
+            # 删除失败的放回地址池
+            failed_tags = {rule_id for _, rule_id, _ in failed}
+            for entry in ready:
+                if entry["tag"] in failed_tags:
+                    pool.add_ready(entry)
+            sys.exit(1)
+
+    else:
+        state = pool.status()
+        print(f"📦 地址池（zone: {manager.zone_id}）")
+        print(f"   目标容量: {state['size']}")
+        print(f"   可用: {len(state['ready'])}")
+        print(f"   已租出: {len(state['leased'])}")
+        if state.get("filling_since"):
+            print(f"   🔄 正在补充（开始于 {datetime.fromtimestamp(state['filling_since']).isoformat(timespec='seconds')}）")
+        for email, entry in state["leased"].items():
+            print(f"   - {email} → {entry.get('target')}（{entry.get('leased_at', '')[:19]}）")
+
+
+class SingleFlight:
+    """合并并发的相同操作：同一 key 正在执行时，后到的调用等待并共享同一结果"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: Dict[str, Future] = {}
+
+    def do(self, key: str, func: Callable[[], object]):
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+        if not leader:
+            return future.result()
+
+        try:
+            future.set_result(func())
+        except BaseException as e:
+            future.set_exception(e)
+        finally:
+            with self._lock:
+                del self._calls[key]
+        return future.result()
+
+
+class EmailService:
+    """serve 模式的常驻状态：复用同一个管理器、连接池与规则快照
+
+    - 快照新鲜时 list / lookup 不发请求；过期时只由一个线程重新列出，其余等待共享结果
+    - 对同一地址的并发 create / delete 合并为一次上游请求
+    """
+
+    def __init__(self, manager: CloudflareEmailManager, autoflush: bool = True):
+        self.manager = manager
+        self.flight = SingleFlight()
+        self.history = HistoryStore()
+        # False 时由调用方在结束时统一 history.flush()
+        self.autoflush = autoflush
+
+    def address(self, email: str) -> str:
+        """补全省略域名的地址"""
+        return email if '@' in email else f"{email}@{self.manager.email_domain}"
+
+    def refresh(self) -> List[Dict]:
+        return self.flight.do("list", self.manager.list_routing_rules)
+
+    def _ensure_fresh(self, refresh: bool = False):
+        if refresh or not self.manager.rule_index.is_fresh():
+            self.refresh()
+
+    def list_rules(self, pattern: Optional[str] = None, refresh: bool = False) -> List[Dict]:
+        if refresh or not self.manager.rule_index.is_fresh():
+            rules = self.refresh()
+        else:
+            index = self.manager.rule_index
+            rules = [index.to_rule(email, index.get(email)) for email in index.emails()]
+        if pattern:
+            rules = [
+                rule for rule in rules
+                if fnmatch.fnmatch((RuleIndex.rule_email(rule) or "").split('@')[0], pattern)
+            ]
+        return rules
+
+    def _find(self, email: str) -> Optional[Dict]:
+        """快照新鲜时先查快照；本服务列出的快照未命中即视为不存在，否则重新列出"""
+        return self.manager.find_rule_by_email(email)
+
+    def lookup(self, email: str, refresh: bool = False) -> Optional[Dict]:
+        self._ensure_fresh(refresh)
+        return self._find(self.address(email))
+
+    def create(
+        self,
+        email: Optional[str] = None,
+        prefix: Optional[str] = None,
+        forward_to: Optional[str] = None,
+        description: Optional[str] = None
+    ) -> Dict:
+        manager = self.manager
+        self._ensure_fresh()
+        if email:
+            email = self.address(email)
+        else:
+            email = manager.generate_unique_emails(1, prefix, manager.existing_emails(cached_only=True))[0]
+        description = description or f"Temporary email created at {datetime.now().isoformat()}"
+        target = forward_to or manager.forward_to
+        manager.verify_destinations([target])
+
+        def create_one() -> Dict:
+            if self._find(email) is not None:
+                raise CloudflareAPIError(f"邮箱 {email} 已存在", 409)
+            rule = manager.create_routing_rule(email, description, forward_to=target)
+            self.history.add(email, rule.get("tag"), description, target=target)
+            if self.autoflush:
+                try:
+                    self.history.flush()
+                except Exception:
+                    # 静默失败，不影响主要功能
+                    pass
+            return rule
+
+        return self.flight.do(f"create:{email.lower()}", create_one)
+
+    def delete(self, email: str) -> bool:
+        """删除地址对应的规则；不存在时返回 False"""
+        manager = self.manager
+        email = self.address(email)
+        self._ensure_fresh()
+
+        def delete_one() -> bool:
+            rule = self._find(email)
+            if rule is None:
+                return False
+            try:
+                if not manager.delete_routing_rule(rule["tag"]):
+                    raise CloudflareAPIError("API 返回 success=false")
+            except CloudflareAPIError as e:
+                if e.status != 404:
+                    raise
+                manager.rule_index.remove_tag(rule["tag"])
+            return True
+
+        return self.flight.do(f"delete:{email.lower()}", delete_one)
+
+
+class ServeRequestHandler(BaseHTTPRequestHandler):
+    """serve 模式的 HTTP 接口（响应格式与 Cloudflare API 一致：success / errors / result）
+
+    GET    /rules[?pattern=ul*&refresh=1]   列出规则
+    GET    /rules/<email>[?refresh=1]       查找规则
+    POST   /rules  {"email"|"prefix", "to", "description"}  创建
+    DELETE /rules/<email>                   删除
+    GET    /health                          状态
+    GET    /metrics                         Prometheus 格式的请求指标
+    """
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    server_version = "temp-email"
+
+    def _send(self, status: int, body: bytes, content_type: str = "application/json"):
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _success(self, result, status: int = 200):
+        payload = {"success": True, "errors": [], "result": result}
+        self._send(status, json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+
+    def _error(self, status: int, message: str):
+        payload = {"success": False, "errors": [{"message": message}], "result": None}
+        self._send(status, json.dumps(payload, ensure_ascii=False).encode("utf-8"))
+
+    def _dispatch(self):
+        service: EmailService = self.server.service
+        parts = urllib.parse.urlsplit(self.path)
+        query = urllib.parse.parse_qs(parts.query)
+        refresh = query.get("refresh", ["0"])[0] not in ("0", "false", "")
+        segments = [urllib.parse.unquote(segment) for segment in parts.path.strip("/").split("/") if segment]
+
+        length = int(self.headers.get("Content-Length") or 0)
+        raw = self.rfile.read(length) if length else b""
+
+        try:
+            if segments == ["health"] and self.command == "GET":
+                index = service.manager.rule_index
+                return self._success({
+                    "status": "ok",
+                    "backend": os.getenv("EMAIL_BACKEND", "rules"),
+                    "cached_rules": len(index.emails()),
+                    "cache_fresh": index.is_fresh(),
+                })
+            if segments == ["metrics"] and self.command == "GET":
+                return self._send(200, METRICS.to_prometheus().encode("utf-8"), "text/plain; version=0.0.4")
+            if not segments or segments[0] != "rules" or len(segments) > 2:
+                return self._error(404, f"未知路径: {parts.path}")
+
+            if len(segments) == 1:
+                if self.command == "GET":
+                    return self._success(service.list_rules(query.get("pattern", [None])[0], refresh))
+                if self.command == "POST":
+                    try:
+                        data = json.loads(raw) if raw else {}
+                    except ValueError:
+                        return self._error(400, "请求体不是合法的 JSON")
+                    rule = service.create(data.get("email"), data.get("prefix"), data.get("to"), data.get("description"))
+                    return self._success(rule, 201)
+            else:
+                email = service.address(segments[1])
+                if self.command == "GET":
+                    rule = service.lookup(email, refresh)
+                    if rule is None:
+                        return self._error(404, f"未找到邮箱 {email} 对应的路由规则")
+                    return self._success(rule)
+                if self.command == "DELETE":
+                    if not service.delete(email):
+                        return self._error(404, f"未找到邮箱 {email} 对应的路由规则")
+                    return self._success({"email": email, "deleted": True})
+            return self._error(405, f"不支持的方法: {self.command}")
+        except CloudflareAPIError as e:
+            status = e.status if e.status and 400 <= e.status < 500 else 502
+            return self._error(status, str(e))
+        except Exception as e:
+            return self._error(500, str(e))
+
+    do_GET = do_POST = do_DELETE = _dispatch
+
+    def log_message(self, format, *args):
+        if getattr(self.server, "verbose", False):
+            sys.stderr.write(f"[{datetime.now().isoformat(timespec='seconds')}] {format % args}\n")
+
+
+if hasattr(socketserver, "UnixStreamServer"):
+    class UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+        """监听 Unix socket 的 HTTP 服务器"""
+
+        daemon_threads = True
+else:
+    # Windows 不支持 Unix socket
+    UnixHTTPServer = None
+
+
+def serve_command(args):
+    """常驻服务：保持管理器、连接池与规则快照，通过本地 HTTP 接口提供 create/list/delete/lookup"""
+    manager = create_manager()
+    if args.cache_ttl is not None:
+        manager.rule_index.ttl = args.cache_ttl
+    service = EmailService(manager)
+
+    if args.socket:
+        if UnixHTTPServer is None:
+            print("❌ 当前系统不支持 Unix socket，请改用 --port")
+            sys.exit(1)
+        if os.path.exists(args.socket):
+            os.unlink(args.socket)
+        server = UnixHTTPServer(args.socket, ServeRequestHandler)
+        os.chmod(args.socket, 0o600)
+        address = f"unix:{args.socket}"
+    else:
+        server = ThreadingHTTPServer((args.host, args.port), ServeRequestHandler)
+        server.daemon_threads = True
+        address = f"http://{args.host}:{server.server_address[1]}"
+    server.service = service
+    server.verbose = args.verbose
+
+    # 启动时预热规则快照
+    print(f"🔍 正在预热规则快照...")
+    print(f"✅ 已缓存 {len(service.refresh())} 条路由规则")
+    print(f"🚀 服务已启动: {address}（Ctrl+C 停止）")
+    sys.stdout.flush()
+
+    def stop(signum, frame):
+        raise KeyboardInterrupt
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n👋 服务已停止")
+    finally:
+        server.server_close()
+        manager.rule_index.flush()
+        manager.transport.close()
+        if args.socket and os.path.exists(args.socket):
+            os.unlink(args.socket)
+
+
+def plan_operations(lines: Iterable[str], service: EmailService) -> Iterator[Dict]:
+    """把 JSONL 操作逐行解析为任务，并标出必须等待的前序任务
+
+    同一地址的操作按输入顺序执行；list / delete_batch 涉及全部地址，
+    等待之前的所有任务完成，之后的任务也等待它完成；其余操作可以并发
+    """
+    last_by_address: Dict[str, threading.Event] = {}
+    since_barrier: List[threading.Event] = []
+    barrier: Optional[threading.Event] = None
+
+    for line_no, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        task = {"line": line_no, "done": threading.Event(), "deps": []}
+        try:
+            op = json.loads(line)
+            if not isinstance(op, dict):
+                raise ValueError("每行必须是一个 JSON 对象")
+            if op.get("email") is not None and not isinstance(op["email"], str):
+                raise ValueError("email 字段必须是字符串")
+        except ValueError as e:
+            task["error"] = f"无法解析: {e}"
+            task["done"].set()
+            yield task
+            continue
+        task["op"] = op
+
+        if op.get("op") in ("list", "delete_batch"):
+            task["deps"] = [done for done in since_barrier if not done.is_set()] + ([barrier] if barrier else [])
+            barrier = task["done"]
+            since_barrier = []
+            last_by_address = {}
+        else:
+            address = service.address(op["email"]).lower() if op.get("email") else None
+            task["deps"] = [done for done in (last_by_address.get(address), barrier) if done is not None]
+            if address:
+                last_by_address[address] = task["done"]
+            since_barrier.append(task["done"])
+            if len(since_barrier) > 1024:
+                since_barrier = [done for done in since_barrier if not done.is_set()]
+        yield task
+
+
+def run_operation(service: EmailService, op: Dict, concurrency: int = 1):
+    """执行一个 exec 操作，返回结果；失败时抛出 CloudflareAPIError"""
+    kind = op.get("op")
+    refresh = bool(op.get("refresh"))
+
+    if kind == "create":
+        return service.create(op.get("email"), op.get("prefix"), op.get("to"), op.get("description"))
+    if kind == "list":
+        return service.list_rules(op.get("pattern"), refresh)
+    if not op.get("email") and kind in ("lookup", "delete"):
+        raise CloudflareAPIError(f"{kind} 操作缺少 email 字段", 400)
+    if kind == "lookup":
+        rule = service.lookup(op["email"], refresh)
+        if rule is None:
+            raise CloudflareAPIError(f"未找到邮箱 {service.address(op['email'])} 对应的路由规则", 404)
+        return rule
+    if kind == "delete":
+        if not service.delete(op["email"]):
+            raise CloudflareAPIError(f"未找到邮箱 {service.address(op['email'])} 对应的路由规则", 404)
+        return {"email": service.address(op["email"]), "deleted": True}
+    if kind == "delete_batch":
+        if not op.get("pattern"):
+            raise CloudflareAPIError("delete_batch 操作缺少 pattern 字段", 400)
+        emails = [RuleIndex.rule_email(rule) for rule in service.list_rules(op["pattern"], refresh)]
+        deleted, failed = [], []
+        for email, _, error in run_concurrently(service.delete, emails, concurrency):
+            if error is None:
+                deleted.append(email)
+            else:
+                failed.append({"email": email, "error": str(error)})
+        return {"deleted": deleted, "failed": failed}
+    raise CloudflareAPIError(f"未知操作: {kind}（可选 create / lookup / list / delete / delete_batch）", 400)
+
+
+def exec_command(args):
+    """从 stdin（或文件）读取 JSONL 操作，在同一进程中共享快照与连接并发执行，按输入顺序输出 JSONL 结果"""
+    manager = create_manager()
+    # 开始时完整列出一次（磁盘上的快照可能已过期），之后本次运行内的快照始终有效
+    # （是否写回磁盘仍由 RULE_CACHE_TTL 决定）；列出不完整时仍按 TTL 判断并回退到 API
+    _, complete = manager.fetch_routing_rules()
+    if complete:
+        manager.rule_index.ttl = float("inf")
+    service = EmailService(manager, autoflush=False)
+    concurrency = max(1, args.concurrency)
+
+    def execute(task: Dict):
+        try:
+            if "error" in task:
+                raise CloudflareAPIError(task["error"], 400)
+            for done in task["deps"]:
+                done.wait()
+            return run_operation(service, task["op"], concurrency)
+        finally:
+            task["done"].set()
+
+    source = sys.stdin if args.source == '-' else open(args.source, 'r', encoding='utf-8')
+    failures = 0
+    try:
+        for task, result, error in run_concurrently(execute, plan_operations(source, service), concurrency):
+            output = {"line": task["line"]}
+            op = task.get("op") or {}
+            if "id" in op:
+                output["id"] = op["id"]
+            output["op"] = op.get("op")
+            if error is None:
+                output.update({"success": True, "result": result})
+            else:
+                failures += 1
+                output.update({"success": False, "error": str(error)})
+            print(json.dumps(output, ensure_ascii=False), flush=True)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        try:
+            service.history.flush()
+        except Exception:
+            # 静默失败，不影响主要功能
+            pass
+
+    if failures:
+        sys.exit(1)
+
+
+def show_history(args):
+    """查询本地历史记录（逐行读取，不载入整个文件）"""
+    history = HistoryStore()
+    limit = getattr(args, 'limit', None)
+
+    shown = 0
+    entries = history.iter_entries(
+        prefix=getattr(args, 'prefix', None),
+        target=getattr(args, 'to', None),
+        since=getattr(args, 'since', None),
+        until=getattr(args, 'until', None)
+    )
+    for entry in entries:
+        if shown == 0:
+            print(f"{'序号':<4} {'邮箱地址':<40} {'规则ID':<20} {'转发目标':<30} {'创建时间'}")
+            print("-" * 120)
+        shown += 1
+        rule_id = (entry.get("rule_id") or "N/A")[:18]
+        target = entry.get("target") or "N/A"
+        print(f"{shown:<4} {entry.get('email', 'N/A'):<40} {rule_id:<20} {target:<30} {entry.get('created_at', 'N/A')}")
+        if limit and shown >= limit:
+            break
+
+    if shown == 0:
+        print("📭 没有找到匹配的历史记录")
+
+
+def build_parser() -> argparse.ArgumentParser:
+    """构建命令行参数解析器"""
     parser = argparse.ArgumentParser(
         description="Cloudflare 临时邮箱管理工具",
         formatter_class=argparse.RawDescriptionHelpFormatter,
@@ -552,9 +4315,18 @@ def main():
   # 批量创建10个随机邮箱
   %(prog)s create --count 10 --to 203320879@qq.com
 
+  # 并发批量创建（8 个请求同时进行）
+  %(prog)s create --prefix ul --start 1 --count 100 --concurrency 8
+
   # 列出所有临时邮箱
   %(prog)s list
 
+  # 以 CSV 格式输出，便于管道处理
+  %(prog)s list --format csv > rules.csv
+
+  # 持续监视规则变化，只输出新增 / 删除 / 修改的规则
+  %(prog)s list --watch --interval 10
+
   # 删除指定邮箱
   %(prog)s delete abcdefgh@example.com
 
@@ -573,11 +4345,57 @@ def main():
   # 批量删除并跳过确认
   %(prog)s delete --batch 'test*' -y
 
+  # 继续被中断的批量创建 / 批量删除（只处理日志中剩余的项目）
+  %(prog)s create --resume temp_email_journals/create-20251018-120000-1234.jsonl
+  %(prog)s delete --resume temp_email_journals/delete-20251018-120500-1240.jsonl
+
   # 清理所有临时邮箱
   %(prog)s cleanup
+
+  # 以 8 个并发清理，失败项再重试 2 轮
+  %(prog)s cleanup -y --concurrency 8 --retry-failed 2
+
+  # 创建 2 小时后过期的邮箱，由 cron 每分钟运行 reap 删除
+  %(prog)s create --prefix ci --count 5 --ttl 2h
+  * * * * * python temp_email.py reap -q
+
+  # 把所有转发到 user1@qq.com 的邮箱改为转发到 user2@qq.com（原地更新规则）
+  %(prog)s retarget --from user1@qq.com --to user2@qq.com -y
+
+  # 按期望状态文件同步（先预览，再执行）
+  %(prog)s sync desired.txt --scope 'ul*' --dry-run
+  %(prog)s sync desired.txt --scope 'ul*' -y
+
+  # 预先创建 20 个地址，随后即时租用/回收
+  %(prog)s pool fill --size 20 --prefix signup
+  %(prog)s pool lease -q
+  %(prog)s pool release signup-abcdefgh@domain.com
+
+  # catch-all 模式：只配置一次 catch-all 规则，创建/删除地址都不发请求
+  %(prog)s --backend catchall create --count 500
+
+  # 常驻服务（CI 中反复调用时避免重复启动进程、握手与列出规则）
+  %(prog)s serve --port 8025
+  curl -s -X POST localhost:8025/rules -d '{"prefix": "ci"}'
+
+  # 在同一进程中执行多个操作（JSONL 输入，按输入顺序输出 JSONL 结果）
+  printf '%%s\n' '{"op": "create", "prefix": "ci"}' '{"op": "delete_batch", "pattern": "old*"}' | %(prog)s exec -
+
+  # 查询本地创建历史
+  %(prog)s history --prefix ul --since 2025-10-01
+
+  # 输出请求统计并写出 Prometheus 指标文件
+  %(prog)s --stats --metrics-file /var/lib/node_exporter/temp_email.prom cleanup -y
         """
     )
 
+    parser.add_argument('--backend', choices=['rules', 'catchall'], help='地址后端（覆盖 EMAIL_BACKEND）：rules 每个地址一条规则；catchall 只用 catch-all 规则，地址登记在本地')
+    parser.add_argument('--shared-rate', type=float, metavar='REQ_PER_SEC', help='本机所有 temp_email.py 进程共享的总请求速率上限（覆盖 CLOUDFLARE_SHARED_RATE）')
+    parser.add_argument('--stats', action='store_true', help='结束时输出请求统计摘要（写到 stderr）')
+    parser.add_argument('--metrics-file', help='结束时写出指标文件（.prom 为 Prometheus textfile 格式，其余为 JSON）')
+    parser.add_argument('--profile', action='store_true', help='用 cProfile 分析本次命令，结果打印到 stderr')
+    parser.add_argument('--profile-output', metavar='FILE', help='把 cProfile 结果保存到文件（配合 --profile，可用 pstats/snakeviz 查看）')
+
     subparsers = parser.add_subparsers(dest='command', help='可用命令')
 
     # create 命令
@@ -588,37 +4406,180 @@ def main():
     create_parser.add_argument('--number', type=int, help='指定编���（如: --prefix ul --number 1 生成 ul0001@domain.com）')
     create_parser.add_argument('--start', type=int, help='批量创建时的起始编号（如: --prefix ul --start 1 --count 10 生成 ul0001 到 ul0010）')
     create_parser.add_argument('--digits', type=int, default=4, help='编号位数（默认4位，如 0001）')
+    number_group = create_parser.add_mutually_exclusive_group()
+    number_group.add_argument('--next', action='store_true', help='自动分配：从已有最大编号之后连续分配 --count 个（可配合 --start 指定最小编号）')
+    number_group.add_argument('--fill-gaps', action='store_true', help='自动分配：从 --start（默认1）起优先填补已删除留下的空缺编号')
     create_parser.add_argument('--description', help='规则描述')
     create_parser.add_argument('--to', help='指定转发目标邮箱（覆盖 FORWARD_TO_EMAIL）')
     create_parser.add_argument('--count', type=int, help='批量创建数量（默认1）')
     create_parser.add_argument('--output-dir', help='将结果写入该目录下，以目标邮箱命名的 .txt 文件')
+    create_parser.add_argument('--concurrency', type=int, default=1, help='批量创建时的并发请求数（默认1，即逐个创建）')
+    create_parser.add_argument('--ttl', type=parse_duration, help='有效期（如 30m、2h、1d），到期后由 reap 命令删除')
+    create_parser.add_argument('--resume', metavar='JOURNAL', help='从日志继续被中断的批量创建（只创建剩余项，不重新列出）')
     create_parser.set_defaults(func=create_email)
 
     # list 命令
     list_parser = subparsers.add_parser('list', help='列出所有临时邮箱')
     list_parser.add_argument('-v', '--verbose', action='store_true', help='显示详细的分页信息')
+    list_parser.add_argument('--format', choices=['table', 'jsonl', 'csv'], default='table', help='输出格式（默认 table；jsonl/csv 便于管道处理）')
+    list_parser.add_argument('--watch', action='store_true', help='持续监视，只输出新增、删除与变化的规则（Ctrl-C 退出）')
+    list_parser.add_argument('--interval', type=float, default=5.0, help='--watch 的检查间隔秒数（默认5）')
+    list_parser.add_argument('--resync', type=int, default=0, metavar='N', help='--watch 时每 N 次检查强制完整获取一次（默认0，只在探测到变化时获取）')
     list_parser.set_defaults(func=list_emails)
 
     # delete 命令
     delete_parser = subparsers.add_parser('delete', help='删除临时邮箱')
-    delete_parser.add_argument('email', help='要删除的邮箱地址或通配符模式（配合 --batch 使用）')
+    delete_parser.add_argument('email', nargs='?', help='要删除的邮箱地址或通配符模式（配合 --batch 使用）')
     delete_parser.add_argument('--batch', action='store_true', help='批量删除模式：使用通配符模式匹配邮箱用户名')
     delete_parser.add_argument('-y', '--yes', action='store_true', help='跳过确认')
+    delete_parser.add_argument('--refresh', action='store_true', help='忽略本地规则快照，重新从 API 查找')
+    delete_parser.add_argument('--concurrency', type=int, default=4, help='批量删除时的并发请求数（默认4）')
+    delete_parser.add_argument('--retry-failed', type=int, default=0, metavar='N', help='批量删除失败项最多重试 N 轮（默认0）')
+    delete_parser.add_argument('--resume', metavar='JOURNAL', help='从日志继续被中断的批量删除（只删除剩余项，不重新列出）')
     delete_parser.set_defaults(func=delete_email)
 
     # cleanup 命令
     cleanup_parser = subparsers.add_parser('cleanup', help='清理所有临时邮箱')
     cleanup_parser.add_argument('-y', '--yes', action='store_true', help='跳过确认')
+    cleanup_parser.add_argument('--concurrency', type=int, default=4, help='并发删除请求数（默认4）')
+    cleanup_parser.add_argument('--retry-failed', type=int, default=0, metavar='N', help='失败项最多重试 N 轮（默认0）')
     cleanup_parser.set_defaults(func=cleanup_emails)
 
-    args = parser.parse_args()
+    # reap 命令
+    reap_parser = subparsers.add_parser('reap', help='删除已到期的邮箱（配合 create --ttl，适合 cron 每分钟运行）')
+    reap_parser.add_argument('--dry-run', action='store_true', help='只显示已到期的邮箱，不删除')
+    reap_parser.add_argument('--scan', action='store_true', help='先列出全部规则，从规则名称重建过期索引')
+    reap_parser.add_argument('-q', '--quiet', action='store_true', help='没有到期项时不输出任何内容')
+    reap_parser.add_argument('--concurrency', type=int, default=4, help='并发删除请求数（默认4）')
+    reap_parser.add_argument('--retry-failed', type=int, default=0, metavar='N', help='失败项最多重试 N 轮（默认0）')
+    reap_parser.set_defaults(func=reap_emails)
+
+    # retarget 命令
+    retarget_parser = subparsers.add_parser('retarget', help='批量修改转发目标（原地更新，不删除规则）')
+    retarget_parser.add_argument('--to', required=True, help='新的转发目标邮箱')
+    retarget_parser.add_argument('--pattern', help='按用户名通配符选择（同 delete --batch）')
+    retarget_parser.add_argument('--from', dest='from_target', help='按当前转发目标选择')
+    retarget_parser.add_argument('--dry-run', action='store_true', help='只显示将要修改的邮箱，不执行')
+    retarget_parser.add_argument('-y', '--yes', action='store_true', help='跳过确认')
+    retarget_parser.add_argument('--concurrency', type=int, default=4, help='并发请求数（默认4）')
+    retarget_parser.add_argument('--retry-failed', type=int, default=0, metavar='N', help='失败项最多重试 N 轮（默认0）')
+    retarget_parser.set_defaults(func=retarget_emails)
+
+    # sync 命令
+    sync_parser = subparsers.add_parser('sync', help='按期望状态文件同步路由规则（只执行必要的变更）')
+    sync_parser.add_argument('file', help='期望状态文件（JSON 对象或每行 "邮箱 [转发目标]" 的文本）')
+    sync_parser.add_argument('--dry-run', action='store_true', help='只显示同步计划，不执行')
+    sync_parser.add_argument('--scope', help='只删除用户名匹配该通配符的多余规则（默认所有规则）')
+    sync_parser.add_argument('--no-delete', action='store_true', help='不删除期望状态之外的规则')
+    sync_parser.add_argument('--concurrency', type=int, default=4, help='并发请求数（默认4）')
+    sync_parser.add_argument('-y', '--yes', action='store_true', help='跳过删除确认')
+    sync_parser.set_defaults(func=sync_emails)
+
+    # pool 命令
+    pool_parser = subparsers.add_parser('pool', help='预先创建的地址池（即时租用/回收）')
+    pool_subparsers = pool_parser.add_subparsers(dest='pool_action', help='地址池操作')
+    fill_parser = pool_subparsers.add_parser('fill', help='把地址池补充到目标容量')
+    fill_parser.add_argument('--size', type=int, help='目标容量（省略时沿用上次设置）')
+    fill_parser.add_argument('--prefix', help='新地址的前缀（省略时沿用上次设置）')
+    fill_parser.add_argument('--concurrency', type=int, default=4, help='并发创建请求数（默认4）')
+    # 后台补充进程使用：补充标记已由 lease 领取
+    fill_parser.add_argument('--claimed', action='store_true', help=argparse.SUPPRESS)
+    lease_parser = pool_subparsers.add_parser('lease', help='从地址池租用一个地址（不发请求）')
+    lease_parser.add_argument('--to', help='转发目标（非默认目标时需要一次 PUT）')
+    lease_parser.add_argument('-q', '--quiet', action='store_true', help='只输出邮箱地址，便于脚本使用')
+    lease_parser.add_argument('--no-refill', action='store_true', help='不在后台补充地址池')
+    release_parser = pool_subparsers.add_parser('release', help='回收已租出的地址（PUT 改名后放回地址池）')
+    release_parser.add_argument('email', help='要回收的邮箱地址或用户名')
+    release_parser.add_argument('--keep-address', action='store_true', help='保留原地址，只恢复默认转发目标')
+    drain_parser = pool_subparsers.add_parser('drain', help='删除地址池中全部待租用地址的规则')
+    drain_parser.add_argument('-y', '--yes', action='store_true', help='跳过确认')
+    drain_parser.add_argument('--concurrency', type=int, default=4, help='并发删除请求数（默认4）')
+    pool_subparsers.add_parser('status', help='查看地址池状态（默认）')
+    pool_parser.set_defaults(func=pool_command, pool_action='status')
+
+    # serve 命令
+    serve_parser = subparsers.add_parser('serve', help='常驻服务：通过本地 HTTP 接口提供 create/list/delete/lookup')
+    serve_parser.add_argument('--host', default='127.0.0.1', help='监听地址（默认 127.0.0.1）')
+    serve_parser.add_argument('--port', type=int, default=8025, help='监听端口（默认 8025）')
+    serve_parser.add_argument('--socket', help='改为监听 Unix socket（权限 600）')
+    serve_parser.add_argument('--cache-ttl', type=float, help='规则快照有效期（秒，默认沿用 RULE_CACHE_TTL）')
+    serve_parser.add_argument('-v', '--verbose', action='store_true', help='把每个请求记录到 stderr')
+    serve_parser.set_defaults(func=serve_command)
+
+    # exec 命令
+    exec_parser = subparsers.add_parser('exec', help='从 stdin 读取 JSONL 操作，在同一进程中并发执行')
+    exec_parser.add_argument('source', help="操作来源：- 表示 stdin，或 JSONL 文件路径")
+    exec_parser.add_argument('--concurrency', type=int, default=4, help='并发执行的操作数（默认4）')
+    exec_parser.set_defaults(func=exec_command)
+
+    # history 命令
+    history_parser = subparsers.add_parser('history', help='查询本地创建历史')
+    history_parser.add_argument('--prefix', help='按邮箱用户名前缀过滤')
+    history_parser.add_argument('--to', help='按转发目标过滤')
+    history_parser.add_argument('--since', help='起始日期/时间（ISO 格式，如 2025-10-01）')
+    history_parser.add_argument('--until', help='截止日期/时间（ISO 格式，包含当天）')
+    history_parser.add_argument('--limit', type=int, help='最多显示条数')
+    history_parser.set_defaults(func=show_history)
+
+    return parser
+
+
+def main(argv: Optional[List[str]] = None):
+    """主函数"""
+    parser = build_parser()
+    args = parser.parse_args(argv)
 
     if not args.command:
         parser.print_help()
         sys.exit(1)
 
+    if getattr(args, 'backend', None):
+        # 写入环境变量，后台补充进程等子进程也沿用同一后端
+        os.environ["EMAIL_BACKEND"] = args.backend
+    if getattr(args, 'shared_rate', None) is not None:
+        os.environ["CLOUDFLARE_SHARED_RATE"] = str(args.shared_rate)
+
+    profiler = cProfile.Profile() if getattr(args, 'profile', False) else None
+
     # 执行命令
-    args.func(args)
+    try:
+        if profiler:
+            profiler.runcall(args.func, args)
+        else:
+            args.func(args)
+    except CloudflareAPIError as e:
+        print(f"❌ {e}")
+        sys.exit(1)
+    except BrokenPipeError:
+        # 管道下游提前关闭（如 | head），丢弃剩余输出
+        devnull = os.open(os.devnull, os.O_WRONLY)
+        os.dup2(devnull, sys.stdout.fileno())
+        sys.exit(1)
+    finally:
+        report_run(args, profiler)
+
+
+def report_run(args, profiler: Optional[cProfile.Profile] = None):
+    """命令结束时输出 --stats 摘要、--metrics-file 指标文件与 --profile 结果（均写到 stderr 或文件）"""
+    if getattr(args, 'stats', False):
+        METRICS.print_summary()
+
+    metrics_file = getattr(args, 'metrics_file', None)
+    if metrics_file:
+        try:
+            METRICS.dump(metrics_file)
+        except OSError as e:
+            print(f"⚠️  写出指标文件失败: {e}", file=sys.stderr)
+
+    if profiler:
+        profiler.disable()
+        profile_output = getattr(args, 'profile_output', None)
+        if profile_output:
+            profiler.dump_stats(profile_output)
+            print(f"🔬 cProfile 结果已写入: {profile_output}", file=sys.stderr)
+        else:
+            print("\n🔬 cProfile（按累计耗时排序，前 25 项）", file=sys.stderr)
+            pstats.Stats(profiler, stream=sys.stderr).sort_stats("cumulative").print_stats(25)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+"""
+测试异步 API 客户端
+在本地启动一个简易的路由规则服务器代替 Cloudflare API，不会访问外网
+"""
+
+import sys
+import os
+import json
+import time
+import uuid
+import asyncio
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+# 设置环境变量以通过初始化检查
+os.environ['CLOUDFLARE_API_TOKEN'] = 'test_token'
+os.environ['CLOUDFLARE_ZONE_ID'] = 'test_zone_id'
+os.environ['FORWARD_TO_EMAIL'] = 'test@example.com'
+os.environ['EMAIL_DOMAIN'] = 'example.com'
+os.environ['RULE_CACHE_TTL'] = '0'
+os.environ['CLOUDFLARE_RATE_LIMIT'] = '0'
+
+import temp_email
+from temp_email import AsyncCloudflareEmailManager, AsyncPooledHTTPTransport
+
+
+class _RulesHandler(BaseHTTPRequestHandler):
+    """支持创建、分页列出、删除规则的内存服务器"""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    rules = []
+    lock = threading.Lock()
+    fail_page = None
+
+    def _send(self, payload):
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        query = parse_qs(urlsplit(self.path).query)
+        page = int(query["page"][0])
+        per_page = int(query["per_page"][0])
+        if page == self.fail_page:
+            self._send({"success": False, "errors": [{"code": 10000, "message": "page failed"}]})
+            return
+        with self.lock:
+            result = self.rules[(page - 1) * per_page:page * per_page]
+            total = len(self.rules)
+        self._send({
+            "success": True,
+            "result": result,
+            "result_info": {"page": page, "per_page": per_page, "count": len(result),
+                            "total_count": total, "total_pages": -(-total // per_page)}
+        })
+
+    def do_POST(self):
+        rule = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        rule["tag"] = uuid.uuid4().hex
+        with self.lock:
+            self.rules.append(rule)
+        self._send({"success": True, "result": rule})
+
+    def do_DELETE(self):
+        tag = self.path.rsplit("/", 1)[1]
+        with self.lock:
+            self.rules[:] = [rule for rule in self.rules if rule["tag"] != tag]
+        self._send({"success": True, "result": {"id": tag}})
+
+    def log_message(self, *args):
+        pass
+
+
+class _Server(ThreadingHTTPServer):
+    # 并发建立大量连接时避免默认 backlog (5) 造成 SYN 重传
+    request_queue_size = 128
+
+
+def test_async_manager():
+    """在一个事件循环中并发创建、分页列出、查找并删除规则"""
+    server = _Server(("127.0.0.1", 0), _RulesHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ['CLOUDFLARE_API_BASE_URL'] = f"http://127.0.0.1:{server.server_address[1]}/client/v4"
+    _RulesHandler.rules = []
+
+    async def scenario():
+        async with AsyncCloudflareEmailManager() as manager:
+            manager.PER_PAGE = 5
+            emails = [manager.generate_numbered_email("as", i) for i in range(1, 24)]
+            rules = await asyncio.gather(*(manager.create_routing_rule(e) for e in emails))
+            assert len({rule["tag"] for rule in rules}) == 23
+
+            listed = await manager.list_routing_rules()
+            assert sorted(rule["matchers"][0]["value"] for rule in listed) == emails
+
+            rule = await manager.find_rule_by_email("as0007@example.com")
+            assert rule["tag"] == rules[6]["tag"]
+            assert await manager.delete_routing_rule(rule["tag"])
+            assert await manager.find_rule_by_email("as0007@example.com") is None
+
+            # 与同步版一致：某页失败或超过最大页数时返回已获取的部分并标记为不完整
+            _RulesHandler.fail_page = 3
+            rules, complete = await manager.fetch_routing_rules()
+            assert len(rules) == 10 and not complete
+            _RulesHandler.fail_page = None
+            manager.MAX_PAGES = 2
+            rules, complete = await manager.fetch_routing_rules()
+            assert len(rules) == 10 and not complete
+
+    try:
+        asyncio.run(scenario())
+        assert len(_RulesHandler.rules) == 22
+    finally:
+        del os.environ['CLOUDFLARE_API_BASE_URL']
+        server.shutdown()
+        server.server_close()
+
+
+def test_connect_timeout():
+    """建立连接也受传输层超时限制"""
+    original_open = temp_email.asyncio.open_connection
+
+    async def hanging_open(*args, **kwargs):
+        await asyncio.sleep(30)
+
+    async def scenario():
+        transport = AsyncPooledHTTPTransport(timeout=0.2)
+        started = time.monotonic()
+        try:
+            await transport.request("GET", "http://192.0.2.1/", {})
+            assert False, "连接超时应抛出异常"
+        except asyncio.TimeoutError:
+            pass
+        assert time.monotonic() - started < 5
+
+    temp_email.asyncio.open_connection = hanging_open
+    try:
+        asyncio.run(scenario())
+    finally:
+        temp_email.asyncio.open_connection = original_open
+
+
+def test_shared_budget_off_loop():
+    """共享预算的预约与 429 暂停（文件锁 I/O）都在线程池中执行，不阻塞事件循环"""
+    calls = []
+
+    class _Budget:
+        def reserve(self):
+            calls.append(("reserve", threading.current_thread()))
+            return 0.0
+
+        def pause(self, seconds):
+            calls.append(("pause", threading.current_thread(), seconds))
+
+    class _Transport(temp_email.AsyncHTTPTransport):
+        responses = [
+            (429, "Too Many Requests", {"retry-after": "0.01"}, b""),
+            (200, "OK", {}, b'{"success": true, "result": []}'),
+        ]
+
+        async def request(self, method, url, headers, body=None):
+            return self.responses.pop(0)
+
+    async def scenario():
+        manager = AsyncCloudflareEmailManager(_Transport())
+        manager.rate_limiter.shared = _Budget()
+        assert (await manager._make_request("/zones/test_zone_id/email/routing/rules"))["success"]
+
+    asyncio.run(scenario())
+    assert [call[0] for call in calls] == ["reserve", "pause", "reserve"], calls
+    assert all(call[1] is not threading.main_thread() for call in calls)
+    assert calls[1][2] == 0.01
+
+
+if __name__ == "__main__":
+    try:
+        test_async_manager()
+        test_connect_timeout()
+        test_shared_budget_off_loop()
+        print("✅ 所有测试通过！")
+    except AssertionError as e:
+        print(f"❌ 测试失败: {e}")
+        sys.exit(1)
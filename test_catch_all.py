@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+"""
+测试 catch-all 模式与本地地址登记表
+catch-all 规则的配置通过本地模拟服务器验证，不会访问外网
+"""
+
+import sys
+import os
+import tempfile
+import threading
+
+# 设置环境变量以通过初始化检查
+os.environ['CLOUDFLARE_API_TOKEN'] = 'test_token'
+os.environ['CLOUDFLARE_ZONE_ID'] = 'test_zone_id'
+os.environ['FORWARD_TO_EMAIL'] = 'test@example.com'
+os.environ['EMAIL_DOMAIN'] = 'example.com'
+os.environ['RULE_CACHE_TTL'] = '0'
+os.environ['CLOUDFLARE_RATE_LIMIT'] = '0'
+
+from temp_email import AddressRegistry, CatchAllEmailManager, CloudflareAPIError
+from mock_cloudflare_api import start_mock_server
+
+
+def test_registry():
+    """并发登记不重复、其他实例能读到追加的记录、压缩后状态不变"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "registry.jsonl")
+        errors = []
+
+        def writer(n):
+            # 每个线程使用独立实例，模拟多个进程；所有线程都尝试登记 shared@example.com
+            registry = AddressRegistry("z", path)
+            for i in range(30):
+                entry = registry.add(f"r{n}-{i}@example.com", "test@example.com", "desc")
+                assert entry["email"] == f"r{n}-{i}@example.com" and entry == registry.get(entry["email"])
+            try:
+                registry.add("shared@example.com", "test@example.com", "desc")
+            except CloudflareAPIError as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=writer, args=(n,)) for n in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert len(errors) == 3, "同一地址只能登记一次"
+        registry = AddressRegistry("z", path)
+        assert len(registry.emails()) == 121
+        assert AddressRegistry("other", path).emails() == set()
+
+        registry.COMPACT_THRESHOLD = 10
+        reader = AddressRegistry("z", path)
+        for entry in registry.entries()[:100]:
+            assert registry.remove(entry["tag"])
+        assert not registry.remove("missing")
+        with open(path, encoding='utf-8') as f:
+            assert sum(1 for _ in f) < 121, "失效记录过多时应压缩日志"
+
+        reader.refresh()
+        assert reader.emails() == registry.emails() and len(reader.emails()) == 21
+
+
+def test_catch_all_manager():
+    """只配置一次 catch-all 规则，创建/列出/删除都不发请求"""
+    server = start_mock_server()
+    os.environ['CLOUDFLARE_API_BASE_URL'] = server.url
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            os.environ['ADDRESS_REGISTRY_FILE'] = os.path.join(tmp, "registry.jsonl")
+            try:
+                manager = CatchAllEmailManager()
+                rule = manager.create_routing_rule("ca0001@example.com")
+                assert server.api.catch_all["enabled"]
+                assert server.api.catch_all["actions"] == [{"type": "forward", "value": ["test@example.com"]}]
+
+                before = server.api.request_count
+                manager = CatchAllEmailManager()
+                for i in range(2, 300):
+                    manager.create_routing_rule(manager.generate_numbered_email("ca", i))
+                assert len(manager.list_routing_rules()) == 299, "不受 200 条规则配额限制"
+                assert manager.find_rule_by_email("ca0001@example.com")["tag"] == rule["tag"]
+                assert manager.delete_routing_rule(rule["tag"])
+                assert manager.find_rule_by_email("ca0001@example.com") is None
+                assert server.api.request_count == before and not server.api.rules
+
+                try:
+                    manager.create_routing_rule("ca9999@example.com", forward_to="other@example.com")
+                    assert False, "catch-all 模式不支持单独的转发目标"
+                except CloudflareAPIError:
+                    pass
+            finally:
+                del os.environ['ADDRESS_REGISTRY_FILE']
+    finally:
+        del os.environ['CLOUDFLARE_API_BASE_URL']
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    try:
+        test_registry()
+        test_catch_all_manager()
+        print("✅ 所有测试通过！")
+    except AssertionError as e:
+        print(f"❌ 测试失败: {e}")
+        sys.exit(1)
@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+"""
+测试带过期时间的邮箱与 reap 命令
+删除通过本地模拟服务器验证，不会访问外网
+"""
+
+import sys
+import os
+import time
+import argparse
+import tempfile
+import contextlib
+from datetime import datetime, timedelta
+
+# 设置环境变量以通过初始化检查
+os.environ['CLOUDFLARE_API_TOKEN'] = 'test_token'
+os.environ['CLOUDFLARE_ZONE_ID'] = 'test_zone_id'
+os.environ['FORWARD_TO_EMAIL'] = 'test@example.com'
+os.environ['EMAIL_DOMAIN'] = 'example.com'
+os.environ['RULE_CACHE_TTL'] = '0'
+os.environ['CLOUDFLARE_RATE_LIMIT'] = '0'
+
+from temp_email import CloudflareEmailManager, ExpiryIndex, parse_duration, reap_emails
+from mock_cloudflare_api import start_mock_server
+
+
+def test_parse_duration():
+    assert parse_duration("90s") == timedelta(seconds=90)
+    assert parse_duration("2h") == timedelta(hours=2)
+    assert parse_duration("1h30m") == timedelta(minutes=90)
+    assert parse_duration("1d") == timedelta(days=1)
+    for bad in ("", "2", "2x", "h", "0m", "1h 2"):
+        try:
+            parse_duration(bad)
+            assert False, f"{bad!r} 应解析失败"
+        except argparse.ArgumentTypeError:
+            pass
+
+
+def test_expiry_index():
+    """条目按到期时间有序，due 只返回已到期的前缀"""
+    with tempfile.TemporaryDirectory() as tmp:
+        index = ExpiryIndex("z", os.path.join(tmp, "expiry.json"))
+        index.add([(300.0, "c@example.com", "t3"), (100.0, "a@example.com", "t1")])
+        index.add([(200.0, "b@example.com", "t2"), (50.0, "a@example.com", "t1")])
+        assert len(index) == 3, "同一规则重复登记时以新的为准"
+        assert [entry[1] for entry in index.due(200.0)] == ["a@example.com", "b@example.com"]
+        assert index.due(10.0) == []
+        index.remove(["t1"])
+        assert index.next_expiry() == 200.0
+        assert ExpiryIndex("other", index.path).due(1e12) == []
+
+    expires_at = datetime(2030, 1, 2, 3, 4, 5)
+    name = ExpiryIndex.mark_name("Temporary email", expires_at)
+    assert ExpiryIndex.expiry_from_name(name) == expires_at.timestamp()
+    assert ExpiryIndex.expiry_from_name("Temporary email") is None
+
+
+def test_reap():
+    """只删除已到期的规则，不列出整个 zone；没有到期项时不发请求"""
+    server = start_mock_server()
+    os.environ['CLOUDFLARE_API_BASE_URL'] = server.url
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            os.environ['EXPIRY_INDEX_FILE'] = os.path.join(tmp, "expiry.json")
+            try:
+                manager = CloudflareEmailManager()
+                index = ExpiryIndex(manager.state_key)
+                items = []
+                for i in range(1, 7):
+                    email = manager.generate_numbered_email("tt", i)
+                    expires = time.time() + (-60 if i <= 4 else 3600)
+                    rule = manager.create_routing_rule(email)
+                    items.append((expires, email, rule["tag"]))
+                index.add(items)
+                server.api.rules[0]["tag"] = "gone"  # 已被其他方式删除的规则视为删除成功
+
+                args = argparse.Namespace(scan=False, dry_run=False, quiet=True, concurrency=4, retry_failed=0)
+                before = server.api.request_count
+                with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                    reap_emails(args)
+                assert server.api.request_count - before == 4, "只应发出到期规则的删除请求"
+                assert len(server.api.rules) == 3 and len(index) == 2
+
+                before = server.api.request_count
+                with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                    reap_emails(args)
+                assert server.api.request_count == before, "没有到期项时不应发请求"
+            finally:
+                del os.environ['EXPIRY_INDEX_FILE']
+    finally:
+        del os.environ['CLOUDFLARE_API_BASE_URL']
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    try:
+        test_parse_duration()
+        test_expiry_index()
+        test_reap()
+        print("✅ 所有测试通过！")
+    except AssertionError as e:
+        print(f"❌ 测试失败: {e}")
+        sys.exit(1)
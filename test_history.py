@@ -0,0 +1,62 @@
+#!/usr/bin/env python3
+"""
+测试追加写入的本地历史记录
+这个测试脚本不会实际调用 API，只测试历史文件的写入、迁移与查询
+"""
+
+import sys
+import os
+import json
+import tempfile
+import threading
+
+from temp_email import HistoryStore
+
+
+def test_history_store():
+    """旧文件迁移、并发追加与条件查询"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "temp_emails.jsonl")
+        legacy_path = os.path.join(tmp, "temp_emails.json")
+        with open(legacy_path, 'w', encoding='utf-8') as f:
+            json.dump([{
+                "email": "old0001@example.com",
+                "rule_id": "r0",
+                "description": "旧记录",
+                "created_at": "2024-05-01T10:00:00"
+            }], f)
+
+        # 多个 HistoryStore 实例同时写入，模拟并发进程
+        def writer(n):
+            store = HistoryStore(path, legacy_path)
+            for i in range(20):
+                store.add(f"ul{n}{i:03d}@example.com", f"t{n}-{i}", "desc", target=f"user{n}@qq.com")
+            store.flush()
+
+        threads = [threading.Thread(target=writer, args=(n,)) for n in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert not os.path.exists(legacy_path)
+        assert os.path.exists(legacy_path + ".migrated")
+
+        store = HistoryStore(path, legacy_path)
+        entries = list(store.iter_entries())
+        assert len(entries) == 81, f"期望 81 条，得到 {len(entries)}"
+        assert entries[0]["email"] == "old0001@example.com"
+
+        assert len(list(store.iter_entries(prefix="ul1"))) == 20
+        assert len(list(store.iter_entries(target="user2@qq.com"))) == 20
+        assert [e["email"] for e in store.iter_entries(until="2024-05-01")] == ["old0001@example.com"]
+        assert len(list(store.iter_entries(since="2025"))) == 80
+
+
+if __name__ == "__main__":
+    try:
+        test_history_store()
+        print("✅ 所有测试通过！")
+    except AssertionError as e:
+        print(f"❌ 测试失败: {e}")
+        sys.exit(1)
@@ -0,0 +1,607 @@
+#!/usr/bin/env python3
+"""
+测试本地模拟服务器与性能基准脚本
+所有请求都发往本地模拟服务器，不会访问外网
+"""
+
+import io
+import csv
+import sys
+import os
+import json
+import time
+import argparse
+import threading
+import tempfile
+import contextlib
+from datetime import timedelta
+
+# 设置环境变量以通过初始化检查
+os.environ['CLOUDFLARE_API_TOKEN'] = 'test_token'
+os.environ['CLOUDFLARE_ZONE_ID'] = 'test_zone_id'
+os.environ['FORWARD_TO_EMAIL'] = 'test@example.com'
+os.environ['EMAIL_DOMAIN'] = 'example.com'
+os.environ['RULE_CACHE_TTL'] = '0'
+os.environ['CLOUDFLARE_RATE_LIMIT'] = '0'
+
+import benchmark
+import temp_email
+from temp_email import (
+    CloudflareAPIError, CloudflareEmailManager, MultiZoneEmailManager, cleanup_emails, create_email, delete_email,
+    delete_rules, list_emails, retarget_emails, sync_emails, watch_rules
+)
+from mock_cloudflare_api import MockCloudflareAPI, start_mock_server
+
+
+@contextlib.contextmanager
+def _mock_api(env=None, **options):
+    """启动模拟服务器，把 API 地址与 env 中的变量写入环境变量
+
+    退出时（包括断言失败时）恢复全部环境变量与工作目录并关闭服务器，不影响后续测试
+    """
+    server = start_mock_server(**options)
+    saved_env = dict(os.environ)
+    cwd = os.getcwd()
+    os.environ['CLOUDFLARE_API_BASE_URL'] = server.url
+    os.environ.update(env or {})
+    try:
+        yield server
+    finally:
+        os.chdir(cwd)
+        os.environ.clear()
+        os.environ.update(saved_env)
+        server.shutdown()
+        server.server_close()
+
+
+def test_mock_server():
+    """分页、配额、重复地址与注入的 429/5xx"""
+    with _mock_api(quota=12, error_429=0.3, retry_after=0, env={'CLOUDFLARE_MAX_RETRIES': '10'}) as server:
+        manager = CloudflareEmailManager()
+        manager.PER_PAGE = 5
+        for i in range(12):
+            manager.create_routing_rule(manager.generate_numbered_email("mk", i))
+        server.api.error_429 = 0
+
+        try:
+            manager.create_routing_rule("mk9999@example.com")
+            assert False, "超出配额应失败"
+        except CloudflareAPIError as e:
+            assert e.status == 400 and "limit" in str(e)
+
+        # 5xx 只对幂等请求重试
+        server.api.error_5xx = 0.3
+        rules = manager.list_routing_rules()
+        assert len(rules) == 12, f"期望 12 条，得到 {len(rules)}"
+        assert manager.delete_routing_rule(rules[0]["tag"])
+        assert len(server.api.rules) == 11
+
+
+def test_create_failure_summary():
+    """并发批量创建时单个地址失败不影响其余地址，汇总列出失败的地址并以 1 退出"""
+    cwd = os.getcwd()
+    with _mock_api(quota=3) as server:
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            args = argparse.Namespace(
+                prefix='fs', no_prefix=False, email=None, number=None, start=1, digits=4, count=5,
+                next=False, fill_gaps=False, to=None, description=None, output_dir=None, concurrency=2,
+                ttl=None, resume=None
+            )
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                try:
+                    create_email(args)
+                    assert False, "有地址创建失败时应以 1 退出"
+                except SystemExit as e:
+                    assert e.code == 1
+            os.chdir(cwd)
+
+        created = sorted(MockCloudflareAPI._rule_email(rule) for rule in server.api.rules)
+        assert len(created) == 3
+        summary = output.getvalue().split("=" * 60)[-2]
+        assert "✅ 成功创建: 3 个" in summary and "❌ 创建失败: 2 个" in summary, summary
+        failed = [line.strip()[2:] for line in summary.splitlines() if line.strip().startswith("- ")]
+        expected = sorted(set(f"fs{n:04d}@example.com" for n in range(1, 6)) - set(created))
+        assert sorted(failed) == expected, failed
+
+
+def test_cleanup_retry_failed():
+    """cleanup --retry-failed 只重试失败项；重试后仍失败时以 1 退出"""
+    with _mock_api(env={'CLOUDFLARE_MAX_RETRIES': '0'}) as server:
+        manager = CloudflareEmailManager()
+        for i in range(1, 7):
+            manager.create_routing_rule(manager.generate_numbered_email("cr", i))
+        flaky, broken = server.api.rules[1]["tag"], server.api.rules[4]["tag"]
+
+        # flaky 第一次删除失败、重试成功；broken 每次都失败
+        original_handle = server.api.handle
+        attempts = {flaky: 0, broken: 0}
+
+        def failing_handle(method, path, body):
+            tag = path.split('?')[0].rsplit('/', 1)[-1]
+            if method == "DELETE" and tag in attempts:
+                attempts[tag] += 1
+                if tag == broken or attempts[tag] == 1:
+                    return 503, {"success": False, "errors": [{"code": 10000, "message": "unavailable"}]}, {}
+            return original_handle(method, path, body)
+
+        server.api.handle = failing_handle
+        args = argparse.Namespace(yes=True, concurrency=3, retry_failed=2)
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            try:
+                cleanup_emails(args)
+                assert False, "重试后仍失败时应以 1 退出"
+            except SystemExit as e:
+                assert e.code == 1
+        assert attempts == {flaky: 2, broken: 3}, attempts
+        assert [rule["tag"] for rule in server.api.rules] == [broken]
+        text = output.getvalue()
+        assert "第 1 轮重试: 2 个失败项" in text and "第 2 轮重试: 1 个失败项" in text, text
+        assert "✅ 成功删除: 5 个" in text and "❌ 删除失败: 1 个" in text, text
+
+
+def test_sync():
+    """sync 只执行必要的创建、更新与删除，再次运行不产生写请求"""
+    with _mock_api() as server:
+        manager = CloudflareEmailManager()
+        for i in range(1, 4):
+            manager.create_routing_rule(manager.generate_numbered_email("sy", i))
+        manager.create_routing_rule("keep@example.com")
+
+        with tempfile.TemporaryDirectory() as tmp:
+            desired = os.path.join(tmp, "desired.txt")
+            with open(desired, 'w', encoding='utf-8') as f:
+                f.write("sy0001\nsy0002 other@example.com  # 改目标\nsy0005\n")
+            args = argparse.Namespace(file=desired, dry_run=False, scope='sy*', no_delete=False, concurrency=4, yes=True)
+
+            cwd = os.getcwd()
+            os.chdir(tmp)
+            try:
+                with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                    sync_emails(args)
+                    targets = {
+                        server.api._rule_email(rule): rule["actions"][0]["value"][0] for rule in server.api.rules
+                    }
+                    assert targets == {
+                        "sy0001@example.com": "test@example.com",
+                        "sy0002@example.com": "other@example.com",
+                        "sy0005@example.com": "test@example.com",
+                        "keep@example.com": "test@example.com",
+                    }, targets
+
+                    before = server.api.request_count
+                    sync_emails(args)
+                    assert server.api.request_count - before == 1, "已同步时只应列出一次规则"
+            finally:
+                os.chdir(cwd)
+
+
+def test_retarget():
+    """retarget 按当前目标选择规则，每条规则一次 PUT，规则 ID 不变"""
+    with _mock_api(error_5xx=0.2, env={'CLOUDFLARE_MAX_RETRIES': '10'}) as server:
+        manager = CloudflareEmailManager()
+        server.api.error_5xx = 0
+        for i in range(1, 7):
+            manager.create_routing_rule(manager.generate_numbered_email("rt", i), forward_to="old@example.com" if i <= 4 else None)
+        tags = {rule["tag"] for rule in server.api.rules}
+        # 用户停用的规则改向后仍保持停用
+        server.api.rules[0]["enabled"] = False
+
+        server.api.error_5xx = 0.2
+        before = server.api.request_count
+        args = argparse.Namespace(
+            pattern='rt*', from_target='old@example.com', to='new@example.com',
+            dry_run=False, yes=True, concurrency=4, retry_failed=2
+        )
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            retarget_emails(args)
+        targets = sorted(rule["actions"][0]["value"][0] for rule in server.api.rules)
+        assert targets == ["new@example.com"] * 4 + ["test@example.com"] * 2, targets
+        assert {rule["tag"] for rule in server.api.rules} == tags, "规则 ID 应保持不变"
+        assert [rule["enabled"] for rule in server.api.rules] == [False] + [True] * 5
+        assert server.api.request_count - before >= 5
+
+        server.api.error_5xx = 0
+        before = server.api.request_count
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            retarget_emails(args)
+        assert server.api.request_count - before == 1, "没有需要修改的规则时只列出一次"
+
+
+def test_multi_zone():
+    """按剩余容量分配到多个 zone，列出与删除覆盖所有 zone"""
+    with _mock_api(quota=5, env={'CLOUDFLARE_RULE_QUOTA': '5'}) as server:
+        manager = MultiZoneEmailManager(MultiZoneEmailManager.parse_zones("za:a.com, zb:b.com,zc:c.com"))
+        manager.shards[0].create_routing_rule("old@a.com")
+        manager.shards[0].create_routing_rule("old2@a.com")
+
+        emails = manager.generate_unique_emails(10, "mz", manager.existing_emails())
+        for email in emails:
+            manager.create_routing_rule(email)
+        per_zone = {zone: len(rules) for zone, rules in server.api.zones.items()}
+        assert per_zone == {"za": 4, "zb": 4, "zc": 4}, per_zone
+
+        try:
+            manager.generate_unique_emails(4, "mz", manager.existing_emails())
+            assert False, "超出总容量应在发请求前失败"
+        except CloudflareAPIError as e:
+            assert "3" in str(e)
+
+        # 编号地址整批只分配一次容量；已存在的用户名沿用原 zone
+        allocations = []
+        original_allocate = manager._allocate
+        manager._allocate = lambda count, existing: allocations.append(count) or original_allocate(count, existing)
+        manager.shards[1].create_routing_rule("nb0002@b.com")
+        manager.existing_emails()
+        emails = manager.generate_numbered_emails("nb", [1, 2, 3], 4)
+        assert allocations == [2], allocations
+        assert emails[1] == "nb0002@b.com" and {email.split('@')[1] for email in emails} == {"a.com", "b.com", "c.com"}
+        server.api.zones["zb"].pop()
+
+        # 已创建的地址不再重复计入容量，删除后容量归还；已知地址集合随创建/删除失效
+        for email in (emails[0], emails[2]):
+            manager.create_routing_rule(email)
+            assert manager._known_emails is None
+        for _ in range(6):
+            email = manager.generate_unique_emails(1, "cy", manager.existing_emails())[0]
+            manager.delete_routing_rule(manager.create_routing_rule(email)["tag"])
+        assert not manager._planned and manager._known_emails is None
+        for zone in ("za", "zc"):
+            server.api.zones[zone].pop()
+
+        # 只为各分片建立快照，不为第一个 zone 额外建立
+        created = []
+        original_init = temp_email.RuleIndex.__init__
+
+        def counting_init(index, path, *args):
+            created.append(os.path.basename(path))
+            original_init(index, path, *args)
+
+        temp_email.RuleIndex.__init__ = counting_init
+        try:
+            MultiZoneEmailManager(MultiZoneEmailManager.parse_zones("za:a.com,zb:b.com"))
+        finally:
+            temp_email.RuleIndex.__init__ = original_init
+        assert len(created) == 2, created
+
+        # 新实例不知道规则所在的 zone，列出后按规则 ID 路由删除请求
+        manager = MultiZoneEmailManager(MultiZoneEmailManager.parse_zones("za:a.com,zb:b.com,zc:c.com"))
+        rules = manager.list_routing_rules()
+        assert len(rules) == 12
+        items = [(rule["matchers"][0]["value"], rule["tag"]) for rule in rules]
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            failed = delete_rules(manager, items, concurrency=4)
+        assert not failed and not server.api.rules
+
+
+def test_fill_gaps():
+    """--fill-gaps 只列出一次，分配的编号不会撞上已有地址"""
+    cwd = os.getcwd()
+    with _mock_api() as server:
+        manager = CloudflareEmailManager()
+        for number in (1, 2, 4, 7):
+            manager.create_routing_rule(manager.generate_numbered_email("fg", number))
+
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            before = server.api.request_count
+            args = argparse.Namespace(
+                prefix='fg', no_prefix=False, email=None, number=None, start=None, digits=4, count=4,
+                next=False, fill_gaps=True, to=None, description=None, output_dir=None, concurrency=2, ttl=None
+            )
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                create_email(args)
+            assert server.api.request_count - before == 1 + 4, "一次列出加每个编号一次创建"
+            emails = sorted(MockCloudflareAPI._rule_email(rule) for rule in server.api.rules)
+            assert emails == [f"fg{n:04d}@example.com" for n in range(1, 9)], emails
+
+            args.fill_gaps, args.next, args.count = False, True, 2
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                create_email(args)
+            # 两个编号并发创建，服务器上的先后顺序不固定
+            emails = sorted(MockCloudflareAPI._rule_email(rule) for rule in server.api.rules)
+            assert emails[-2:] == ["fg0009@example.com", "fg0010@example.com"], emails
+            os.chdir(cwd)
+
+
+def test_resume():
+    """中断的批量创建/删除可从日志继续：只处理剩余项，不重新列出，历史与输出文件覆盖整批"""
+    cwd = os.getcwd()
+    with _mock_api(quota=6, env={'CLOUDFLARE_MAX_RETRIES': '0'}) as server:
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            create_args = argparse.Namespace(
+                prefix='rs', no_prefix=False, email=None, number=None, start=1, digits=4, count=10,
+                next=False, fill_gaps=False, to=None, description=None, output_dir='out', concurrency=4,
+                ttl=None, resume=None
+            )
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                try:
+                    create_email(create_args)
+                    assert False, "超出配额的项目应失败"
+                except SystemExit:
+                    pass
+            journals = os.listdir("temp_email_journals")
+            assert len(journals) == 1 and len(server.api.rules) == 6
+
+            # 上次已创建成功、但没来得及记入日志的项目，继续时应识别为成功
+            server.api.quota = 200
+            CloudflareEmailManager().create_routing_rule("rs0010@example.com")
+
+            before = server.api.request_count
+            create_args.resume = os.path.join("temp_email_journals", journals[0])
+            create_args.output_dir = None
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                create_email(create_args)
+            # 3 个新建 + rs0010 创建失败后查找一次（列出一页）
+            assert server.api.request_count - before == 5, server.api.request_count - before
+            assert not os.listdir("temp_email_journals"), "全部完成后应删除日志"
+            with open(os.path.join("out", "test@example.com.txt"), encoding='utf-8') as f:
+                assert f.read().split() == [f"rs{n:04d}@example.com" for n in range(1, 11)]
+            with open("temp_emails.jsonl", encoding='utf-8') as f:
+                assert len(f.readlines()) == 10
+
+            delete_args = argparse.Namespace(
+                email='rs*', batch=True, yes=True, refresh=False, concurrency=1, retry_failed=0, resume=None
+            )
+            # 删除到第 5 条时模拟 Ctrl-C
+            original_delete = CloudflareEmailManager.delete_routing_rule
+            calls = []
+
+            def interrupted_delete(manager, rule_id):
+                calls.append(rule_id)
+                if len(calls) == 5:
+                    raise KeyboardInterrupt
+                return original_delete(manager, rule_id)
+
+            CloudflareEmailManager.delete_routing_rule = interrupted_delete
+            try:
+                with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                    try:
+                        delete_email(delete_args)
+                        assert False, "应被中断"
+                    except KeyboardInterrupt:
+                        pass
+            finally:
+                CloudflareEmailManager.delete_routing_rule = original_delete
+            journals = os.listdir("temp_email_journals")
+            assert len(journals) == 1 and len(server.api.rules) == 6
+
+            before = server.api.request_count
+            delete_args.email, delete_args.batch = None, False
+            delete_args.resume = os.path.join("temp_email_journals", journals[0])
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                delete_email(delete_args)
+            assert server.api.request_count - before == 6, "继续删除时只删除剩余项，不重新列出"
+            assert not server.api.rules and not os.listdir("temp_email_journals")
+
+            # 日志不存在或不匹配时给出错误并退出，而不是抛出异常
+            with open("mismatched.jsonl", 'w', encoding='utf-8') as f:
+                f.write(json.dumps({"type": "plan", "command": "create", "state_key": "other"}) + "\n")
+            for path in ("missing.jsonl", "mismatched.jsonl"):
+                delete_args.resume = path
+                with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                    try:
+                        delete_email(delete_args)
+                        assert False, "无法读取的日志应退出"
+                    except SystemExit as e:
+                        assert e.code == 1
+            os.chdir(cwd)
+
+
+def test_resume_records_completed():
+    """并发创建时已完成、但还没按顺序输出的项目，中断后继续时也写入历史记录与过期索引"""
+    original_create = CloudflareEmailManager.create_routing_rule
+    finished = threading.Semaphore(0)
+
+    def slow_first_create(manager, email, *args, **kwargs):
+        if email == "rc0001@example.com":
+            # 等其余 7 个都创建完成后模拟 Ctrl-C
+            for _ in range(7):
+                finished.acquire()
+            raise KeyboardInterrupt
+        try:
+            return original_create(manager, email, *args, **kwargs)
+        finally:
+            finished.release()
+
+    cwd = os.getcwd()
+    with _mock_api() as server:
+        with tempfile.TemporaryDirectory() as tmp:
+            os.chdir(tmp)
+            create_args = argparse.Namespace(
+                prefix='rc', no_prefix=False, email=None, number=None, start=1, digits=4, count=8,
+                next=False, fill_gaps=False, to=None, description=None, output_dir=None, concurrency=4,
+                ttl=timedelta(hours=1), resume=None
+            )
+            CloudflareEmailManager.create_routing_rule = slow_first_create
+            try:
+                with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                    try:
+                        create_email(create_args)
+                        assert False, "应被中断"
+                    except KeyboardInterrupt:
+                        pass
+            finally:
+                CloudflareEmailManager.create_routing_rule = original_create
+            assert len(server.api.rules) == 7
+            journals = os.listdir("temp_email_journals")
+            assert len(journals) == 1, "有未记录的项目时应保留日志"
+
+            create_args.resume = os.path.join("temp_email_journals", journals[0])
+            with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                create_email(create_args)
+            assert len(server.api.rules) == 8 and not os.listdir("temp_email_journals")
+            with open("temp_emails.jsonl", encoding='utf-8') as f:
+                emails = sorted(json.loads(line)["email"] for line in f)
+            assert emails == [f"rc{n:04d}@example.com" for n in range(1, 9)], emails
+            with open("temp_email_expiry.json", encoding='utf-8') as f:
+                assert sum(len(entries) for entries in json.load(f).values()) == 8
+            os.chdir(cwd)
+
+
+def test_watch():
+    """--watch 只在第 1 页或总数变化时完整获取，只输出差异"""
+    with _mock_api() as server:
+        manager = CloudflareEmailManager()
+        manager.PER_PAGE = 5
+        for i in range(1, 13):
+            manager.create_routing_rule(manager.generate_numbered_email("wt", i))
+        other = CloudflareEmailManager()
+        counts = []
+
+        def step():
+            # 每次等待时记录请求数，并在服务器上制造一次变化
+            counts.append(server.api.request_count)
+            if len(counts) == 2:
+                other.create_routing_rule("wt0013@example.com")
+            elif len(counts) == 3:
+                rule = server.api.rules[0]
+                other.update_routing_rule(rule["tag"], other._retargeted_rule_data(rule, "new@example.com"))
+            elif len(counts) == 4:
+                other.delete_routing_rule(server.api.rules[-1]["tag"])
+            elif len(counts) == 5:
+                # 列表被截断（超过最大页数）时不比较，保留上一份快照
+                other.create_routing_rule("wt0014@example.com")
+                manager.MAX_PAGES = 2
+            elif len(counts) == 6:
+                manager.MAX_PAGES = CloudflareEmailManager.MAX_PAGES
+            elif len(counts) == 7:
+                raise KeyboardInterrupt
+
+        original_sleep = time.sleep
+        output = io.StringIO()
+        time.sleep = lambda seconds: step()
+        try:
+            with contextlib.redirect_stdout(output), contextlib.redirect_stderr(io.StringIO()):
+                watch_rules(manager, 1, 'jsonl')
+        finally:
+            time.sleep = original_sleep
+
+        events = [json.loads(line) for line in output.getvalue().splitlines()]
+        assert [e["event"] for e in events[:12]] == ["added"] * 12
+        assert [(e["event"], MockCloudflareAPI._rule_email(e["rule"])) for e in events[12:]] == [
+            ("added", "wt0013@example.com"),
+            ("changed", "wt0001@example.com"),
+            ("removed", "wt0013@example.com"),
+            ("added", "wt0014@example.com"),
+        ], events[12:]
+        assert events[13]["previous"]["actions"][0]["value"] == ["test@example.com"]
+        # 初次：探测第 1 页后只再获取第 2-3 页；无变化时只探测 1 次；
+        # 有变化时同样沿用探测到的第 1 页（另一客户端的创建 1 次 + 探测 1 次 + 第 2-3 页）
+        assert counts[0] == 12 + 3 and counts[1] - counts[0] == 1, counts
+        assert counts[2] - counts[1] == 1 + 1 + 2, counts
+
+
+def test_list_formats():
+    """list --format csv / jsonl 逐条输出规则，不输出提示信息与表格"""
+    with _mock_api() as server:
+        manager = CloudflareEmailManager()
+        manager.PER_PAGE = 2
+        for i in range(1, 4):
+            manager.create_routing_rule(manager.generate_numbered_email("ls", i), f"desc {i}")
+        rule = server.api.rules[1]
+        manager.update_routing_rule(rule["tag"], manager._retargeted_rule_data(rule, "other@example.com", enabled=False))
+        tags = {server.api._rule_email(rule): rule["tag"] for rule in server.api.rules}
+
+        outputs = {}
+        for output_format in ("csv", "jsonl"):
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                list_emails(argparse.Namespace(format=output_format, watch=False, verbose=False))
+            outputs[output_format] = output.getvalue()
+
+        rows = list(csv.reader(io.StringIO(outputs["csv"])))
+        assert rows[0] == ["email", "rule_id", "target", "enabled", "created", "name"], rows[0]
+        assert [row[:4] + [row[5]] for row in sorted(rows[1:])] == [
+            ["ls0001@example.com", tags["ls0001@example.com"], "test@example.com", "true", "desc 1"],
+            ["ls0002@example.com", tags["ls0002@example.com"], "other@example.com", "false", "desc 2"],
+            ["ls0003@example.com", tags["ls0003@example.com"], "test@example.com", "true", "desc 3"],
+        ], rows
+
+        records = [json.loads(line) for line in outputs["jsonl"].splitlines()]
+        assert sorted(record["matchers"][0]["value"] for record in records) == sorted(tags)
+        assert {record["tag"] for record in records} == set(tags.values())
+
+        # 每一行都是数据，没有 📋 提示、表头分隔线或 "共找到" 汇总
+        for text in outputs.values():
+            assert not any(marker in text for marker in ("📋", "---", "共找到")), text
+
+
+def test_verify_destinations():
+    """未验证的转发目标在任何规则请求之前被拒绝；已验证地址缓存在本地，后续运行不再查询"""
+    verified = ["test@example.com", "ok@example.com"]
+    with _mock_api(verified_addresses=verified, env={'CLOUDFLARE_ACCOUNT_ID': 'test_account'}) as server:
+        with tempfile.TemporaryDirectory() as tmp:
+            os.environ['DESTINATION_CACHE_FILE'] = os.path.join(tmp, "destinations.json")
+            args = argparse.Namespace(
+                prefix='vd', no_prefix=False, email=None, number=None, start=1, digits=4, count=20,
+                to='bad@example.com', description=None, output_dir=None, concurrency=4, ttl=None
+            )
+            try:
+                create_email(args)
+                assert False, "未验证的目标应被拒绝"
+            except CloudflareAPIError as e:
+                assert "bad@example.com" in str(e)
+            assert server.api.request_count == 1 and not server.api.rules, "预检失败时不应发出规则请求"
+
+            # 新进程（新的管理器）命中磁盘缓存，不再查询目标地址
+            manager = CloudflareEmailManager()
+            manager.verify_destinations(["OK@example.com", "test@example.com"])
+            assert server.api.request_count == 1
+
+            # 缓存中没有的目标会重新获取一次，刚验证的地址不会被旧缓存误拒
+            server.api.verified_addresses.append("new@example.com")
+            manager.verify_destinations(["new@example.com"])
+            assert server.api.request_count == 2
+
+            # DESTINATION_CACHE_TTL=0 时不缓存，每次都查询并直接用查询结果判断
+            os.environ['DESTINATION_CACHE_TTL'] = '0'
+            manager = CloudflareEmailManager()
+            manager.verify_destinations(["ok@example.com"])
+            try:
+                manager.verify_destinations(["bad@example.com"])
+                assert False, "未验证的目标应被拒绝"
+            except CloudflareAPIError as e:
+                assert "bad@example.com" in str(e)
+            assert server.api.request_count == 4
+
+
+def test_benchmark_smoke():
+    """基准脚本能完整跑完所有命令"""
+    with tempfile.TemporaryDirectory() as tmp:
+        json_path = os.path.join(tmp, "bench.json")
+        with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+            exit_code = benchmark.main([
+                "--sizes", "12", "--concurrency", "1,4",
+                "--latency", "0", "--jitter", "0", "--json", json_path
+            ])
+        assert exit_code == 0
+        assert os.path.exists(json_path)
+    # 结束后恢复环境变量与传输层，不影响后续测试
+    assert 'CLOUDFLARE_API_BASE_URL' not in os.environ
+    assert os.environ['CLOUDFLARE_RATE_LIMIT'] == '0' and 'CLOUDFLARE_MAX_RATE' not in os.environ
+    assert temp_email.PooledHTTPTransport is not benchmark.TimingTransport
+
+
+if __name__ == "__main__":
+    try:
+        test_mock_server()
+        test_create_failure_summary()
+        test_cleanup_retry_failed()
+        test_sync()
+        test_retarget()
+        test_multi_zone()
+        test_fill_gaps()
+        test_resume()
+        test_resume_records_completed()
+        test_watch()
+        test_list_formats()
+        test_verify_destinations()
+        test_benchmark_smoke()
+        print("✅ 所有测试通过！")
+    except AssertionError as e:
+        print(f"❌ 测试失败: {e}")
+        sys.exit(1)
@@ -13,7 +13,7 @@ os.environ['CLOUDFLARE_ZONE_ID'] = 'test_zone_id'
 os.environ['FORWARD_TO_EMAIL'] = 'test@example.com'
 os.environ['EMAIL_DOMAIN'] = 'example.com'
 
-from temp_email import CloudflareEmailManager
+from temp_email import CloudflareEmailManager, allocate_numbers, numbers_in_use
 
 def test_numbered_emails():
     """测试编号邮箱生成功能"""
@@ -94,9 +94,56 @@ def test_numbered_emails():
     print("  # 生成: ul0001 到 ul0010")
     print()
 
+
+def test_auto_numbering():
+    """测试 --next / --fill-gaps 的编号分配"""
+    existing = [
+        "ul0001@example.com", "ul0002@example.com", "ul0005@example.com",
+        "ul007@example.com",     # 位数不同，不计入
+        "ul10000@example.com",   # 超过 4 位，不计入
+        "UL0009@other.com",      # 大小写与域名不影响
+        "ulx0003@example.com",
+    ]
+    used = numbers_in_use(existing, "ul", 4)
+    assert used == [1, 2, 5, 9], used
+    assert numbers_in_use(existing, "ul", 3) == [7]
+
+    assert allocate_numbers(used, 3) == [10, 11, 12]
+    assert allocate_numbers(used, 2, start=20) == [20, 21]
+    assert allocate_numbers(used, 5, fill_gaps=True) == [3, 4, 6, 7, 8]
+    assert allocate_numbers(used, 2, start=5, fill_gaps=True) == [6, 7]
+    assert allocate_numbers([], 3, start=5, fill_gaps=True) == [5, 6, 7]
+
+    # 编号空间受 --digits 限制
+    assert allocate_numbers([7, 8], 7, fill_gaps=True, digits=1) == [1, 2, 3, 4, 5, 6, 9]
+    for kwargs in ({"fill_gaps": True}, {"fill_gaps": False}):
+        try:
+            allocate_numbers([7, 8], 8, digits=1, **kwargs)
+            assert False, "编号不足时应抛出 ValueError"
+        except ValueError:
+            pass
+    print("✅ 自动编号分配测试通过")
+
+
+def test_unique_emails_case():
+    """批量随机地址与已有地址比较时不区分大小写"""
+    manager = CloudflareEmailManager()
+    candidates = iter(["Tm-abcdefgh@example.com", "tm-ABCDEFGH@example.com", "Tm-ijklmnop@example.com"])
+    manager.generate_random_email = lambda prefix=None: next(candidates)
+    emails = manager.generate_unique_emails(1, "Tm", ["TM-ABCDEFGH@EXAMPLE.COM"])
+    assert emails == ["Tm-ijklmnop@example.com"], emails
+
+    candidates = iter(["Tm-abcdefgh@example.com", "tm-ABCDEFGH@example.com", "Tm-ijklmnop@example.com"])
+    emails = manager.generate_unique_emails(2, "Tm")
+    assert emails == ["Tm-abcdefgh@example.com", "Tm-ijklmnop@example.com"], emails
+    print("✅ 随机地址去重测试通过")
+
+
 if __name__ == "__main__":
     try:
         test_numbered_emails()
+        test_auto_numbering()
+        test_unique_emails_case()
     except AssertionError as e:
         print(f"❌ 测试失败: {e}")
         sys.exit(1)
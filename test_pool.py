@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+测试预先创建的地址池
+租用/回收的并发安全只测试本地状态文件；回收改名通过本地模拟服务器验证，不会访问外网
+"""
+
+import sys
+import os
+import argparse
+import tempfile
+import threading
+import contextlib
+
+# 设置环境变量以通过初始化检查
+os.environ['CLOUDFLARE_API_TOKEN'] = 'test_token'
+os.environ['CLOUDFLARE_ZONE_ID'] = 'test_zone_id'
+os.environ['FORWARD_TO_EMAIL'] = 'test@example.com'
+os.environ['EMAIL_DOMAIN'] = 'example.com'
+os.environ['RULE_CACHE_TTL'] = '0'
+os.environ['CLOUDFLARE_RATE_LIMIT'] = '0'
+
+from temp_email import AddressPool, pool_command
+from mock_cloudflare_api import start_mock_server
+
+
+def test_concurrent_lease():
+    """多个实例同时租用，每个地址只会被租出一次"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "pool.json")
+        pool = AddressPool("z", path)
+        pool.configure(size=40)
+        for i in range(40):
+            pool.add_ready({"email": f"p{i:02d}@example.com", "tag": f"t{i}"})
+
+        leased = []
+        lock = threading.Lock()
+
+        def worker():
+            # 每个线程使用独立实例（独立的锁文件句柄），模拟多个进程
+            local = AddressPool("z", path)
+            while True:
+                entry = local.lease("test@example.com")
+                if entry is None:
+                    return
+                with lock:
+                    leased.append(entry["email"])
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert sorted(leased) == [f"p{i:02d}@example.com" for i in range(40)], leased
+        state = pool.status()
+        assert not state["ready"] and len(state["leased"]) == 40
+        assert pool.claim_fill() and not pool.claim_fill(), "补充标记应只被领取一次"
+        assert AddressPool("other", path).status()["ready"] == [], "不同 zone 的状态互不影响"
+
+
+def test_fill_lease_release():
+    """fill 预先创建规则，lease 不发请求，release 用 PUT 改名而不是删除再创建"""
+    server = start_mock_server()
+    os.environ['CLOUDFLARE_API_BASE_URL'] = server.url
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            os.environ['ADDRESS_POOL_FILE'] = os.path.join(tmp, "pool.json")
+            cwd = os.getcwd()
+            os.chdir(tmp)
+            try:
+                with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull):
+                    # 后台补充正在进行时，手动 fill 不再重复创建；结束后清除补充标记
+                    pool = AddressPool('test_zone_id')
+                    pool.configure(size=3)
+                    assert pool.claim_fill()
+                    pool_command(argparse.Namespace(pool_action='fill', size=3, prefix='sg', concurrency=4))
+                    assert not server.api.rules
+                    pool.release_fill()
+
+                    pool_command(argparse.Namespace(pool_action='fill', size=3, prefix='sg', concurrency=4))
+                    assert len(server.api.rules) == 3
+                    assert "filling_since" not in pool.status()
+
+                    before = server.api.request_count
+                    pool_command(argparse.Namespace(pool_action='lease', to=None, quiet=True, no_refill=True))
+                    assert server.api.request_count == before, "lease 不应发出请求"
+
+                    (email, entry), = pool.status()["leased"].items()
+                    pool_command(argparse.Namespace(pool_action='release', email=email, keep_address=False))
+
+                    # 转发到其他目标的租用与保留地址的回收都用 PUT，不应清空规则名称
+                    pool_command(argparse.Namespace(pool_action='lease', to='other@example.com', quiet=True, no_refill=True))
+                    (kept, _), = pool.status()["leased"].items()
+                    pool_command(argparse.Namespace(pool_action='release', email=kept, keep_address=True))
+            finally:
+                os.chdir(cwd)
+                del os.environ['ADDRESS_POOL_FILE']
+
+        emails = {server.api._rule_email(rule) for rule in server.api.rules}
+        assert len(server.api.rules) == 3, "回收不应删除或新建规则"
+        assert email not in emails, "回收后旧地址应失效"
+        assert entry["tag"] in {rule["tag"] for rule in server.api.rules}
+        assert all(rule["name"].startswith("Pool email") for rule in server.api.rules), \
+            [rule["name"] for rule in server.api.rules]
+    finally:
+        del os.environ['CLOUDFLARE_API_BASE_URL']
+        server.shutdown()
+        server.server_close()
+
+
+if __name__ == "__main__":
+    try:
+        test_concurrent_lease()
+        test_fill_lease_release()
+        print("✅ 所有测试通过！")
+    except AssertionError as e:
+        print(f"❌ 测试失败: {e}")
+        sys.exit(1)
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+测试本地路由规则快照
+这个测试脚本不会实际调用 API，只测试快照的读写与查找逻辑
+"""
+
+import sys
+import os
+import tempfile
+
+# 设置环境变量以通过初始化检查
+os.environ['CLOUDFLARE_API_TOKEN'] = 'test_token'
+os.environ['CLOUDFLARE_ZONE_ID'] = 'test_zone_id'
+os.environ['FORWARD_TO_EMAIL'] = 'test@example.com'
+os.environ['EMAIL_DOMAIN'] = 'example.com'
+
+from temp_email import CloudflareEmailManager, RuleIndex
+
+
+def _rule(email, tag):
+    return {
+        "tag": tag,
+        "name": f"Temp email: {email}",
+        "enabled": True,
+        "created": "2024-01-01T00:00:00Z",
+        "matchers": [{"type": "literal", "field": "to", "value": email}],
+        "actions": [{"type": "forward", "value": ["test@example.com"]}],
+    }
+
+
+def test_rule_index():
+    """快照命中时不访问 API，创建/删除会同步更新，并能跨实例持久化"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "rules.json")
+
+        index = RuleIndex(path, "test_zone_id", ttl=60)
+        assert not index.is_fresh()
+        index.replace([_rule("a@example.com", "t1"), _rule("b@example.com", "t2")])
+        index.add(_rule("c@example.com", "t3"))
+        index.remove_tag("t2")
+        index.flush()
+
+        # 新实例从磁盘加载
+        index = RuleIndex(path, "test_zone_id", ttl=60)
+        assert index.is_fresh()
+        assert index.get("a@example.com")["tag"] == "t1"
+        assert index.get("b@example.com") is None
+        assert index.get("c@example.com")["target"] == "test@example.com"
+
+        # 其他 zone 的快照不会被使用
+        assert not RuleIndex(path, "other_zone", ttl=60).is_fresh()
+
+        # find_rule_by_email 命中快照时不发起请求
+        manager = CloudflareEmailManager()
+        manager.rule_index = index
+        manager._make_request = lambda *a, **kw: (_ for _ in ()).throw(AssertionError("不应访问 API"))
+        rule = manager.find_rule_by_email("c@example.com")
+        assert rule["tag"] == "t3"
+        assert RuleIndex.rule_email(rule) == "c@example.com"
+        # 从磁盘载入的快照未命中时回退到 API（规则可能由其他进程创建）
+        manager.list_routing_rules = lambda verbose=False: [_rule("e@example.com", "t5")]
+        assert manager.find_rule_by_email("e@example.com")["tag"] == "t5"
+        # 本进程完整列出的快照在有效期内未命中即视为不存在，不再发起请求
+        index.replace([_rule("a@example.com", "t1")])
+        manager.list_routing_rules = lambda verbose=False: (_ for _ in ()).throw(AssertionError("不应访问 API"))
+        assert manager.find_rule_by_email("missing@example.com") is None
+
+        # 同一快照文件只注册一次退出写回，退出时写回该文件的全部实例
+        registered = RuleIndex._exit_flush[index.path]
+        other = RuleIndex(path, "test_zone_id", ttl=60)
+        assert RuleIndex._exit_flush[index.path] is registered and other in registered
+        other.add(_rule("d@example.com", "t4"))
+        RuleIndex._flush_at_exit(index.path)
+        assert RuleIndex(path, "test_zone_id", ttl=60).get("d@example.com")["tag"] == "t4"
+
+
+def test_flush_merges():
+    """多个进程载入同一快照后各自创建/删除并写回，彼此的修改都会保留"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "rules.json")
+        index = RuleIndex(path, "test_zone_id", ttl=60)
+        index.replace([_rule("a@example.com", "t1"), _rule("b@example.com", "t2")])
+        index.flush()
+
+        first = RuleIndex(path, "test_zone_id", ttl=60)
+        second = RuleIndex(path, "test_zone_id", ttl=60)
+        first.add(_rule("aaa@example.com", "t3"))
+        first.flush()
+        second.add(_rule("bbb@example.com", "t4"))
+        second.remove_tag("t1")
+        second.flush()
+
+        merged = RuleIndex(path, "test_zone_id", ttl=60)
+        assert sorted(merged.emails()) == ["aaa@example.com", "b@example.com", "bbb@example.com"]
+        assert second.get("aaa@example.com")["tag"] == "t3"
+
+        # 本进程重新列出的快照比磁盘上的新时以列出结果为准
+        first.replace([_rule("c@example.com", "t5")])
+        first.flush()
+        assert RuleIndex(path, "test_zone_id", ttl=60).emails() == ["c@example.com"]
+
+
+if __name__ == "__main__":
+    try:
+        test_rule_index()
+        test_flush_merges()
+        print("✅ 所有测试通过！")
+    except AssertionError as e:
+        print(f"❌ 测试失败: {e}")
+        sys.exit(1)
@@ -0,0 +1,233 @@
+#!/usr/bin/env python3
+"""
+测试 serve 常驻服务
+上游使用本地模拟服务器，不会访问外网
+"""
+
+import sys
+import os
+import io
+import json
+import time
+import argparse
+import tempfile
+import contextlib
+import threading
+import http.client
+from concurrent.futures import ThreadPoolExecutor
+
+# 设置环境变量以通过初始化检查
+os.environ['CLOUDFLARE_API_TOKEN'] = 'test_token'
+os.environ['CLOUDFLARE_ZONE_ID'] = 'test_zone_id'
+os.environ['FORWARD_TO_EMAIL'] = 'test@example.com'
+os.environ['EMAIL_DOMAIN'] = 'example.com'
+os.environ['RULE_CACHE_TTL'] = '0'
+os.environ['CLOUDFLARE_RATE_LIMIT'] = '0'
+
+from temp_email import CloudflareEmailManager, EmailService, ServeRequestHandler, SingleFlight, exec_command
+from http.server import ThreadingHTTPServer
+from mock_cloudflare_api import start_mock_server
+
+
+def _call(port, method, path, body=None):
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=10)
+    try:
+        conn.request(method, path, body=json.dumps(body) if body is not None else None)
+        response = conn.getresponse()
+        return response.status, json.loads(response.read())
+    finally:
+        conn.close()
+
+
+def test_single_flight():
+    """同一 key 的并发调用只执行一次"""
+    flight = SingleFlight()
+    calls = []
+    gate = threading.Event()
+
+    def slow():
+        calls.append(1)
+        gate.wait(5)
+        return "done"
+
+    with ThreadPoolExecutor(8) as executor:
+        futures = [executor.submit(flight.do, "k", slow) for _ in range(8)]
+        while not calls:
+            pass
+        gate.set()
+        assert [f.result() for f in futures] == ["done"] * 8
+    assert len(calls) == 1, f"期望执行 1 次，实际 {len(calls)} 次"
+    assert flight.do("k", lambda: "again") == "again"
+
+
+def test_serve_endpoints():
+    """快照新鲜时读操作不发请求；过期时并发查找合并为一次列出"""
+    upstream = start_mock_server(latency=0.05)
+    os.environ['CLOUDFLARE_API_BASE_URL'] = upstream.url
+
+    manager = CloudflareEmailManager()
+    manager.rule_index.ttl = 300
+    server = ThreadingHTTPServer(("127.0.0.1", 0), ServeRequestHandler)
+    server.daemon_threads = True
+    server.service = EmailService(manager)
+    server.service.history.add = lambda *args, **kwargs: None
+    server.verbose = False
+    port = server.server_address[1]
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    try:
+        # 首次创建：列出一次建立快照 + 1 个 POST
+        before = upstream.api.request_count
+        status, body = _call(port, "POST", "/rules", {"email": "sv0001"})
+        assert status == 201 and body["result"]["matchers"][0]["value"] == "sv0001@example.com"
+        assert upstream.api.request_count - before == 2, f"期望 2 次请求，实际 {upstream.api.request_count - before} 次"
+        status, _ = _call(port, "POST", "/rules", {"email": "sv0001"})
+        assert status == 409
+
+        # 快照新鲜时未命中即视为不存在：创建只发 1 个 POST，查找不存在的地址不发请求
+        before = upstream.api.request_count
+        assert _call(port, "POST", "/rules", {"email": "sv0002"})[0] == 201
+        assert upstream.api.request_count - before == 1, f"期望 1 次请求，实际 {upstream.api.request_count - before} 次"
+        assert _call(port, "GET", "/rules/sv9999")[0] == 404
+        assert upstream.api.request_count - before == 1
+
+        before = upstream.api.request_count
+        status, body = _call(port, "GET", "/rules/sv0001")
+        assert status == 200 and body["result"]["tag"]
+        assert _call(port, "GET", "/rules?pattern=sv*")[1]["result"][0]["tag"] == body["result"]["tag"]
+        assert upstream.api.request_count == before, "快照新鲜时读操作不应发请求"
+
+        # 快照过期后 8 个并发查找只列出一次
+        manager.rule_index._updated_at = 0
+        before = upstream.api.request_count
+        with ThreadPoolExecutor(8) as executor:
+            results = list(executor.map(lambda _: _call(port, "GET", "/rules/sv0001")[0], range(8)))
+        assert results == [200] * 8
+        assert upstream.api.request_count - before == 1, f"期望 1 次请求，实际 {upstream.api.request_count - before} 次"
+
+        # 同一地址的并发删除只发一次 DELETE
+        before = upstream.api.request_count
+        with ThreadPoolExecutor(4) as executor:
+            statuses = sorted(executor.map(lambda _: _call(port, "DELETE", "/rules/sv0001")[0], range(4)))
+        assert statuses[0] == 200 and set(statuses) <= {200, 404}
+        assert upstream.api.request_count - before == 1
+        assert _call(port, "GET", "/rules/sv0001")[0] == 404
+        assert _call(port, "GET", "/health")[1]["result"]["status"] == "ok"
+    finally:
+        # 不把快照写回磁盘
+        manager.rule_index.ttl = 0
+        del os.environ['CLOUDFLARE_API_BASE_URL']
+        server.shutdown()
+        server.server_close()
+        upstream.shutdown()
+        upstream.server_close()
+
+
+def test_exec_pipeline():
+    """exec 共享一次列出的快照，同一地址的操作保持顺序，结果按输入顺序输出"""
+    upstream = start_mock_server(latency=0.02)
+    os.environ['CLOUDFLARE_API_BASE_URL'] = upstream.url
+
+    operations = [
+        {"op": "create", "email": "px0001", "id": "first"},
+        {"op": "lookup", "email": "px0001"},
+        {"op": "delete", "email": "px0001"},
+        {"op": "lookup", "email": "px0001"},
+    ] + [{"op": "create", "email": f"px{i:04d}"} for i in range(2, 10)] + [
+        {"op": "delete_batch", "pattern": "px*"},
+        {"op": "list"},
+        {"op": "bogus"},
+    ]
+
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            source = os.path.join(tmp, "ops.jsonl")
+            with open(source, 'w', encoding='utf-8') as f:
+                f.write("\n".join(json.dumps(op) for op in operations) + "\nnot json\n" + '{"op": "lookup", "email": 5}\n')
+
+            cwd = os.getcwd()
+            os.chdir(tmp)
+            output = io.StringIO()
+            try:
+                with contextlib.redirect_stdout(output):
+                    exec_command(argparse.Namespace(source=source, concurrency=8))
+                assert False, "有失败的操作时应以 1 退出"
+            except SystemExit as e:
+                assert e.code == 1
+            finally:
+                os.chdir(cwd)
+
+        results = [json.loads(line) for line in output.getvalue().splitlines()]
+        assert [r["line"] for r in results] == list(range(1, len(operations) + 3))
+        assert results[0]["id"] == "first" and results[0]["success"]
+        assert results[1]["success"] and not results[3]["success"], "同一地址的操作应按输入顺序执行"
+        assert len(results[12]["result"]["deleted"]) == 8
+        assert results[13]["result"] == []
+        assert not results[14]["success"] and not results[15]["success"]
+        # 字段类型错误只让该行失败，不中断整个流水线
+        assert not results[16]["success"] and "email" in results[16]["error"]
+
+        # 1 次列出 + 9 次创建 + 9 次删除
+        assert upstream.api.request_count == 19, f"期望 19 次请求，实际 {upstream.api.request_count} 次"
+    finally:
+        del os.environ['CLOUDFLARE_API_BASE_URL']
+        upstream.shutdown()
+        upstream.server_close()
+
+
+def test_exec_stale_snapshot():
+    """磁盘上的快照过期时，exec 开始时重新列出，不把过期快照当作有效"""
+    upstream = start_mock_server()
+    os.environ['CLOUDFLARE_API_BASE_URL'] = upstream.url
+
+    try:
+        rule = CloudflareEmailManager().create_routing_rule("px0001@example.com")
+        with tempfile.TemporaryDirectory() as tmp:
+            cache = os.path.join(tmp, "rules.json")
+            with open(cache, 'w', encoding='utf-8') as f:
+                # 快照中的 px0002 早已在别处删除，px0001 是之后才创建的
+                stale = {"px0002@example.com": {"tag": "gone", "target": "test@example.com"}}
+                json.dump({"zone_id": "test_zone_id", "updated_at": time.time() - 3 * 86400, "rules": stale}, f)
+            source = os.path.join(tmp, "ops.jsonl")
+            with open(source, 'w', encoding='utf-8') as f:
+                f.write('{"op": "lookup", "email": "px0002"}\n'
+                        '{"op": "lookup", "email": "px0001"}\n{"op": "delete", "email": "px0001"}\n')
+
+            cwd = os.getcwd()
+            os.chdir(tmp)
+            os.environ['RULE_CACHE_TTL'] = '300'
+            os.environ['RULE_CACHE_FILE'] = cache
+            before = upstream.api.request_count
+            output = io.StringIO()
+            try:
+                with contextlib.redirect_stdout(output):
+                    exec_command(argparse.Namespace(source=source, concurrency=2))
+                assert False, "有失败的操作时应以 1 退出"
+            except SystemExit as e:
+                assert e.code == 1
+            finally:
+                os.environ['RULE_CACHE_TTL'] = '0'
+                del os.environ['RULE_CACHE_FILE']
+                os.chdir(cwd)
+
+        results = [json.loads(line) for line in output.getvalue().splitlines()]
+        assert [r["success"] for r in results] == [False, True, True], results
+        assert results[1]["result"]["tag"] == rule["tag"]
+        # 1 次列出 + 1 次删除
+        assert upstream.api.request_count - before == 2, f"期望 2 次请求，实际 {upstream.api.request_count - before} 次"
+    finally:
+        del os.environ['CLOUDFLARE_API_BASE_URL']
+        upstream.shutdown()
+        upstream.server_close()
+
+
+if __name__ == "__main__":
+    try:
+        test_single_flight()
+        test_serve_endpoints()
+        test_exec_pipeline()
+        test_exec_stale_snapshot()
+        print("✅ 所有测试通过！")
+    except AssertionError as e:
+        print(f"❌ 测试失败: {e}")
+        sys.exit(1)
@@ -0,0 +1,252 @@
+#!/usr/bin/env python3
+"""
+测试持久连接池传输层
+在本地启动一个 HTTP 服务器代替 Cloudflare API，不会访问外网
+"""
+
+import sys
+import os
+import gzip
+import asyncio
+import json
+import time
+import tempfile
+import threading
+import subprocess
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 设置环境变量以通过初始化检查
+os.environ['CLOUDFLARE_API_TOKEN'] = 'test_token'
+os.environ['CLOUDFLARE_ZONE_ID'] = 'test_zone_id'
+os.environ['FORWARD_TO_EMAIL'] = 'test@example.com'
+os.environ['EMAIL_DOMAIN'] = 'example.com'
+os.environ['RULE_CACHE_TTL'] = '0'
+os.environ['CLOUDFLARE_RATE_LIMIT'] = '0'
+
+from temp_email import (
+    AdaptiveRateLimiter, CloudflareEmailManager, FileLock, PooledHTTPTransport, RequestMetrics, SharedRateBudget,
+    parse_retry_after, run_concurrently
+)
+
+
+class _Handler(BaseHTTPRequestHandler):
+    """对任意请求返回 gzip 压缩的成功响应，并记录连接数"""
+
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    connections = set()
+    throttled = 0  # 接下来要返回 429 的请求数
+
+    def _reply(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        if length:
+            self.rfile.read(length)
+        _Handler.connections.add(self.client_address)
+        if _Handler.throttled > 0:
+            _Handler.throttled -= 1
+            self.send_response(429)
+            self.send_header("Retry-After", "0")
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        payload = json.dumps({"success": True, "result": {"tag": "abc", "path": self.path}}).encode()
+        if "gzip" in (self.headers.get("Accept-Encoding") or ""):
+            payload = gzip.compress(payload)
+            self.send_response(200)
+            self.send_header("Content-Encoding", "gzip")
+        else:
+            self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    do_GET = do_POST = do_DELETE = _reply
+
+    def log_message(self, *args):
+        pass
+
+
+def _start_server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), _Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    os.environ['CLOUDFLARE_API_BASE_URL'] = f"http://127.0.0.1:{server.server_address[1]}/client/v4"
+    _Handler.connections.clear()
+    _Handler.throttled = 0
+    return server
+
+
+def test_connection_reuse():
+    """多次请求应复用同一条连接，并正确解码 gzip 响应"""
+    server = _start_server()
+
+    try:
+        manager = CloudflareEmailManager(transport=PooledHTTPTransport(pool_size=2))
+        for i in range(5):
+            response = manager._make_request(f"/zones/z/email/routing/rules?page={i}")
+            assert response["result"]["path"] == f"/client/v4/zones/z/email/routing/rules?page={i}"
+        rule = manager.create_routing_rule("a@example.com")
+        assert rule["tag"] == "abc"
+        assert manager.delete_routing_rule("abc")
+        assert len(_Handler.connections) == 1, f"期望 1 条连接，实际 {len(_Handler.connections)} 条"
+        manager.transport.close()
+    finally:
+        del os.environ['CLOUDFLARE_API_BASE_URL']
+        server.shutdown()
+        server.server_close()
+
+
+def test_rate_limit_retry():
+    """429 会按 Retry-After 重试（POST 也一样），并让限速器减速"""
+    server = _start_server()
+
+    try:
+        manager = CloudflareEmailManager()
+        manager.rate_limiter = AdaptiveRateLimiter(rate=100, max_rate=100, min_rate=1)
+        _Handler.throttled = 2
+        rule = manager.create_routing_rule("a@example.com")
+        assert rule["tag"] == "abc"
+        assert _Handler.throttled == 0
+        assert manager.rate_limiter.rate < 100, f"429 后应降速，当前 {manager.rate_limiter.rate}"
+        manager.transport.close()
+    finally:
+        del os.environ['CLOUDFLARE_API_BASE_URL']
+        server.shutdown()
+        server.server_close()
+
+    assert parse_retry_after("3") == 3.0
+    assert parse_retry_after("bogus") is None
+
+
+def test_request_metrics():
+    """按端点模板记录请求数、重试与字节数"""
+    server = _start_server()
+
+    try:
+        manager = CloudflareEmailManager()
+        manager.metrics = RequestMetrics()
+        _Handler.throttled = 1
+        manager.delete_routing_rule("0123456789abcdef")
+        manager.create_routing_rule("a@example.com")
+
+        endpoints = manager.metrics.snapshot()["endpoints"]
+        delete = endpoints["DELETE /zones/{zone_id}/email/routing/rules/{rule_id}"]
+        assert delete["requests"] == 2 and delete["retries"] == 1
+        assert delete["status"] == {"429": 1, "200": 1}
+        create = endpoints["POST /zones/{zone_id}/email/routing/rules"]
+        assert create["bytes_sent"] > 0
+        # 收到的字节数按解压前的线上长度统计
+        path = f"/client/v4/zones/{manager.zone_id}/email/routing/rules"
+        payload = json.dumps({"success": True, "result": {"tag": "abc", "path": path}}).encode()
+        assert create["bytes_received"] == len(gzip.compress(payload))
+        assert 'le="+Inf"} 2' in manager.metrics.to_prometheus()
+        manager.transport.close()
+    finally:
+        del os.environ['CLOUDFLARE_API_BASE_URL']
+        server.shutdown()
+        server.server_close()
+
+
+def test_shared_rate_budget():
+    """多个进程共用同一个预算文件时，总速率不超过上限；429 暂停对所有进程生效"""
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "budget.json")
+        # 每个进程只预约、不等待，输出各自预约到的时隙（墙上时间），与进程启动快慢无关
+        script = (
+            "import sys; sys.path.insert(0, sys.argv[1]); from temp_email import SharedRateBudget; import time\n"
+            "budget = SharedRateBudget(20, path=sys.argv[2])\n"
+            "for _ in range(10):\n"
+            "    wait = budget.reserve()\n"
+            "    print(time.time() + wait)\n"
+        )
+        here = os.path.dirname(os.path.abspath(__file__))
+        workers = [
+            subprocess.Popen([sys.executable, "-c", script, here, path], stdout=subprocess.PIPE, text=True)
+            for _ in range(3)
+        ]
+        slots = sorted(float(line) for worker in workers for line in worker.communicate(timeout=30)[0].split())
+        assert all(worker.returncode == 0 for worker in workers) and len(slots) == 30
+        # 突发 2 个、之后 20 req/s：任意 k+1 个相邻时隙至少相隔 (k-1)/20 秒
+        interval = 1 / 20
+        for i in range(len(slots)):
+            for k in range(2, len(slots) - i):
+                span = slots[i + k] - slots[i]
+                assert span >= (k - 1) * interval - 0.01, f"总速率超过上限: 第 {i}-{i + k} 个时隙只相隔 {span:.3f}s"
+
+        # 上面预约的时隙还在未来，暂停用另一个预算文件测试
+        path = os.path.join(tmp, "paused.json")
+        limiter = AdaptiveRateLimiter(rate=0, shared=SharedRateBudget(1000, path=path))
+        limiter.on_throttle(0.3)
+        other = SharedRateBudget(1000, path=path)
+        assert 0.2 < other.reserve() <= 0.3, "暂停应同步给共享同一预算的其他进程"
+
+        # 其他进程持有预算文件锁时，acquire_async 只挂起当前协程，事件循环照常运行
+        limiter = AdaptiveRateLimiter(rate=0, shared=SharedRateBudget(1000, path=os.path.join(tmp, "async.json")))
+        lock = FileLock(limiter.shared.path)
+        lock.__enter__()
+        threading.Timer(0.5, lock.__exit__, (None, None, None)).start()
+        ticks = []
+
+        async def scenario():
+            task = asyncio.ensure_future(limiter.acquire_async())
+            for _ in range(10):
+                ticks.append(time.monotonic())
+                await asyncio.sleep(0.02)
+            assert not task.done()
+            await task
+
+        asyncio.run(scenario())
+        gaps = [b - a for a, b in zip(ticks, ticks[1:])]
+        assert max(gaps) < 0.2, f"等待文件锁时阻塞了事件循环: {max(gaps):.2f}s"
+
+
+def test_run_concurrently():
+    """ordered=True 按输入顺序产出，ordered=False 按完成顺序产出；单个失败只影响该项"""
+    delays = {"a": 0.15, "b": 0.05, "c": 0.1, "d": 0.0}
+
+    def work(item):
+        time.sleep(delays[item])
+        if item == "c":
+            raise ValueError("boom")
+        return item.upper()
+
+    for concurrency in (1, 4):
+        results = list(run_concurrently(work, "abcd", concurrency))
+        assert [item for item, _, _ in results] == list("abcd")
+        assert [result for _, result, _ in results] == ["A", "B", None, "D"]
+        errors = [error for _, _, error in results]
+        assert isinstance(errors[2], ValueError) and errors[:2] == [None, None] and errors[3] is None
+
+    results = list(run_concurrently(work, "abcd", 4, ordered=False))
+    assert [item for item, _, _ in results] == list("dbca"), results
+    assert [item for item, _, error in results if error is not None] == ["c"]
+
+    # 并发时同时在途的任务数不超过 concurrency
+    active = []
+    peak = []
+    lock = threading.Lock()
+
+    def track(item):
+        with lock:
+            active.append(item)
+            peak.append(len(active))
+        time.sleep(0.01)
+        with lock:
+            active.remove(item)
+        return item
+
+    assert [item for item, _, _ in run_concurrently(track, range(20), 3)] == list(range(20))
+    assert max(peak) <= 3
+
+
+if __name__ == "__main__":
+    try:
+        test_connection_reuse()
+        test_rate_limit_retry()
+        test_request_metrics()
+        test_shared_rate_budget()
+        test_run_concurrently()
+        print("✅ 所有测试通过！")
+    except AssertionError as e:
+        print(f"❌ 测试失败: {e}")
+        sys.exit(1)